@@ -18,12 +18,16 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 from six.moves import cPickle as pickle
 
+import copy
 import os
 import logging
 import time
 
 log = logging.getLogger('custodian.cache')
 
+# Process wide caches, cleared together by reset_shared_caches.
+_shared_caches = []
+
 
 def factory(config):
     if not config:
@@ -39,6 +43,26 @@ def factory(config):
     return FileCacheManager(config)
 
 
+def related_factory(config):
+    """Cache for related resource lookups, enabled via related_cache_period.
+    """
+    return RelatedResourceCache(
+        getattr(config, 'related_cache_period', None) or 0)
+
+
+def shared_cache(cache):
+    """Register a process wide cache, to be cleared by reset_shared_caches.
+    """
+    _shared_caches.append(cache)
+    return cache
+
+
+def reset_shared_caches():
+    """Clear values shared across the policies of a process."""
+    for cache in _shared_caches:
+        cache.clear()
+
+
 class NullCache(object):
 
     def __init__(self, config):
@@ -72,6 +96,86 @@ class InMemoryCache(object):
         self.data[pickle.dumps(key)] = data
 
 
+class RelatedResourceCache(object):
+    """Time bounded in process cache of resources by id.
+
+    Long lived processes, like a warm lambda container, repeatedly look
+    up the same handful of related resources (subnets, security groups)
+    for filters. As those rarely change, we keep them for a few minutes.
+
+    Resources are copied in and out of the cache, so changes a caller
+    makes to them aren't seen by later invocations.
+    """
+
+    __shared_state = {}
+
+    def __init__(self, period):
+        self.period = period * 60
+        self.data = self.__shared_state
+
+    def load(self):
+        return bool(self.period)
+
+    def get(self, key, ids):
+        """Return a mapping of id to resource for the unexpired ids found."""
+        if not self.period:
+            return {}
+        entries = self.data.get(pickle.dumps(key), {})
+        expired = time.time() - self.period
+        found = {}
+        for rid in ids:
+            entry = entries.get(rid)
+            if entry is not None and entry[0] > expired:
+                found[rid] = copy.deepcopy(entry[1])
+        return found
+
+    def save(self, key, resources, id_key):
+        if not self.period:
+            return
+        entries = self.data.setdefault(pickle.dumps(key), {})
+        now = time.time()
+        for r in resources:
+            entries[r[id_key]] = (now, copy.deepcopy(r))
+
+
+class SharedCache(object):
+    """Values shared by the policies of a process for an account region.
+
+    Entries are keyed by the account and region of the resource manager
+    they are looked up with, and expire after period seconds (never
+    when period is None). Without an account id nothing is shared, as
+    policies against different accounts would see each other's values.
+    """
+
+    def __init__(self, period=300):
+        self.period = period
+        self.data = {}
+        shared_cache(self)
+
+    def get_key(self, manager, key):
+        account_id = getattr(manager.config, 'account_id', None)
+        if account_id is None:
+            return None
+        return (account_id, getattr(manager.config, 'region', None), key)
+
+    def get(self, manager, key=None):
+        cache_key = self.get_key(manager, key)
+        entry = cache_key and self.data.get(cache_key)
+        if not entry:
+            return None
+        if self.period is not None and entry[0] < time.time() - self.period:
+            return None
+        return entry[1]
+
+    def save(self, manager, data, key=None):
+        cache_key = self.get_key(manager, key)
+        if cache_key:
+            self.data[cache_key] = (time.time(), data)
+
+    def clear(self):
+        self.data.clear()
+
+
 class FileCacheManager(object):
 
     def __init__(self, config):
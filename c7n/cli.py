@@ -293,6 +293,10 @@ def setup_parser():
         "-m", "--metrics-enabled",
         default=None, nargs="?", const="aws",
         help="Emit metrics to provider metrics")
+    run.add_argument(
+        "--s3-state", default=None,
+        help="Persist s3 bucket state to this file, and only refetch "
+        "changed buckets on subsequent runs")
 
     return parser
 
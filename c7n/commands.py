@@ -24,11 +24,13 @@ import pprint
 import sys
 import time
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import six
 import yaml
 
 from c7n.provider import clouds
-from c7n.policy import Policy, PolicyCollection, load as policy_load
+from c7n.policy import (
+    Policy, PolicyCollection, LambdaMode, load as policy_load)
 from c7n.reports import report as do_report
 from c7n.utils import dumps, load_file
 from c7n.config import Bag, Config
@@ -39,6 +41,9 @@ from c7n import schema
 
 log = logging.getLogger('custodian.commands')
 
+# Number of lambda policies provisioned concurrently by run
+PROVISION_WORKERS = 4
+
 
 def policy_command(f):
 
@@ -173,7 +178,6 @@ def validate(options):
         sys.exit(1)
 
     used_policy_names = set()
-    schm = schema.generate()
     errors = []
 
     for config_file in options.configs:
@@ -192,7 +196,7 @@ def validate(options):
                 log.error("The config file must end in .json, .yml or .yaml.")
                 raise ValueError("The config file must end in .json, .yml or .yaml.")
 
-        errors += schema.validate(data, schm)
+        errors += schema.validate(data)
         conf_policy_names = {
             p.get('name', 'unknown') for p in data.get('policies', ())}
         dupes = conf_policy_names.intersection(used_policy_names)
@@ -224,19 +228,39 @@ def validate(options):
         sys.exit(1)
 
 
+def _run_policy(options, policy):
+    try:
+        policy()
+    except Exception:
+        if options.debug:
+            raise
+        log.exception(
+            "Error while executing policy %s, continuing" % (
+                policy.name))
+        return 2
+    return 0
+
+
 @policy_command
 def run(options, policies):
     exit_code = 0
+
+    # Provisioning lambda policies is independent per policy and mostly
+    # waiting on api calls, so those are published concurrently.
+    provision = []
+    if not getattr(options, 'dryrun', False):
+        provision = [p for p in policies
+                     if isinstance(p.get_execution_mode(), LambdaMode)]
+    if provision:
+        with ThreadPoolExecutor(max_workers=PROVISION_WORKERS) as w:
+            futures = [w.submit(_run_policy, options, p) for p in provision]
+            for f in as_completed(futures):
+                exit_code = max(exit_code, f.result())
+
     for policy in policies:
-        try:
-            policy()
-        except Exception:
-            exit_code = 2
-            if options.debug:
-                raise
-            log.exception(
-                "Error while executing policy %s, continuing" % (
-                    policy.name))
+        if policy in provision:
+            continue
+        exit_code = max(exit_code, _run_policy(options, policy))
     if exit_code != 0:
         sys.exit(exit_code)
 
@@ -42,8 +42,6 @@ class ExecutionContext(object):
         else:
             self.output_path = self.output = None
 
-        if options.log_group:
-            self.cloudwatch_logs = CloudWatchLogOutput(self)
 
     @property
     def log_dir(self):
@@ -53,7 +51,9 @@ class ExecutionContext(object):
     def __enter__(self):
         if self.output:
             self.output.__enter__()
-        if self.cloudwatch_logs:
+        # log outputs are closed on exit, a new one is made per execution
+        if self.options.log_group:
+            self.cloudwatch_logs = CloudWatchLogOutput(self)
             self.cloudwatch_logs.__enter__()
         self.start_time = time.time()
         return self
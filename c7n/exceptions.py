@@ -49,6 +49,15 @@ class PolicyExecutionError(CustodianError):
     """
 
 
+class BatchEventsError(PolicyExecutionError):
+    """Some events of a batch failed to process.
+    """
+    def __init__(self, msg, events, resources):
+        super(BatchEventsError, self).__init__(msg)
+        self.events = events
+        self.resources = resources
+
+
 class ResourceLimitExceeded(PolicyExecutionError):
     """The policy would have affected more resources than its limit.
     """
@@ -25,7 +25,6 @@ import operator
 import re
 
 from dateutil.tz import tzutc
-from dateutil.parser import parse
 import jmespath
 import six
 
@@ -34,7 +33,8 @@ from c7n.exceptions import PolicyValidationError
 from c7n.executor import ThreadPoolExecutor
 from c7n.registry import PluginRegistry
 from c7n.resolver import ValuesFrom
-from c7n.utils import set_annotation, type_schema, parse_cidr
+from c7n.utils import (
+    set_annotation, type_schema, parse_cidr, CidrSet, parse_date, date_epoch)
 
 
 class FilterValidationError(Exception):
@@ -500,7 +500,7 @@ class ValueFilter(Filter):
             return value, sentinel
         elif self.vtype == 'age':
             if not isinstance(sentinel, datetime.datetime):
-                sentinel = datetime.datetime.now(tz=tzutc()) - timedelta(sentinel)
+                sentinel = self.get_date_sentinel(sentinel, -1)
             if isinstance(value, (str, int, float)):
                 try:
                     value = datetime.datetime.fromtimestamp(float(value)).replace(tzinfo=tzutc())
@@ -510,7 +510,7 @@ class ValueFilter(Filter):
                 # EMR bug when testing ages in EMR. This is due to
                 # EMR not having more functionality.
                 try:
-                    value = parse(value, default=datetime.datetime.now(tz=tzutc()))
+                    value = parse_date(value, default=datetime.datetime.now(tz=tzutc()))
                 except (AttributeError, TypeError, ValueError):
                     value = 0
             # Reverse the age comparison, we want to compare the value being
@@ -518,6 +518,12 @@ class ValueFilter(Filter):
             # comparisons is intuitively wrong.
             return value, sentinel
         elif self.vtype == 'cidr':
+            if isinstance(sentinel, (list, tuple, set)):
+                # match against many cidrs (ie. via value_from) by
+                # membership in a set built once per filter.
+                if getattr(self, 'cidr_set', None) is None:
+                    self.cidr_set = CidrSet(sentinel)
+                return self.cidr_set, value
             s = parse_cidr(sentinel)
             v = parse_cidr(value)
             if (isinstance(s, ipaddress._BaseAddress) and isinstance(v, ipaddress._BaseNetwork)):
@@ -533,17 +539,27 @@ class ValueFilter(Filter):
         # to events in the past which age filtering allows for.
         elif self.vtype == 'expiration':
             if not isinstance(sentinel, datetime.datetime):
-                sentinel = datetime.datetime.now(tz=tzutc()) + timedelta(sentinel)
+                sentinel = self.get_date_sentinel(sentinel, 1)
 
             if not isinstance(value, datetime.datetime):
                 try:
-                    value = parse(value, default=datetime.datetime.now(tz=tzutc()))
+                    value = parse_date(value, default=datetime.datetime.now(tz=tzutc()))
                 except (AttributeError, TypeError, ValueError):
                     value = 0
 
             return sentinel, value
         return sentinel, value
 
+    def get_date_sentinel(self, days, sign):
+        """Date the given days before (-1) or after (1) now, computed once
+        per filter rather than per resource.
+        """
+        key = (days, sign)
+        if getattr(self, 'date_sentinel', (None,))[0] != key:
+            self.date_sentinel = (key, datetime.datetime.now(
+                tz=tzutc()) + sign * timedelta(days))
+        return self.date_sentinel[1]
+
 
 class AgeFilter(Filter):
     """Automatically filter resources older than a given date.
@@ -562,32 +578,34 @@ class AgeFilter(Filter):
         return self
 
     def get_resource_date(self, i):
-        v = i[self.date_attribute]
-        if not isinstance(v, datetime.datetime):
-            v = parse(v)
+        v = parse_date(i[self.date_attribute])
         if not v.tzinfo:
             v = v.replace(tzinfo=tzutc())
         return v
 
+    def get_threshold_date(self):
+        if not self.threshold_date:
+            self.threshold_date = datetime.datetime.now(tz=tzutc()) - timedelta(
+                days=self.data.get('days', 0),
+                hours=self.data.get('hours', 0),
+                minutes=self.data.get('minutes', 0))
+        return self.threshold_date
+
+    def process(self, resources, event=None):
+        # Normalize resource dates to epoch seconds, and compare them
+        # against the threshold in a single pass.
+        op = OPERATORS[self.data.get('op', 'greater-than')]
+        threshold = date_epoch(self.get_threshold_date())
+        dates = [date_epoch(self.get_resource_date(r)) for r in resources]
+        return [r for r, d in zip(resources, dates)
+                if d is not None and op(threshold, d)]
+
     def __call__(self, i):
-        v = self.get_resource_date(i)
+        v = date_epoch(self.get_resource_date(i))
         if v is None:
             return False
         op = OPERATORS[self.data.get('op', 'greater-than')]
-
-        if not self.threshold_date:
-
-            days = self.data.get('days', 0)
-            hours = self.data.get('hours', 0)
-            minutes = self.data.get('minutes', 0)
-            # Work around placebo issues with tz
-            if v.tzinfo:
-                n = datetime.datetime.now(tz=tzutc())
-            else:
-                n = datetime.datetime.now()
-            self.threshold_date = n - timedelta(days=days, hours=hours, minutes=minutes)
-
-        return op(self.threshold_date, v)
+        return op(date_epoch(self.get_threshold_date()), v)
 
 
 class EventFilter(ValueFilter):
@@ -17,6 +17,7 @@ import importlib
 
 import jmespath
 
+from c7n.cache import related_factory
 from .core import ValueFilter
 
 
@@ -50,14 +51,24 @@ class RelatedResourceFilter(ValueFilter):
 
     def get_related(self, resources):
         resource_manager = self.get_resource_manager()
-        related_ids = self.get_related_ids(resources)
+        related_ids = set(self.get_related_ids(resources))
         model = resource_manager.get_model()
-        if len(related_ids) < self.FetchThreshold:
-            related = resource_manager.get_resources(list(related_ids))
+
+        related_cache = related_factory(self.manager.config)
+        cache_key = related_cache.load() and resource_manager.get_cache_key(None)
+        related = related_cache.get(cache_key, related_ids)
+        missing = related_ids.difference(related)
+
+        if not missing:
+            fetched = ()
+        elif len(missing) < self.FetchThreshold:
+            fetched = resource_manager.get_resources(list(missing))
         else:
-            related = resource_manager.resources()
-        return {r[model.id]: r for r in related
-                if r[model.id] in related_ids}
+            fetched = resource_manager.resources()
+        related_cache.save(cache_key, fetched, model.id)
+
+        related.update({r[model.id]: r for r in fetched})
+        return {rid: r for rid, r in related.items() if rid in related_ids}
 
     def get_resource_manager(self):
         mod_path, class_name = self.RelatedResource.rsplit('.', 1)
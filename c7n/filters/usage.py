@@ -0,0 +1,132 @@
+# Copyright 2018 Capital One Services, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Shared references between resources for used/unused filters.
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import threading
+
+from c7n.cache import SharedCache
+
+
+class UsageGraph(object):
+    """References between resources in an account and region.
+
+    Garbage collection filters (unused amis, security groups, launch
+    configs, ami snapshots) all need to know what references a given
+    resource. Rather than each filter enumerating instances, enis, asgs,
+    etc, they share a graph per account and region, whose reference
+    kinds are built on first use.
+
+    A reference kind maps a referenced resource id to the set of ids
+    of the resources referencing it, ie. for `instance-image`, image
+    id to instance ids.
+    """
+
+    _graphs = SharedCache()
+    _lock = threading.Lock()
+
+    def __init__(self, manager):
+        self.manager = manager
+        self.refs = {}
+        self.lock = threading.RLock()
+
+    @classmethod
+    def get(cls, manager):
+        with cls._lock:
+            graph = cls._graphs.get(manager)
+            if graph is None:
+                graph = cls(manager)
+                cls._graphs.save(manager, graph)
+        return graph
+
+    def references(self, kind):
+        """Return the mapping of referenced id to referencing ids for kind."""
+        with self.lock:
+            if kind not in self.refs:
+                self.refs[kind] = getattr(
+                    self, 'build_%s' % kind.replace('-', '_'))()
+            return self.refs[kind]
+
+    def resources(self, resource_type):
+        return self.manager.get_resource_manager(resource_type).resources()
+
+    @staticmethod
+    def add(refs, ref_id, rid):
+        refs.setdefault(ref_id, set()).add(rid)
+
+    def build_instance_image(self):
+        refs = {}
+        for i in self.resources('ec2'):
+            self.add(refs, i['ImageId'], i['InstanceId'])
+        return refs
+
+    def build_asg_launch_config(self):
+        refs = {}
+        for a in self.resources('asg'):
+            self.add(refs, a.get(
+                'LaunchConfigurationName', a['AutoScalingGroupName']),
+                a['AutoScalingGroupName'])
+        return refs
+
+    def build_asg_image(self):
+        """Images of launch configs that are in use by asgs."""
+        used = self.references('asg-launch-config')
+        refs = {}
+        for cfg in self.resources('launch-config'):
+            if cfg['LaunchConfigurationName'] in used:
+                self.add(refs, cfg['ImageId'], cfg['LaunchConfigurationName'])
+        return refs
+
+    def build_launch_config_sg(self):
+        refs = {}
+        for cfg in self.resources('launch-config'):
+            for g in cfg['SecurityGroups']:
+                self.add(refs, g, cfg['LaunchConfigurationName'])
+            for g in cfg['ClassicLinkVPCSecurityGroups']:
+                self.add(refs, g, cfg['LaunchConfigurationName'])
+        return refs
+
+    def build_lambda_sg(self):
+        refs = {}
+        for func in self.resources('lambda'):
+            if 'VpcConfig' not in func:
+                continue
+            for g in func['VpcConfig']['SecurityGroupIds']:
+                self.add(refs, g, func['FunctionName'])
+        return refs
+
+    def build_eni_sg(self):
+        refs = {}
+        for nic in self.resources('eni'):
+            for g in nic['Groups']:
+                self.add(refs, g['GroupId'], nic['NetworkInterfaceId'])
+        return refs
+
+    def build_sg_sg(self):
+        refs = {}
+        for sg in self.resources('security-group'):
+            for perm_type in ('IpPermissions', 'IpPermissionsEgress'):
+                for p in sg.get(perm_type, []):
+                    for g in p.get('UserIdGroupPairs', ()):
+                        self.add(refs, g['GroupId'], sg['GroupId'])
+        return refs
+
+    def build_ami_snapshot(self):
+        refs = {}
+        for i in self.resources('ami'):
+            for dev in i.get('BlockDeviceMappings'):
+                if 'Ebs' in dev and 'SnapshotId' in dev['Ebs']:
+                    self.add(refs, dev['Ebs']['SnapshotId'], i['ImageId'])
+        return refs
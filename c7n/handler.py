@@ -24,9 +24,11 @@ import uuid
 import logging
 import json
 
+from c7n.exceptions import BatchEventsError
 from c7n.policy import PolicyCollection
 from c7n.resources import load_resources
-from c7n.utils import format_event, get_account_id_from_sts
+from c7n.utils import (
+    chunks, format_event, get_account_id_from_sts, reset_session_cache)
 from c7n.config import Config
 
 import boto3
@@ -37,11 +39,101 @@ log = logging.getLogger('custodian.lambda')
 
 account_id = None
 
+# Parsed policy config, options and the policies built from them, reused
+# across invocations in a warm container until the config file changes.
+policy_cache = {}
+output_dir = None
+
+# Minutes to cache related resources (subnets, security groups, etc) looked
+# up by filters, policies can override via execution-options.
+RELATED_CACHE_PERIOD = 5
+
 # On cold start load all resources, requires a pythonpath directory scan
 if 'AWS_EXECUTION_ENV' in os.environ:
     load_resources()
 
 
+def init_output_dir():
+    # Initialize output directory, we've seen occassional perm issues with
+    # lambda on temp directory and changing unix execution users, so
+    # use a per container temp space.
+    global output_dir
+    if output_dir is None:
+        output_dir = os.environ.get(
+            'C7N_OUTPUT_DIR',
+            '/tmp/' + str(uuid.uuid4()))
+    if not os.path.exists(output_dir):
+        try:
+            os.mkdir(output_dir)
+        except OSError as error:
+            log.warning("Unable to make output directory: {}".format(error))
+    return output_dir
+
+
+def load_config(path='config.json'):
+    """Load the policy config file and execution options, reusing the
+    already parsed file unless it has changed.
+    """
+    stat = os.stat(path)
+    key = (path, stat.st_ino, stat.st_size, stat.st_mtime)
+    if policy_cache.get('key') == key:
+        return policy_cache['config'], policy_cache['options']
+
+    # policies file should always be valid in lambda so do loading naively
+    with open(path) as f:
+        policy_config = json.load(f)
+
+    options_overrides = None
+    if policy_config and policy_config.get('policies'):
+        # TODO. This enshrines an assumption of a single policy per lambda.
+        options_overrides = dict(policy_config[
+            'policies'][0].get('mode', {}).get('execution-options', {}))
+        options_overrides['account_id'] = account_id
+        options_overrides.setdefault(
+            'related_cache_period', RELATED_CACHE_PERIOD)
+        if 'output_dir' not in options_overrides:
+            options_overrides['output_dir'] = init_output_dir()
+
+    policy_cache.clear()
+    policy_cache.update(
+        {'key': key, 'config': policy_config, 'options': options_overrides})
+    return policy_config, options_overrides
+
+
+def load_policies(path='config.json'):
+    """Load the policies for an invocation from the policy config file.
+
+    Policies, with their resource managers, are built once per config
+    file and reused, resetting what an invocation may have changed.
+    """
+    policy_config, options_overrides = load_config(path)
+    if options_overrides is None:
+        return None
+    policies = policy_cache.get('policies')
+    if policies is None:
+        policies = PolicyCollection.from_data(
+            policy_config, Config.empty(**options_overrides))
+        policy_cache['policies'] = policies
+        policy_cache['state'] = [
+            (dict(p.options), dict(vars(p.session_factory))) for p in policies]
+    else:
+        reset_policies(policies, policy_cache['state'])
+    return policies
+
+
+def reset_policies(policies, state):
+    """Restore policy options and session factories, ie. after an
+    invocation assumed a role into a member account.
+    """
+    for p, (options, factory) in zip(policies, state):
+        if dict(p.options) == options and vars(p.session_factory) == factory:
+            continue
+        p.options.clear()
+        p.options.update(options)
+        vars(p.session_factory).update(factory)
+        reset_session_cache()
+
+
 def dispatch_event(event, context):
 
     global account_id
@@ -49,6 +141,11 @@ def dispatch_event(event, context):
         session = boto3.Session()
         account_id = get_account_id_from_sts(session)
 
+    # Events buffered through an sqs queue are delivered in batches
+    records = get_batch_records(event)
+    if records is not None:
+        return dispatch_batch(records, context)
+
     error = event.get('detail', {}).get('errorCode')
     if error:
         log.debug("Skipping failed operation: %s" % error)
@@ -58,35 +155,65 @@ def dispatch_event(event, context):
     if event['debug']:
         log.info("Processing event\n %s", format_event(event))
 
-    # policies file should always be valid in lambda so do loading naively
-    with open('config.json') as f:
-        policy_config = json.load(f)
+    policies = load_policies()
+    if not policies:
+        return False
+
+    init_output_dir()
+    for p in policies:
+        p.push(event, context)
+    return True
+
+
+def get_batch_records(event):
+    records = event.get('Records')
+    if not records or records[0].get('eventSource') != 'aws:sqs':
+        return None
+    return records
+
+
+def dispatch_batch(records, context):
+    """Process a batch of events from sqs.
 
-    if not policy_config or not policy_config.get('policies'):
+    If some events fail, the messages of the others are deleted before
+    failing the invocation, so only the failed events are redelivered.
+    """
+    events = [json.loads(r['body']) for r in records]
+    log.info("Processing batch of %d events", len(events))
+
+    policies = load_policies()
+    if not policies:
         return False
 
-    # Initialize output directory, we've seen occassional perm issues with
-    # lambda on temp directory and changing unix execution users, so
-    # use a per execution temp space.
-    output_dir = os.environ.get(
-        'C7N_OUTPUT_DIR',
-        '/tmp/' + str(uuid.uuid4()))
-    if not os.path.exists(output_dir):
+    init_output_dir()
+    failed = []
+    for p in policies:
         try:
-            os.mkdir(output_dir)
-        except OSError as error:
-            log.warning("Unable to make output directory: {}".format(error))
-
-    # TODO. This enshrines an assumption of a single policy per lambda.
-    options_overrides = policy_config[
-        'policies'][0].get('mode', {}).get('execution-options', {})
-    options_overrides['account_id'] = account_id
-    if 'output_dir' not in options_overrides:
-        options_overrides['output_dir'] = output_dir
-    options = Config.empty(**options_overrides)
-
-    policies = PolicyCollection.from_data(policy_config, options)
-    if policies:
-        for p in policies:
-            p.push(event, context)
-    return True
+            p.push_batch(events, context)
+        except BatchEventsError as e:
+            failed.extend(
+                f for f in e.events if not any(f is x for x in failed))
+    if not failed:
+        return True
+
+    delete_messages([
+        r for r, e in zip(records, events)
+        if not any(f is e for f in failed)])
+    raise BatchEventsError(
+        "%d of %d events failed" % (len(failed), len(events)), failed, [])
+
+
+def delete_messages(records):
+    """Delete the sqs messages of records that were processed."""
+    queues = {}
+    for r in records:
+        queues.setdefault(r['eventSourceARN'], []).append(r)
+    for arn, queue_records in queues.items():
+        _, _, _, region, owner, name = arn.split(':', 5)
+        client = boto3.Session().client('sqs', region_name=region)
+        queue_url = "%s/%s/%s" % (client.meta.endpoint_url, owner, name)
+        for record_set in chunks(queue_records, 10):
+            client.delete_message_batch(
+                QueueUrl=queue_url,
+                Entries=[{'Id': str(i), 'ReceiptHandle': r['receiptHandle']}
+                         for i, r in enumerate(record_set)])
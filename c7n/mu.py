@@ -26,6 +26,8 @@ import io
 import json
 import logging
 import os
+import shutil
+import threading
 import time
 import tempfile
 import zipfile
@@ -37,6 +39,7 @@ from c7n.exceptions import ClientError
 from c7n.cwe import CloudWatchEvents
 from c7n.logs_support import _timestamp_from_string
 from c7n.utils import parse_s3, local_session
+from c7n.version import version
 
 
 log = logging.getLogger('custodian.serverless')
@@ -195,6 +198,25 @@ class PythonPackageArchive(object):
                 1024.0 * 1024.0)))
         return self
 
+    def copy(self):
+        """Return a new open archive with the contents of this closed archive.
+
+        Further files can be added to the copy without rebuilding
+        the modules of the original.
+        """
+        assert self._closed, "Archive not closed"
+        archive = PythonPackageArchive()
+        archive._zip_file.close()
+        archive._temp_archive_file.seek(0)
+        archive._temp_archive_file.truncate()
+        with open(self.path, 'rb') as fh:
+            shutil.copyfileobj(fh, archive._temp_archive_file)
+        archive._temp_archive_file.flush()
+        archive._zip_file = zipfile.ZipFile(
+            archive._temp_archive_file, mode='a',
+            compression=zipfile.ZIP_DEFLATED)
+        return archive
+
     def remove(self):
         """Dispose of the temp file for garbage collection."""
         if self._temp_archive_file:
@@ -253,7 +275,20 @@ def custodian_archive(packages=None):
     modules = {'c7n', 'pkg_resources'}
     if packages:
         modules = filter(None, modules.union(packages))
-    return PythonPackageArchive(*sorted(modules))
+    modules = tuple(sorted(modules))
+
+    # The package archive only varies by c7n version and package set, so we
+    # build it once per process and hand out copies for per policy contents.
+    key = (version, modules)
+    with _archive_lock:
+        if key not in _archive_cache:
+            _archive_cache[key] = PythonPackageArchive(*modules).close()
+        base = _archive_cache[key]
+    return base.copy()
+
+
+_archive_cache = {}
+_archive_lock = threading.Lock()
 
 
 class LambdaManager(object):
@@ -397,21 +432,21 @@ class LambdaManager(object):
         archive = func.get_archive()
         existing = self.get(func.name, qualifier)
 
-        if s3_uri:
-            # TODO: support versioned buckets
-            bucket, key = self._upload_func(s3_uri, func, archive)
-            code_ref = {'S3Bucket': bucket, 'S3Key': key}
-        else:
-            code_ref = {'ZipFile': archive.get_bytes()}
+        def get_code_ref():
+            # only upload the archive when the function code has changed
+            if s3_uri:
+                # TODO: support versioned buckets
+                bucket, key = self._upload_func(s3_uri, func, archive)
+                return {'S3Bucket': bucket, 'S3Key': key}
+            return {'ZipFile': archive.get_bytes()}
 
         changed = False
         if existing:
             old_config = existing['Configuration']
-            if archive.get_checksum() != old_config[
-                    'CodeSha256'].encode('ascii'):
+            if archive.get_checksum() != old_config['CodeSha256']:
                 log.debug("Updating function %s code", func.name)
                 params = dict(FunctionName=func.name, Publish=True)
-                params.update(code_ref)
+                params.update(get_code_ref())
                 result = self.client.update_function_code(**params)
                 changed = True
             # TODO/Consider also set publish above to false, and publish
@@ -448,7 +483,7 @@ class LambdaManager(object):
         else:
             log.info('Publishing custodian policy lambda function %s', func.name)
             params = func.get_config()
-            params.update({'Publish': True, 'Code': code_ref, 'Role': role})
+            params.update({'Publish': True, 'Code': get_code_ref(), 'Role': role})
             result = self.client.create_function(**params)
             changed = True
 
@@ -788,6 +823,11 @@ class PolicyLambda(AbstractLambdaFunction):
             events.append(
                 CloudWatchEventSource(
                     self.policy.data['mode'], session_factory))
+            if self.policy.data['mode'].get('queue'):
+                events.append(
+                    SQSSubscription(
+                        session_factory, [self.policy.data['mode']['queue']],
+                        self.policy.data['mode'].get('batch-size', 10)))
         return events
 
     def get_archive(self):
@@ -965,17 +1005,22 @@ class CloudWatchEventSource(object):
         else:
             response = {'RuleArn': rule['Arn']}
 
-        try:
-            self.session.client('lambda').add_permission(
-                FunctionName=func.name,
-                StatementId=func.name,
-                SourceArn=response['RuleArn'],
-                Action='lambda:InvokeFunction',
-                Principal='events.amazonaws.com')
-            log.debug('Added lambda invoke cwe rule permission')
-        except ClientError as e:
-            if e.response['Error']['Code'] != 'ResourceConflictException':
-                raise
+        # Events can be buffered in a queue, which the function
+        # consumes in batches, instead of invoking the function directly.
+        queue_arn = self.data.get('queue')
+
+        if not queue_arn:
+            try:
+                self.session.client('lambda').add_permission(
+                    FunctionName=func.name,
+                    StatementId=func.name,
+                    SourceArn=response['RuleArn'],
+                    Action='lambda:InvokeFunction',
+                    Principal='events.amazonaws.com')
+                log.debug('Added lambda invoke cwe rule permission')
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ResourceConflictException':
+                    raise
 
         # Add Targets
         found = False
@@ -985,18 +1030,19 @@ class CloudWatchEventSource(object):
 
         if func_arn.count(':') > 6:
             func_arn, version = func_arn.rsplit(':', 1)
+        target_arn = queue_arn or func_arn
         for t in response['Targets']:
-            if func_arn == t['Arn']:
+            if target_arn == t['Arn']:
                 found = True
 
         if found:
             return
 
-        log.debug('Creating cwe rule target for %s on func:%s' % (
-            self, func_arn))
+        log.debug('Creating cwe rule target for %s on %s' % (
+            self, target_arn))
 
         self.client.put_targets(
-            Rule=func.name, Targets=[{"Id": func.name, "Arn": func_arn}])
+            Rule=func.name, Targets=[{"Id": func.name, "Arn": target_arn}])
 
         return True
 
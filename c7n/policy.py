@@ -28,8 +28,10 @@ import six
 
 from c7n.actions import EventAction
 from c7n.cwe import CloudWatchEvents
+from c7n.filters import EventFilter
 from c7n.ctx import ExecutionContext
-from c7n.exceptions import PolicyValidationError, ClientError, ResourceLimitExceeded
+from c7n.exceptions import (
+    BatchEventsError, PolicyValidationError, ClientError, ResourceLimitExceeded)
 from c7n.output import DEFAULT_NAMESPACE
 from c7n.resources import load_resources
 from c7n.registry import PluginRegistry
@@ -352,6 +354,7 @@ class LambdaMode(ServerlessExecutionMode):
         'properties': {
             'execution-options': {'type': 'object'},
             'function-prefix': {'type': 'string'},
+            'log': {'type': 'boolean'},
             'member-role': {'type': 'string'},
             'packages': {'type': 'array'},
             # Lambda passthrough config
@@ -369,6 +372,11 @@ class LambdaMode(ServerlessExecutionMode):
         }
     }
 
+    # Event modes can buffer events in an sqs queue, processed in batches
+    queue_schema = {
+        'queue': {'type': 'string'},
+        'batch-size': {'type': 'integer', 'minimum': 1, 'maximum': 10}}
+
     def get_metrics(self, start, end, period):
         from c7n.mu import LambdaManager, PolicyLambda
         manager = LambdaManager(self.policy.session_factory)
@@ -403,15 +411,18 @@ class LambdaMode(ServerlessExecutionMode):
             return True
         return False
 
-    def resolve_resources(self, event):
-        self.assume_member(event)
+    def resolve_ids(self, event):
         mode = self.policy.data.get('mode', {})
         resource_ids = CloudWatchEvents.get_ids(event, mode)
         if resource_ids is None:
             raise ValueError("Unknown push event mode %s", self.data)
         self.policy.log.info('Found resource ids: %s', resource_ids)
         # Handle multi-resource type events, like ec2 CreateTags
-        resource_ids = self.policy.resource_manager.match_ids(resource_ids)
+        return self.policy.resource_manager.match_ids(resource_ids)
+
+    def resolve_resources(self, event):
+        self.assume_member(event)
+        resource_ids = self.resolve_ids(event)
         if not resource_ids:
             self.policy.log.warning("Could not find resource ids")
             return []
@@ -432,13 +443,7 @@ class LambdaMode(ServerlessExecutionMode):
         TODO: better customization around execution context outputs
         TODO: support centralized lambda exec across accounts.
         """
-
-        mode = self.policy.data.get('mode', {})
-        if not bool(mode.get("log", True)):
-            root = logging.getLogger()
-            map(root.removeHandler, root.handlers[:])
-            root.handlers = [logging.NullHandler()]
-
+        self.setup_logging()
         resources = self.resolve_resources(event)
         if not resources:
             return resources
@@ -454,12 +459,32 @@ class LambdaMode(ServerlessExecutionMode):
                     self.policy.name, self.policy.resource_type))
             return
 
+        return self.run_actions(resources, [(event, resources)])
+
+    def setup_logging(self):
+        mode = self.policy.data.get('mode', {})
+        if not bool(mode.get("log", True)):
+            root = logging.getLogger()
+            map(root.removeHandler, root.handlers[:])
+            root.handlers = [logging.NullHandler()]
+
+    def run_actions(self, resources, event_resources, failed=None):
+        """Run the policy's actions on the matched resources.
+
+        Event actions are invoked once per event with that event's
+        matched resources, other actions once with all resources.
+
+        For batches, failed is a list of events that failed to process,
+        an event action failing on an event adds it there rather than
+        failing the other events.
+        """
+        debug = any('debug' in e for e, _ in event_resources)
         with self.policy.ctx:
             self.policy.ctx.metrics.put_metric(
                 'ResourceCount', len(resources), 'Count', Scope="Policy",
                 buffer=False)
 
-            if 'debug' in event:
+            if debug:
                 self.policy.log.info(
                     "Invoking actions %s", self.policy.resource_manager.actions)
 
@@ -470,14 +495,137 @@ class LambdaMode(ServerlessExecutionMode):
                 self.policy.log.info(
                     "policy: %s invoking action: %s resources: %d",
                     self.policy.name, action.name, len(resources))
-                if isinstance(action, EventAction):
-                    results = action.process(resources, event)
+                if isinstance(action, EventAction) and failed is None:
+                    (event, event_matched), = event_resources
+                    results = action.process(event_matched, event)
+                elif isinstance(action, EventAction):
+                    results = []
+                    for event, event_matched in event_resources:
+                        if event_matched and not self.has_failed(failed, event):
+                            results.append(self.process_event(
+                                failed, event, action.process,
+                                event_matched, event))
                 else:
                     results = action.process(resources)
                 self.policy._write_file(
                     "action-%s" % action.name, utils.dumps(results))
         return resources
 
+    def run_batch(self, events, lambda_context):
+        """Run policy in push mode against a batch of events.
+
+        Resource ids across the events are deduplicated and resolved
+        with a single describe per member account and region. Policies
+        with event filters are filtered per event, and event actions are
+        invoked per event, to retain the semantics of single event runs.
+
+        An event that fails to process doesn't fail the others, once the
+        batch is done a BatchEventsError with the failed events is raised.
+        """
+        self.setup_logging()
+        groups = {}
+        for event in events:
+            error = event.get('detail', {}).get('errorCode')
+            if error:
+                self.policy.log.debug(
+                    "Skipping failed operation: %s" % error)
+                continue
+            groups.setdefault((
+                self.get_member_account_id(event),
+                self.get_member_region(event)), []).append(event)
+
+        resources = []
+        failed = []
+        for group_events in groups.values():
+            try:
+                self.assume_member(group_events[0])
+                resources.extend(self.run_event_group(group_events, failed))
+            except Exception:
+                self.policy.log.exception(
+                    "policy: %s error processing %d events",
+                    self.policy.name, len(group_events))
+                failed.extend(
+                    e for e in group_events if not self.has_failed(failed, e))
+        if failed:
+            raise BatchEventsError(
+                "policy: %s %d of %d events failed" % (
+                    self.policy.name, len(failed), len(events)),
+                failed, resources)
+        return resources
+
+    @staticmethod
+    def has_failed(failed, event):
+        return any(e is event for e in failed)
+
+    def process_event(self, failed, event, func, *args):
+        """Call func for an event of a batch, recording the event on error."""
+        try:
+            return func(*args)
+        except Exception:
+            self.policy.log.exception(
+                "policy: %s error processing event %s",
+                self.policy.name, event.get('id', ''))
+            failed.append(event)
+
+    def run_event_group(self, events, failed):
+        manager = self.policy.resource_manager
+        model = manager.get_model()
+
+        event_ids = []
+        resource_ids = []
+        for event in events:
+            ids = self.process_event(failed, event, self.resolve_ids, event)
+            if self.has_failed(failed, event):
+                continue
+            event_ids.append((event, ids or ()))
+            resource_ids.extend(i for i in ids or () if i not in resource_ids)
+        if not resource_ids:
+            self.policy.log.warning("Could not find resource ids")
+            return []
+
+        resources = manager.get_resources(resource_ids)
+        self.policy.log.info(
+            "Resolved %d resources from %d events",
+            len(resources), len(events))
+        resource_map = {r[model.id]: r for r in resources}
+
+        if self.has_event_filters(manager.filters):
+            event_resources = []
+            for event, ids in event_ids:
+                matched = self.process_event(
+                    failed, event, manager.filter_resources,
+                    [resource_map[i] for i in ids if i in resource_map], event)
+                if not self.has_failed(failed, event):
+                    event_resources.append((event, matched))
+        else:
+            matched = {r[model.id] for r in manager.filter_resources(resources)}
+            event_resources = [
+                (event, [resource_map[i] for i in ids if i in matched])
+                for event, ids in event_ids]
+
+        resources = []
+        seen = set()
+        for _, event_matched in event_resources:
+            for r in event_matched:
+                if r[model.id] not in seen:
+                    seen.add(r[model.id])
+                    resources.append(r)
+
+        if not resources:
+            self.policy.log.info(
+                "policy: %s resources: %s no resources matched" % (
+                    self.policy.name, self.policy.resource_type))
+            return []
+        return self.run_actions(resources, event_resources, failed)
+
+    @classmethod
+    def has_event_filters(cls, filters):
+        for f in filters:
+            if isinstance(f, EventFilter) or cls.has_event_filters(
+                    getattr(f, 'filters', ())):
+                return True
+        return False
+
     def provision(self):
         with self.policy.ctx:
             self.policy.log.info(
@@ -532,7 +680,7 @@ class CloudTrailMode(LambdaMode):
                      'ids': {'type': 'string'},
                      'event': {'type': 'string'}}}]
         }},
-        rinherit=LambdaMode.schema)
+        rinherit=LambdaMode.schema, **LambdaMode.queue_schema)
 
     def validate(self):
         events = self.policy.data['mode'].get('events')
@@ -562,7 +710,8 @@ class EC2InstanceState(LambdaMode):
         'ec2-instance-state', rinherit=LambdaMode.schema,
         events={'type': 'array', 'items': {
             'enum': ['pending', 'running', 'shutting-down',
-                     'stopped', 'stopping', 'terminated']}})
+                     'stopped', 'stopping', 'terminated']}},
+        **LambdaMode.queue_schema)
 
 
 @execution.register('asg-instance-state')
@@ -573,14 +722,16 @@ class ASGInstanceState(LambdaMode):
         'asg-instance-state', rinherit=LambdaMode.schema,
         events={'type': 'array', 'items': {
             'enum': ['launch-success', 'launch-failure',
-                     'terminate-success', 'terminate-failure']}})
+                     'terminate-success', 'terminate-failure']}},
+        **LambdaMode.queue_schema)
 
 
 @execution.register('guard-duty')
 class GuardDutyMode(LambdaMode):
     """Incident Response for AWS Guard Duty"""
 
-    schema = utils.type_schema('guard-duty', rinherit=LambdaMode.schema)
+    schema = utils.type_schema(
+        'guard-duty', rinherit=LambdaMode.schema, **LambdaMode.queue_schema)
 
     supported_resources = ('account', 'ec2', 'iam-user')
 
@@ -602,6 +753,20 @@ class GuardDutyMode(LambdaMode):
                 'AccessKeyId': event['detail']['resource']['accessKeyDetails']['accessKeyId']}
         return resources
 
+    def run_batch(self, events, lambda_context):
+        # findings annotate resources per event, so run them individually
+        resources = []
+        failed = []
+        for event in events:
+            resources.extend(self.process_event(
+                failed, event, self.run, event, lambda_context) or ())
+        if failed:
+            raise BatchEventsError(
+                "policy: %s %d of %d events failed" % (
+                    self.policy.name, len(failed), len(events)),
+                failed, resources)
+        return resources
+
     def validate(self):
         if self.policy.data['resource'] not in self.supported_resources:
             raise ValueError(
@@ -830,6 +995,10 @@ class Policy(object):
         mode = self.get_execution_mode()
         return mode.run(event, lambda_ctx)
 
+    def push_batch(self, events, lambda_ctx):
+        mode = self.get_execution_mode()
+        return mode.run_batch(events, lambda_ctx)
+
     def provision(self):
         """Provision policy as a lambda function."""
         mode = self.get_execution_mode()
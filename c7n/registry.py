@@ -49,6 +49,10 @@ class PluginRegistry(object):
     EVENT_FINAL = 1
     EVENTS = (EVENT_REGISTER, EVENT_FINAL)
 
+    # Count of changes to any registry, so derived state (ie. the policy
+    # schema) can tell when plugins were registered since it was built.
+    generation = 0
+
     def __init__(self, plugin_type):
         self.plugin_type = plugin_type
         self._factories = {}
@@ -64,12 +68,14 @@ class PluginRegistry(object):
         if klass:
             klass.type = name
             self._factories[name] = klass
+            PluginRegistry.generation += 1
             self.notify(self.EVENT_REGISTER, klass)
             return klass
 
         # invoked as class decorator
         def _register_class(klass):
             self._factories[name] = klass
+            PluginRegistry.generation += 1
             klass.type = name
             self.notify(self.EVENT_REGISTER, klass)
             return klass
@@ -78,6 +84,7 @@ class PluginRegistry(object):
     def unregister(self, name):
         if name in self._factories:
             del self._factories[name]
+            PluginRegistry.generation += 1
 
     def notify(self, event, key=None):
         for subscriber in self._subscribers[event]:
@@ -13,6 +13,7 @@
 # limitations under the License.
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import functools
 import itertools
 import logging
 
@@ -21,8 +22,10 @@ from concurrent.futures import as_completed
 from c7n.actions import ActionRegistry, BaseAction
 from c7n.filters import (
     FilterRegistry, AgeFilter, Filter, OPERATORS, CrossAccountAccessFilter)
+from c7n.filters.usage import UsageGraph
 from c7n.manager import resources
 from c7n.query import QueryResourceManager
+from c7n.resources.copies import CopyQueue
 from c7n.resolver import ValuesFrom
 from c7n.utils import local_session, type_schema, get_retry, chunks
 
@@ -153,9 +156,15 @@ class Copy(BaseAction):
                   - type: copy
                     encrypt: true
                     key-id: 00000000-0000-0000-0000-000000000000
+
+    Copies are queued per destination region, and only started while
+    fewer than `max-concurrent` (default 50) copies are in-flight. With
+    `max-wait` (seconds, default 240), copies that couldn't be started
+    in that time are left queued, and started by the next run of the
+    policy when the resource cache is enabled.
     """
 
-    permissions = ('ec2:CopyImage',)
+    permissions = ('ec2:CopyImage', 'ec2:DescribeImages')
     schema = {
         'type': 'object',
         'additionalProperties': False,
@@ -165,24 +174,55 @@ class Copy(BaseAction):
             'description': {'type': 'string'},
             'region': {'type': 'string'},
             'encrypt': {'type': 'boolean'},
-            'key-id': {'type': 'string'}
+            'key-id': {'type': 'string'},
+            'max-concurrent': {'type': 'integer', 'minimum': 1},
+            'max-wait': {'type': 'number', 'minimum': 0}
         }
     }
 
+    # Concurrent image copies allowed into a destination region.
+    max_concurrent = 50
+
+    # Seconds to wait on in-flight copies before leaving the rest queued.
+    max_wait = 240
+
     def process(self, images):
         session = local_session(self.manager.session_factory)
         client = session.client(
             'ec2',
             region_name=self.data.get('region', None))
 
-        for image in images:
-            client.copy_image(
-                Name=self.data.get('name', image['Name']),
-                Description=self.data.get('description', image['Description']),
-                SourceRegion=session.region_name,
-                SourceImageId=image['ImageId'],
-                Encrypted=self.data.get('encrypt', False),
-                KmsKeyId=self.data.get('key-id', ''))
+        queue = CopyQueue.get(
+            self.manager, 'image', client.meta.region_name, 'ImageId')
+        queue.add([
+            {k: i[k] for k in ('ImageId', 'Name', 'Description') if k in i}
+            for i in images])
+        queue.run(
+            self.data.get('max-concurrent', self.max_concurrent),
+            functools.partial(self.copy_image, client, session.region_name),
+            functools.partial(self.get_copy_states, client),
+            self.data.get('max-wait', self.max_wait))
+
+    def copy_image(self, client, source_region, image):
+        params = dict(
+            Name=self.data.get('name', image['Name']),
+            SourceRegion=source_region,
+            SourceImageId=image['ImageId'],
+            Encrypted=self.data.get('encrypt', False),
+            KmsKeyId=self.data.get('key-id', ''))
+        description = self.data.get('description', image.get('Description'))
+        if description is not None:
+            params['Description'] = description
+        return client.copy_image(**params)['ImageId']
+
+    def get_copy_states(self, client, image_ids):
+        states = {}
+        for image_set in chunks(image_ids, 200):
+            for i in client.describe_images(
+                    Filters=[{'Name': 'image-id', 'Values': image_set}]
+            ).get('Images', ()):
+                states[i['ImageId']] = i['State']
+        return states
 
 
 @filters.register('image-age')
@@ -235,16 +275,10 @@ class ImageUnusedFilter(Filter):
             for m in ('asg', 'launch-config', 'ec2')]))
 
     def _pull_asg_images(self):
-        asgs = self.manager.get_resource_manager('asg').resources()
-        lcfgs = set(a['LaunchConfigurationName'] for a in asgs)
-        lcfg_mgr = self.manager.get_resource_manager('launch-config')
-        return set([
-            lcfg['ImageId'] for lcfg in lcfg_mgr.resources()
-            if lcfg['LaunchConfigurationName'] in lcfgs])
+        return set(UsageGraph.get(self.manager).references('asg-image'))
 
     def _pull_ec2_images(self):
-        ec2_manager = self.manager.get_resource_manager('ec2')
-        return set([i['ImageId'] for i in ec2_manager.resources()])
+        return set(UsageGraph.get(self.manager).references('instance-image'))
 
     def process(self, resources, event=None):
         images = self._pull_ec2_images().union(self._pull_asg_images())
@@ -20,7 +20,6 @@ from concurrent.futures import as_completed
 
 from datetime import datetime, timedelta
 from dateutil import zoneinfo
-from dateutil.parser import parse
 
 import logging
 import itertools
@@ -32,13 +31,14 @@ from c7n.filters import (
     FilterRegistry, ValueFilter, AgeFilter, Filter,
     OPERATORS)
 from c7n.filters.offhours import OffHour, OnHour, Time
+from c7n.filters.usage import UsageGraph
 import c7n.filters.vpc as net_filters
 
 from c7n.manager import resources
 from c7n import query
 from c7n.tags import TagActionFilter, DEFAULT_TAG, TagCountFilter, TagTrim
 from c7n.utils import (
-    local_session, type_schema, chunks, get_retry, worker)
+    local_session, type_schema, chunks, get_retry, worker, parse_date)
 
 
 from .ec2 import deserialize_user_data
@@ -601,7 +601,7 @@ class ImageAgeFilter(AgeFilter, LaunchConfigFilterBase):
     def get_resource_date(self, i):
         cfg = self.configs[i['LaunchConfigurationName']]
         ami = self.images.get(cfg['ImageId'], {})
-        return parse(ami.get(
+        return parse_date(ami.get(
             self.date_attribute, "2000-01-01T01:01:01.000Z"))
 
 
@@ -1738,10 +1738,8 @@ class UnusedLaunchConfig(Filter):
         return self.manager.get_resource_manager('asg').get_permissions()
 
     def process(self, configs, event=None):
-        asgs = self.manager.get_resource_manager('asg').resources()
-        self.used = set([
-            a.get('LaunchConfigurationName', a['AutoScalingGroupName'])
-            for a in asgs])
+        self.used = UsageGraph.get(self.manager).references(
+            'asg-launch-config')
         return super(UnusedLaunchConfig, self).process(configs)
 
     def __call__(self, config):
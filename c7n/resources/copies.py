@@ -0,0 +1,206 @@
+# Copyright 2018 Capital One Services, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Queued copies of snapshots and images into a destination region.
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+log = logging.getLogger('custodian.copies')
+
+
+def get_copy_state_path(config):
+    cache = getattr(config, 'cache', None)
+    if not cache or cache == 'memory' or not getattr(config, 'cache_period', 0):
+        return None
+    return os.path.abspath(
+        os.path.expanduser(os.path.expandvars(cache))) + '.copies'
+
+
+class CopyQueue(object):
+    """Pending and in-flight copies into a destination region.
+
+    EC2 limits the number of concurrent snapshot and image copies into
+    a region, rather than starting copies in batches and blocking on
+    waiters, copies are queued and only started while the in-flight
+    count is under the limit. Completed copies are found by checking
+    the state of all in-flight copies with one describe call.
+
+    The queue is persisted next to the resource cache, so copies still
+    pending or in-flight when a run finishes (or gives up waiting) are
+    picked up by the next run of the policy.
+    """
+
+    # Seconds between checks on in-flight copies while waiting to admit more.
+    delay = 60
+
+    # Seconds a started copy may go unseen by describe calls before it's
+    # presumed gone and no longer counted against the limit.
+    confirm_wait = 900
+
+    # Copy states after which a copy no longer counts against the limit,
+    # snapshots complete as 'completed' and images as 'available'.
+    terminal_states = (
+        'completed', 'available', 'error', 'failed', 'invalid', 'deregistered')
+
+    _lock = threading.Lock()
+
+    def __init__(self, path, name, id_key):
+        self.path = path
+        self.name = name
+        self.id_key = id_key
+        self.pending = []
+        self.in_flight = {}
+        self.unconfirmed = {}
+        self.load()
+
+    @classmethod
+    def get(cls, manager, kind, target_region, id_key):
+        # The copy limit is on the destination region, whatever the source.
+        name = "%s:%s:%s" % (
+            kind, getattr(manager.config, 'account_id', None), target_region)
+        return cls(get_copy_state_path(manager.config), name, id_key)
+
+    def read(self):
+        if self.path is None or not os.path.isfile(self.path):
+            return {}
+        try:
+            with open(self.path) as fh:
+                return json.load(fh)
+        except ValueError:
+            return {}
+
+    def load(self):
+        state = self.read().get(self.name, {})
+        self.pending = state.get('pending', [])
+        self.in_flight = state.get('in-flight', {})
+        self.unconfirmed = state.get(
+            'unconfirmed', dict.fromkeys(self.in_flight, time.time()))
+
+    def save(self):
+        if self.path is None or not os.path.isdir(os.path.dirname(self.path)):
+            return
+        # Queues for other regions and resources share the file.
+        with self._lock:
+            state = self.read()
+            if self.pending or self.in_flight:
+                state[self.name] = {
+                    'pending': self.pending, 'in-flight': self.in_flight,
+                    'unconfirmed': self.unconfirmed}
+            else:
+                state.pop(self.name, None)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path))
+            with os.fdopen(fd, 'w') as fh:
+                json.dump(state, fh)
+            os.rename(tmp, self.path)
+
+    def add(self, items):
+        """Queue copies of items that aren't already pending or in-flight."""
+        queued = set(i[self.id_key] for i in self.pending)
+        queued.update(self.in_flight.values())
+        for i in items:
+            if i[self.id_key] not in queued:
+                queued.add(i[self.id_key])
+                self.pending.append(i)
+        self.save()
+
+    def update(self, states):
+        """Remove in-flight copies that have reached a terminal state.
+
+        states is a mapping of copy id to its state. Describe calls are
+        eventually consistent and may not return a copy that was just
+        started, so ids missing from it are kept in-flight until they've
+        been seen once, or for at most confirm_wait seconds.
+        """
+        now = time.time()
+        for copy_id in list(self.in_flight):
+            state = states.get(copy_id)
+            if state is None:
+                started = self.unconfirmed.get(copy_id)
+                if started is not None and now - started < self.confirm_wait:
+                    continue
+                log.warning("copy:%s of %s not found, no longer tracking",
+                            copy_id, self.in_flight[copy_id])
+            else:
+                self.unconfirmed.pop(copy_id, None)
+                if state not in self.terminal_states:
+                    continue
+                if state not in ('completed', 'available'):
+                    log.warning("copy:%s of %s finished in state:%s",
+                                copy_id, self.in_flight[copy_id], state)
+            del self.in_flight[copy_id]
+            self.unconfirmed.pop(copy_id, None)
+        self.save()
+
+    def admit(self, limit, start):
+        """Start pending copies while under the limit.
+
+        start is called with a queued item and returns the copy id.
+        Returns a list of (item, copy id) for copies started. Items
+        whose copy fails to start are put back at the head of the queue,
+        admission stops early if the region's copy limit was reached.
+        """
+        started = []
+        while self.pending and len(self.in_flight) < limit:
+            item = self.pending.pop(0)
+            try:
+                copy_id = start(item)
+            except ClientError as e:
+                self.pending.insert(0, item)
+                self.save()
+                if e.response['Error']['Code'] != 'ResourceLimitExceeded':
+                    raise
+                log.info("Copy limit reached with in-flight:%d, pending:%d",
+                         len(self.in_flight), len(self.pending))
+                break
+            except Exception:
+                self.pending.insert(0, item)
+                self.save()
+                raise
+            self.in_flight[copy_id] = item[self.id_key]
+            self.unconfirmed[copy_id] = time.time()
+            started.append((item, copy_id))
+            self.save()
+        return started
+
+    def run(self, limit, start, get_states, max_wait=None):
+        """Start all pending copies, waiting on in-flight copies as needed.
+
+        Returns the copies started. With max_wait (seconds), copies that
+        couldn't be started within it are left queued for the next run.
+        """
+        began = time.time()
+        started = []
+        while True:
+            if self.in_flight:
+                self.update(get_states(list(self.in_flight)))
+            started.extend(self.admit(limit, start))
+            if not self.pending:
+                break
+            if max_wait is not None and (
+                    time.time() - began + self.delay > max_wait):
+                log.info("Deferring %d copies to next run, in-flight:%d",
+                         len(self.pending), len(self.in_flight))
+                break
+            log.debug("Waiting on %d in-flight copies, pending:%d",
+                      len(self.in_flight), len(self.pending))
+            time.sleep(self.delay)
+        return started
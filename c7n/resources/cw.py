@@ -17,6 +17,7 @@ from concurrent.futures import as_completed
 from datetime import datetime, timedelta
 
 from c7n.actions import BaseAction
+from c7n.cache import SharedCache
 from c7n.filters import Filter
 from c7n.filters.iamaccess import CrossAccountAccessFilter
 from c7n.query import QueryResourceManager, ChildResourceManager
@@ -241,18 +242,44 @@ class LastWriteDays(Filter):
         'last-write', days={'type': 'number'})
     permissions = ('logs:DescribeLogStreams',)
 
+    # describe log streams is rate limited to a handful of requests
+    # per second per account.
+    max_workers = 3
+    retry = staticmethod(get_retry(('ThrottlingException',)))
+
+    # Log streams by group arn and creation time, shared by policies
+    # in a run.
+    _streams = SharedCache()
+
     def process(self, resources, event=None):
         client = local_session(self.manager.session_factory).client('logs')
         self.date_threshold = datetime.utcnow() - timedelta(
             days=self.data['days'])
-        return [r for r in resources if self.check_group(client, r)]
+        # A group created after the threshold can't have been last written
+        # before it, so we only need to look at the streams of older groups.
+        candidates = [
+            r for r in resources if self.date_threshold > datetime.fromtimestamp(
+                r['creationTime'] / 1000.0)]
+        with self.executor_factory(max_workers=self.max_workers) as w:
+            results = list(w.map(
+                lambda r: self.check_group(client, r), candidates))
+        return [r for r, stale in zip(candidates, results) if stale]
+
+    def get_streams(self, client, group):
+        key = (group['arn'], group['creationTime'])
+        streams = self._streams.get(self.manager, key)
+        if streams is None:
+            streams = self.retry(
+                client.describe_log_streams,
+                logGroupName=group['logGroupName'],
+                orderBy='LastEventTime',
+                descending=True,
+                limit=3).get('logStreams')
+            self._streams.save(self.manager, streams, key)
+        return streams
 
     def check_group(self, client, group):
-        streams = client.describe_log_streams(
-            logGroupName=group['logGroupName'],
-            orderBy='LastEventTime',
-            descending=True,
-            limit=3).get('logStreams')
+        streams = self.get_streams(client, group)
         group['streams'] = streams
         if not streams:
             last_timestamp = group['creationTime']
@@ -14,6 +14,7 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 from collections import Counter
+import functools
 import logging
 import itertools
 import json
@@ -29,6 +30,7 @@ from c7n.filters import (
     CrossAccountAccessFilter, Filter, FilterRegistry, AgeFilter, ValueFilter,
     ANNOTATION_KEY, OPERATORS)
 from c7n.filters.health import HealthEventFilter
+from c7n.filters.usage import UsageGraph
 
 from c7n.manager import resources
 from c7n.resources.kms import ResourceKmsKeyAlias
@@ -43,6 +45,7 @@ from c7n.utils import (
     worker,
 )
 from c7n.resources.ami import AMI
+from c7n.resources.copies import CopyQueue
 
 log = logging.getLogger('custodian.ebs')
 
@@ -114,14 +117,9 @@ class SnapshotAge(AgeFilter):
 def _filter_ami_snapshots(self, snapshots):
     if not self.data.get('value', True):
         return snapshots
-    # try using cache first to get a listing of all AMI snapshots and compares resources to the list
-    # This will populate the cache.
-    amis = self.manager.get_resource_manager('ami').resources()
-    ami_snaps = []
-    for i in amis:
-        for dev in i.get('BlockDeviceMappings'):
-            if 'Ebs' in dev and 'SnapshotId' in dev['Ebs']:
-                ami_snaps.append(dev['Ebs']['SnapshotId'])
+    # ami snapshots are shared with other policies via the usage graph,
+    # which uses the cache when populating.
+    ami_snaps = UsageGraph.get(self.manager).references('ami-snapshot')
     matches = []
     for snap in snapshots:
         if snap['SnapshotId'] not in ami_snaps:
@@ -305,6 +303,12 @@ class CopySnapshot(BaseAction):
                     target_region: us-west-2
                     target_key: target_kms_key
                     encrypted: true
+
+    Copies are queued per destination region, and only started while
+    fewer than `max-concurrent` (default 5) copies are in-flight. With
+    `max-wait` (seconds, default 240), copies that couldn't be started
+    in that time are left queued, and started by the next run of the
+    policy when the resource cache is enabled.
     """
 
     schema = type_schema(
@@ -312,10 +316,18 @@ class CopySnapshot(BaseAction):
         target_region={'type': 'string'},
         target_key={'type': 'string'},
         encrypted={'type': 'boolean'},
+        **{'max-concurrent': {'type': 'integer', 'minimum': 1},
+           'max-wait': {'type': 'number', 'minimum': 0}}
     )
     permissions = (
         'ec2:CreateTags', 'ec2:CopySnapshot', 'ec2:DescribeSnapshots')
 
+    # Concurrent snapshot copies allowed into a destination region.
+    max_concurrent = 5
+
+    # Seconds to wait on in-flight copies before leaving the rest queued.
+    max_wait = 240
+
     def validate(self):
         if self.data.get('encrypted', True):
             key = self.data.get('target_key')
@@ -331,46 +343,48 @@ class CopySnapshot(BaseAction):
                 "Source and destination region are the same, skipping")
             return
 
-        with self.executor_factory(max_workers=2) as w:
-            list(w.map(self.process_resource_set, chunks(resources, 20)))
-
-    @worker
-    def process_resource_set(self, resource_set):
         client = self.manager.session_factory(
             region=self.data['target_region']).client('ec2')
+        queue = CopyQueue.get(
+            self.manager, 'snapshot', self.data['target_region'], 'SnapshotId')
+        queue.add([
+            {k: r[k] for k in ('SnapshotId', 'Description', 'Tags') if k in r}
+            for r in resources])
+        copies = queue.run(
+            self.data.get('max-concurrent', self.max_concurrent),
+            functools.partial(self.copy_snapshot, client),
+            functools.partial(self.get_copy_states, client),
+            self.data.get('max-wait', self.max_wait))
+
+        copied = {item['SnapshotId']: copy_id for item, copy_id in copies}
+        for r in resources:
+            if r['SnapshotId'] in copied:
+                r['c7n:CopiedSnapshot'] = copied[r['SnapshotId']]
 
-        if self.data['target_region'] != self.manager.config.region:
-            cross_region = True
-
+    def copy_snapshot(self, client, snapshot):
         params = {}
         params['Encrypted'] = self.data.get('encrypted', True)
         if params['Encrypted']:
             params['KmsKeyId'] = self.data['target_key']
 
-        for snapshot_set in chunks(resource_set, 5):
-            for r in snapshot_set:
-                snapshot_id = client.copy_snapshot(
-                    SourceRegion=self.manager.config.region,
-                    SourceSnapshotId=r['SnapshotId'],
-                    Description=r.get('Description', ''),
-                    **params)['SnapshotId']
-                if r.get('Tags'):
-                    client.create_tags(
-                        Resources=[snapshot_id], Tags=r['Tags'])
-                r['c7n:CopiedSnapshot'] = snapshot_id
-
-            if not cross_region or len(snapshot_set) < 5:
-                continue
-
-            copy_ids = [r['c7n:CopiedSnapshot'] for r in snapshot_set]
-            self.log.debug(
-                "Waiting on cross-region snapshot copy %s", ",".join(copy_ids))
-            waiter = client.get_waiter('snapshot_completed')
-            waiter.config.delay = 60
-            waiter.config.max_attempts = 60
-            waiter.wait(SnapshotIds=copy_ids)
-            self.log.debug(
-                "Cross region copy complete %s", ",".join(copy_ids))
+        snapshot_id = client.copy_snapshot(
+            SourceRegion=self.manager.config.region,
+            SourceSnapshotId=snapshot['SnapshotId'],
+            Description=snapshot.get('Description', ''),
+            **params)['SnapshotId']
+        if snapshot.get('Tags'):
+            client.create_tags(
+                Resources=[snapshot_id], Tags=snapshot['Tags'])
+        return snapshot_id
+
+    def get_copy_states(self, client, snapshot_ids):
+        states = {}
+        for snapshot_set in chunks(snapshot_ids, 200):
+            for s in client.describe_snapshots(
+                    Filters=[{'Name': 'snapshot-id', 'Values': snapshot_set}]
+            ).get('Snapshots', ()):
+                states[s['SnapshotId']] = s['State']
+        return states
 
 
 @resources.register('ebs')
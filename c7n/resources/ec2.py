@@ -14,20 +14,23 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 import base64
+import functools
 import itertools
 import operator
 import random
 import re
+import threading
+import time
 import zlib
 
 import six
 from botocore.exceptions import ClientError
-from dateutil.parser import parse
 from concurrent.futures import as_completed
 
 from c7n.actions import (
     ActionRegistry, BaseAction, ModifyVpcSecurityGroupsAction
 )
+from c7n.cache import SharedCache
 from c7n.exceptions import PolicyValidationError
 from c7n.filters import (
     FilterRegistry, AgeFilter, ValueFilter, Filter, OPERATORS, DefaultVpcBase
@@ -217,7 +220,7 @@ class StateTransitionAge(AgeFilter):
             return None
         dates = self.RE_PARSE_AGE.findall(v)
         if dates:
-            return parse(dates[0][1:-1])
+            return utils.parse_date(dates[0][1:-1])
         return None
 
 
@@ -305,6 +308,106 @@ class AttachedVolume(ValueFilter):
         return self.operator(map(self.match, volumes))
 
 
+class InstanceAttributes(object):
+    """Instance attribute values shared by the ec2 filters in a run.
+
+    DescribeInstanceAttribute only takes a single instance and attribute,
+    so values are fetched on a rate limited pool and shared per account
+    and region, user data is decoded once per instance.
+
+    Values are only shared by pull mode policies, as a warm lambda could
+    otherwise answer an event with a value cached before the change that
+    triggered it.
+    """
+
+    # Concurrent and per second DescribeInstanceAttribute calls, the rate
+    # can be set with the instance_attribute_rate option.
+    max_workers = 3
+    max_rate = 20
+
+    _caches = SharedCache()
+    _lock = threading.Lock()
+
+    def __init__(self, manager):
+        self.manager = manager
+        self.values = {}
+        self.user_data = {}
+        self.lock = threading.Lock()
+        self.next_call = 0
+        self.max_rate = getattr(
+            manager.config, 'instance_attribute_rate', None) or self.max_rate
+
+    @classmethod
+    def get(cls, manager):
+        if manager.data.get('mode', {}).get('type', 'pull') != 'pull':
+            return cls(manager)
+        with cls._lock:
+            attrs = cls._caches.get(manager)
+            if attrs is None:
+                attrs = cls(manager)
+                cls._caches.save(manager, attrs)
+        return attrs
+
+    def fetch(self, resources, attribute):
+        """Return a mapping of instance id to the attribute's value.
+
+        Instances that no longer exist are omitted.
+        """
+        instance_ids = [r['InstanceId'] for r in resources]
+        with self.lock:
+            missing = [i for i in instance_ids
+                       if (attribute, i) not in self.values]
+        if missing:
+            client = utils.local_session(
+                self.manager.session_factory).client('ec2')
+            with self.manager.executor_factory(
+                    max_workers=self.max_workers) as w:
+                list(w.map(
+                    functools.partial(self.fetch_value, client, attribute),
+                    missing))
+        with self.lock:
+            return {i: self.values[(attribute, i)] for i in instance_ids
+                    if self.values.get((attribute, i)) is not None}
+
+    def fetch_value(self, client, attribute, instance_id):
+        self.throttle()
+        try:
+            result = self.manager.retry(
+                client.describe_instance_attribute,
+                Attribute=attribute,
+                InstanceId=instance_id)
+        except ClientError as e:
+            if e.response['Error']['Code'] not in (
+                    'InvalidInstanceID.NotFound', 'InvalidInstanceId.NotFound'):
+                raise
+            result = None
+        else:
+            result.pop('ResponseMetadata', None)
+            instance_id = result.pop('InstanceId', instance_id)
+            result = list(result.values())[0]
+        with self.lock:
+            self.values[(attribute, instance_id)] = result
+
+    def throttle(self):
+        with self.lock:
+            now = time.time()
+            wait = self.next_call - now
+            self.next_call = max(now, self.next_call) + 1.0 / self.max_rate
+        if wait > 0:
+            time.sleep(wait)
+
+    def get_user_data(self, resources):
+        """Return a mapping of instance id to decoded user data or None."""
+        values = self.fetch(resources, 'userData')
+        results = {}
+        for i, v in values.items():
+            if i not in self.user_data:
+                self.user_data[i] = 'Value' in v and deserialize_user_data(
+                    v['Value']) or None
+            results[i] = self.user_data[i]
+        return results
+
+
 @filters.register('termination-protected')
 class DisableApiTermination(Filter):
     """EC2 instances with ``disableApiTermination`` attribute set
@@ -342,18 +445,10 @@ class DisableApiTermination(Filter):
         return perms
 
     def process(self, resources, event=None):
-        client = utils.local_session(
-            self.manager.session_factory).client('ec2')
+        values = InstanceAttributes.get(self.manager).fetch(
+            resources, 'disableApiTermination')
         return [r for r in resources
-                if self.is_termination_protection_enabled(client, r)]
-
-    def is_termination_protection_enabled(self, client, inst):
-        attr_val = self.manager.retry(
-            client.describe_instance_attribute,
-            Attribute='disableApiTermination',
-            InstanceId=inst['InstanceId']
-        )
-        return attr_val['DisableApiTermination']['Value']
+                if values.get(r['InstanceId'], {}).get('Value')]
 
 
 class InstanceImageBase(object):
@@ -418,9 +513,9 @@ class ImageAge(AgeFilter, InstanceImageBase):
     def get_resource_date(self, i):
         image = self.get_instance_image(i)
         if image:
-            return parse(image['CreationDate'])
+            return utils.parse_date(image['CreationDate'])
         else:
-            return parse("2000-01-01T01:01:01.000Z")
+            return utils.parse_date("2000-01-01T01:01:01.000Z")
 
 
 @filters.register('image')
@@ -690,44 +785,19 @@ class UserData(ValueFilter):
     """
 
     schema = type_schema('user-data', rinherit=ValueFilter.schema)
-    batch_size = 50
     annotation = 'c7n:user-data'
     permissions = ('ec2:DescribeInstanceAttribute',)
 
     def process(self, resources, event=None):
         self.data['key'] = '"c7n:user-data"'
-        client = utils.local_session(self.manager.session_factory).client('ec2')
-        results = []
-        with self.executor_factory(max_workers=3) as w:
-            futures = {}
-            for instance_set in utils.chunks(resources, self.batch_size):
-                futures[w.submit(
-                    self.process_instance_set,
-                    client, instance_set)] = instance_set
-
-            for f in as_completed(futures):
-                if f.exception():
-                    self.log.error(
-                        "Error processing userdata on instance set %s", f.exception())
-                results.extend(f.result())
-        return results
-
-    def process_instance_set(self, client, resources):
+        user_data = InstanceAttributes.get(self.manager).get_user_data(
+            [r for r in resources if self.annotation not in r])
         results = []
         for r in resources:
             if self.annotation not in r:
-                try:
-                    result = client.describe_instance_attribute(
-                        Attribute='userData',
-                        InstanceId=r['InstanceId'])
-                except ClientError as e:
-                    if e.response['Error']['Code'] == 'InvalidInstanceId.NotFound':
-                        continue
-                if 'Value' not in result['UserData']:
-                    r[self.annotation] = None
-                else:
-                    r[self.annotation] = deserialize_user_data(
-                        result['UserData']['Value'])
+                if r['InstanceId'] not in user_data:
+                    continue
+                r[self.annotation] = user_data[r['InstanceId']]
             if self.match(r):
                 results.append(r)
         return results
@@ -1636,20 +1706,12 @@ class InstanceAttribute(ValueFilter):
         attribute = self.data['attribute']
         self.get_instance_attribute(resources, attribute)
         return [resource for resource in resources
-                if self.match(resource['c7n:attribute-%s' % attribute])]
+                if resource['c7n:attribute-%s' % attribute] is not None and
+                self.match(resource['c7n:attribute-%s' % attribute])]
 
     def get_instance_attribute(self, resources, attribute):
-        client = utils.local_session(
-            self.manager.session_factory).client('ec2')
-
+        values = InstanceAttributes.get(self.manager).fetch(
+            resources, attribute)
         for resource in resources:
-            instance_id = resource['InstanceId']
-            fetched_attribute = self.manager.retry(
-                client.describe_instance_attribute,
-                Attribute=attribute,
-                InstanceId=instance_id)
-            keys = list(fetched_attribute.keys())
-            keys.remove('ResponseMetadata')
-            keys.remove('InstanceId')
-            resource['c7n:attribute-%s' % attribute] = fetched_attribute[
-                keys[0]]
+            resource['c7n:attribute-%s' % attribute] = values.get(
+                resource['InstanceId'])
@@ -21,7 +21,6 @@ from datetime import datetime
 
 from concurrent.futures import as_completed
 from dateutil.tz import tzutc
-from dateutil.parser import parse
 
 from c7n.actions import (
     ActionRegistry, BaseAction, ModifyVpcSecurityGroupsAction)
@@ -32,7 +31,7 @@ from c7n.query import QueryResourceManager
 from c7n.tags import universal_augment
 from c7n.utils import (
     local_session, generate_arn,
-    get_retry, chunks, snapshot_identifier, type_schema)
+    get_retry, chunks, snapshot_identifier, type_schema, parse_date)
 
 log = logging.getLogger('custodian.elasticache')
 
@@ -346,7 +345,7 @@ class ElastiCacheSnapshotAge(AgeFilter):
         """
         def to_datetime(v):
             if not isinstance(v, datetime):
-                v = parse(v)
+                v = parse_date(v)
             if not v.tzinfo:
                 v = v.replace(tzinfo=tzutc())
             return v
@@ -18,6 +18,7 @@ import datetime
 import io
 from datetime import timedelta
 import itertools
+import threading
 import time
 
 from concurrent.futures import as_completed
@@ -27,6 +28,7 @@ from botocore.exceptions import ClientError
 from collections import OrderedDict
 
 from c7n.actions import BaseAction
+from c7n.cache import SharedCache
 from c7n.filters import ValueFilter, Filter, OPERATORS
 from c7n.filters.iamaccess import CrossAccountAccessFilter
 from c7n.manager import resources
@@ -202,6 +204,102 @@ class ServerCertificate(QueryResourceManager):
         global_resource = True
 
 
+class AuthorizationSnapshot(object):
+    """Account wide view of iam users, groups, roles and their policies.
+
+    Built from a single paged GetAccountAuthorizationDetails call, and
+    shared by the iam filters of all policies against the same account
+    in a process, instead of making several api calls per entity.
+    """
+
+    # Below this many resources, per entity api calls are cheaper
+    # than fetching the authorization details of the whole account.
+    threshold = 50
+
+    permissions = ('iam:GetAccountAuthorizationDetails',)
+
+    _snapshots = SharedCache()
+    _lock = threading.Lock()
+
+    group_keys = ('Path', 'GroupName', 'GroupId', 'Arn', 'CreateDate')
+
+    def __init__(self, details):
+        self.users = {u['UserName']: u for u in details['UserDetailList']}
+        self.groups = {g['GroupName']: g for g in details['GroupDetailList']}
+        self.roles = {r['RoleName']: r for r in details['RoleDetailList']}
+        self.policies = {}
+        for p in details['Policies']:
+            p = dict(p)
+            p.pop('PolicyVersionList', None)
+            self.policies[p['Arn']] = p
+        self.members = {}
+        for u in self.users.values():
+            for g in u.get('GroupList', ()):
+                self.members.setdefault(g, []).append(u['UserName'])
+
+    @classmethod
+    def for_resources(cls, manager, resources):
+        """Return the account snapshot if its worth using for resources."""
+        if len(resources) < cls.threshold:
+            return None
+        with cls._lock:
+            snapshot = cls._snapshots.get(manager)
+            if snapshot is None:
+                snapshot = cls(cls.fetch(manager.session_factory))
+                cls._snapshots.save(manager, snapshot)
+        return snapshot
+
+    @staticmethod
+    def fetch(session_factory):
+        client = local_session(session_factory).client('iam')
+        paginator = client.get_paginator('get_account_authorization_details')
+        details = {'UserDetailList': [], 'GroupDetailList': [],
+                   'RoleDetailList': [], 'Policies': []}
+        for page in paginator.paginate(
+                Filter=['User', 'Role', 'Group',
+                        'LocalManagedPolicy', 'AWSManagedPolicy']):
+            for k in details:
+                details[k].extend(page.get(k, ()))
+        return details
+
+    def inline_policies(self, entity_type, name):
+        """Inline policy names of a user, group or role.
+
+        Returns None for entities created after the snapshot was taken.
+        """
+        entities = getattr(self, '%ss' % entity_type)
+        if name not in entities:
+            return None
+        return [p['PolicyName'] for p in entities[name].get(
+            '%sPolicyList' % entity_type.title(), ())]
+
+    def user_policies(self, client, name):
+        if name not in self.users:
+            return None
+        results = []
+        for ap in self.users[name].get('AttachedManagedPolicies', ()):
+            if ap['PolicyArn'] not in self.policies:
+                self.policies[ap['PolicyArn']] = client.get_policy(
+                    PolicyArn=ap['PolicyArn'])['Policy']
+            results.append(self.policies[ap['PolicyArn']])
+        return results
+
+    def user_groups(self, name):
+        if name not in self.users:
+            return None
+        results = []
+        for g in self.users[name].get('GroupList', ()):
+            if g in self.groups:
+                results.append({k: self.groups[g][k] for k in self.group_keys
+                                if k in self.groups[g]})
+        return results
+
+    def group_users(self, name):
+        if name not in self.groups:
+            return None
+        return self.members.get(name, [])
+
+
 class IamRoleUsage(Filter):
 
     def get_permissions(self):
@@ -373,20 +471,24 @@ class IamRoleInlinePolicy(Filter):
     """
 
     schema = type_schema('has-inline-policy', value={'type': 'boolean'})
-    permissions = ('iam:ListRolePolicies',)
-
-    def _inline_policies(self, client, resource):
-        policies = client.list_role_policies(
-            RoleName=resource['RoleName'])['PolicyNames']
+    permissions = ('iam:ListRolePolicies',) + AuthorizationSnapshot.permissions
+
+    def _inline_policies(self, client, resource, snapshot=None):
+        policies = snapshot and snapshot.inline_policies(
+            'role', resource['RoleName'])
+        if policies is None:
+            policies = client.list_role_policies(
+                RoleName=resource['RoleName'])['PolicyNames']
         resource['c7n:InlinePolicies'] = policies
         return resource
 
     def process(self, resources, event=None):
         c = local_session(self.manager.session_factory).client('iam')
+        snapshot = AuthorizationSnapshot.for_resources(self.manager, resources)
         res = []
         value = self.data.get('value', True)
         for r in resources:
-            r = self._inline_policies(c, r)
+            r = self._inline_policies(c, r, snapshot)
             if len(r['c7n:InlinePolicies']) > 0 and value:
                 res.append(r)
             if len(r['c7n:InlinePolicies']) == 0 and not value:
@@ -756,7 +858,7 @@ class CredentialReport(Filter):
             'default': True,
             'type': 'boolean'},
         report_delay={
-            'title': 'Number of seconds to wait for report generation.',
+            'title': 'Max number of seconds to wait for report generation.',
             'default': 10,
             'type': 'number'},
         report_max_age={
@@ -773,16 +875,43 @@ class CredentialReport(Filter):
     permissions = ('iam:GenerateCredentialReport',
                    'iam:GetCredentialReport')
 
+    matcher = None
+
+    # Parsed reports by account, shared by the user and account
+    # policies in a process, until older than report_max_age.
+    _reports = SharedCache(period=None)
+    _lock = threading.Lock()
+
     def get_value_or_schema_default(self, k):
         if k in self.data:
             return self.data[k]
         return self.schema['properties'][k]['default']
 
+    def get_report_threshold(self, generated):
+        threshold = datetime.datetime.now(tz=tzutc()) - timedelta(
+            seconds=self.get_value_or_schema_default('report_max_age'))
+        if not generated.tzinfo:
+            threshold = threshold.replace(tzinfo=None)
+        return threshold
+
     def get_credential_report(self):
-        report = self.manager._cache.get('iam-credential-report')
-        if report:
-            return report
-        data = self.fetch_credential_report()
+        with self._lock:
+            entry = self._reports.get(self.manager)
+            if entry and entry[0] >= self.get_report_threshold(entry[0]):
+                return entry[1]
+            report = self.manager._cache.get('iam-credential-report')
+            if report:
+                return report
+            response = self.fetch_credential_report()
+            report = self.parse_credential_report(response['Content'])
+            self._reports.save(
+                self.manager, (response['GeneratedTime'], report))
+        self.manager._cache.save('iam-credential-report', report)
+        return report
+
+    @classmethod
+    def parse_credential_report(cls, data):
+        """Index the report csv by user name, with values type converted."""
         report = {}
         if isinstance(data, six.binary_type):
             reader = csv.reader(io.StringIO(data.decode('utf-8')))
@@ -791,8 +920,7 @@ class CredentialReport(Filter):
         headers = next(reader)
         for line in reader:
             info = dict(zip(headers, line))
-            report[info['user']] = self.process_user_record(info)
-        self.manager._cache.save('iam-credential-report', report)
+            report[info['user']] = cls.process_user_record(info)
         return report
 
     @classmethod
@@ -824,40 +952,57 @@ class CredentialReport(Filter):
             if e.response['Error']['Code'] != 'ReportNotPresent':
                 raise
             report = None
-        if report:
-            threshold = datetime.datetime.now(tz=tzutc()) - timedelta(
-                seconds=self.get_value_or_schema_default(
-                    'report_max_age'))
-            if not report['GeneratedTime'].tzinfo:
-                threshold = threshold.replace(tzinfo=None)
-            if report['GeneratedTime'] < threshold:
-                report = None
+        if report and report['GeneratedTime'] < self.get_report_threshold(
+                report['GeneratedTime']):
+            report = None
         if report is None:
             if not self.get_value_or_schema_default('report_generate'):
                 raise ValueError("Credential Report Not Present")
-            client.generate_credential_report()
-            time.sleep(self.get_value_or_schema_default('report_delay'))
-            report = client.get_credential_report()
-        return report['Content']
+            state = client.generate_credential_report()['State']
+            report = self.wait_credential_report(client, state)
+        return report
+
+    def wait_credential_report(self, client, state):
+        """Poll for a generating report, backing off up to report_delay."""
+        max_wait = self.get_value_or_schema_default('report_delay')
+        delay, waited = min(0.5, max_wait), 0
+        while True:
+            if state != 'COMPLETE':
+                time.sleep(delay)
+                waited += delay
+                delay = min(delay * 2, max_wait - waited)
+            try:
+                return client.get_credential_report()
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ReportInProgress':
+                    raise
+                if waited >= max_wait:
+                    raise
+                state = None
+
+    def get_matcher(self):
+        if self.matcher is not None:
+            return self.matcher
+        config = dict(self.data)
+        if '.' in config['key']:
+            config['key'] = config['key'].split('.', 1)[1]
+        self.matcher = ValueFilter(config)
+        self.matcher.annotate = False
+        return self.matcher
 
     def process(self, resources, event=None):
-        if '.' in self.data['key']:
-            self.matcher_config = dict(self.data)
-            self.matcher_config['key'] = self.data['key'].split('.', 1)[1]
+        self.get_matcher()
         return []
 
     def match(self, info):
         if info is None:
             return False
         k = self.data.get('key')
+        vf = self.get_matcher()
         if '.' not in k:
-            vf = ValueFilter(self.data)
-            vf.annotate = False
             return vf(info)
 
         prefix, sk = k.split('.', 1)
-        vf = ValueFilter(self.matcher_config)
-        vf.annotate = False
         for v in info.get(prefix, ()):
             if vf.match(v):
                 return True
@@ -890,19 +1035,24 @@ class IamUserInlinePolicy(Filter):
     """
 
     schema = type_schema('has-inline-policy', value={'type': 'boolean'})
-    permissions = ('iam:ListUserPolicies',)
-
-    def _inline_policies(self, client, resource):
-        resource['c7n:InlinePolicies'] = client.list_user_policies(
-            UserName=resource['UserName'])['PolicyNames']
+    permissions = ('iam:ListUserPolicies',) + AuthorizationSnapshot.permissions
+
+    def _inline_policies(self, client, resource, snapshot=None):
+        policies = snapshot and snapshot.inline_policies(
+            'user', resource['UserName'])
+        if policies is None:
+            policies = client.list_user_policies(
+                UserName=resource['UserName'])['PolicyNames']
+        resource['c7n:InlinePolicies'] = policies
         return resource
 
     def process(self, resources, event=None):
         c = local_session(self.manager.session_factory).client('iam')
+        snapshot = AuthorizationSnapshot.for_resources(self.manager, resources)
         value = self.data.get('value', True)
         res = []
         for r in resources:
-            r = self._inline_policies(c, r)
+            r = self._inline_policies(c, r, snapshot)
             if len(r['c7n:InlinePolicies']) > 0 and value:
                 res.append(r)
             if len(r['c7n:InlinePolicies']) == 0 and not value:
@@ -928,11 +1078,17 @@ class UserPolicy(ValueFilter):
     """
 
     schema = type_schema('policy', rinherit=ValueFilter.schema)
-    permissions = ('iam:ListAttachedUserPolicies',)
+    permissions = (
+        'iam:ListAttachedUserPolicies',) + AuthorizationSnapshot.permissions
 
-    def user_policies(self, user_set):
+    def user_policies(self, user_set, snapshot=None):
         client = local_session(self.manager.session_factory).client('iam')
         for u in user_set:
+            policies = snapshot and snapshot.user_policies(
+                client, u['UserName'])
+            if policies is not None:
+                u['c7n:Policies'] = policies
+                continue
             if 'c7n:Policies' not in u:
                 u['c7n:Policies'] = []
             aps = client.list_attached_user_policies(
@@ -942,12 +1098,19 @@ class UserPolicy(ValueFilter):
                     client.get_policy(PolicyArn=ap['PolicyArn'])['Policy'])
 
     def process(self, resources, event=None):
+        snapshot = AuthorizationSnapshot.for_resources(self.manager, resources)
+        if snapshot is not None:
+            self.user_policies(resources, snapshot)
+            return self.match_policies(resources)
+
         user_set = chunks(resources, size=50)
         with self.executor_factory(max_workers=2) as w:
             self.log.debug(
                 "Querying %d users policies" % len(resources))
             list(w.map(self.user_policies, user_set))
+        return self.match_policies(resources)
 
+    def match_policies(self, resources):
         matched = []
         for r in resources:
             for p in r['c7n:Policies']:
@@ -974,7 +1137,7 @@ class GroupMembership(ValueFilter):
     """
 
     schema = type_schema('group', rinherit=ValueFilter.schema)
-    permissions = ('iam:ListGroupsForUser',)
+    permissions = ('iam:ListGroupsForUser',) + AuthorizationSnapshot.permissions
 
     def get_user_groups(self, client, user_set):
         for u in user_set:
@@ -983,10 +1146,20 @@ class GroupMembership(ValueFilter):
 
     def process(self, resources, event=None):
         client = local_session(self.manager.session_factory).client('iam')
+        query_resources = [r for r in resources if 'c7n:Groups' not in r]
+        snapshot = AuthorizationSnapshot.for_resources(
+            self.manager, query_resources)
+        if snapshot is not None:
+            for r in query_resources:
+                groups = snapshot.user_groups(r['UserName'])
+                if groups is not None:
+                    r['c7n:Groups'] = groups
+            query_resources = [
+                r for r in query_resources if 'c7n:Groups' not in r]
+
         with self.executor_factory(max_workers=2) as w:
             futures = []
-            for user_set in chunks(
-                    [r for r in resources if 'c7n:Groups' not in r], size=50):
+            for user_set in chunks(query_resources, size=50):
                 futures.append(
                     w.submit(self.get_user_groups, client, user_set))
             for f in as_completed(futures):
@@ -1405,16 +1578,20 @@ class IamGroupUsers(Filter):
             value: False
     """
     schema = type_schema('has-users', value={'type': 'boolean'})
-    permissions = ('iam:GetGroup',)
+    permissions = ('iam:GetGroup',) + AuthorizationSnapshot.permissions
 
-    def _user_count(self, client, resource):
-        return len(client.get_group(GroupName=resource['GroupName'])['Users'])
+    def _user_count(self, client, resource, snapshot=None):
+        users = snapshot and snapshot.group_users(resource['GroupName'])
+        if users is None:
+            users = client.get_group(GroupName=resource['GroupName'])['Users']
+        return len(users)
 
     def process(self, resources, events=None):
         c = local_session(self.manager.session_factory).client('iam')
+        snapshot = AuthorizationSnapshot.for_resources(self.manager, resources)
         if self.data.get('value', True):
-            return [r for r in resources if self._user_count(c, r) > 0]
-        return [r for r in resources if self._user_count(c, r) == 0]
+            return [r for r in resources if self._user_count(c, r, snapshot) > 0]
+        return [r for r in resources if self._user_count(c, r, snapshot) == 0]
 
 
 @Group.filter_registry.register('has-inline-policy')
@@ -1434,19 +1611,24 @@ class IamGroupInlinePolicy(Filter):
             value: True
     """
     schema = type_schema('has-inline-policy', value={'type': 'boolean'})
-    permissions = ('iam:ListGroupPolicies',)
-
-    def _inline_policies(self, client, resource):
-        resource['c7n:InlinePolicies'] = client.list_group_policies(
-            GroupName=resource['GroupName'])['PolicyNames']
+    permissions = ('iam:ListGroupPolicies',) + AuthorizationSnapshot.permissions
+
+    def _inline_policies(self, client, resource, snapshot=None):
+        policies = snapshot and snapshot.inline_policies(
+            'group', resource['GroupName'])
+        if policies is None:
+            policies = client.list_group_policies(
+                GroupName=resource['GroupName'])['PolicyNames']
+        resource['c7n:InlinePolicies'] = policies
         return resource
 
     def process(self, resources, events=None):
         c = local_session(self.manager.session_factory).client('iam')
+        snapshot = AuthorizationSnapshot.for_resources(self.manager, resources)
         value = self.data.get('value', True)
         res = []
         for r in resources:
-            r = self._inline_policies(c, r)
+            r = self._inline_policies(c, r, snapshot)
             if len(r['c7n:InlinePolicies']) > 0 and value:
                 res.append(r)
             if len(r['c7n:InlinePolicies']) == 0 and not value:
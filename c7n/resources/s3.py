@@ -39,15 +39,24 @@ Actions:
 """
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import collections
 import copy
+import csv
+import datetime
+import fnmatch
 import functools
+import gzip
+import io
 import json
 import itertools
 import logging
 import math
 import os
+import tempfile
+import threading
 import time
 import ssl
+import weakref
 
 import six
 
@@ -58,9 +67,12 @@ from botocore.vendored.requests.exceptions import SSLError
 from collections import defaultdict
 from concurrent.futures import as_completed
 from dateutil.parser import parse as parse_date
+from dateutil.tz import tzutc
+from six.moves.urllib_parse import unquote_plus
 
 from c7n.actions import (
     ActionRegistry, BaseAction, PutMetric, RemovePolicyBase)
+from c7n.cache import SharedCache, shared_cache
 from c7n.exceptions import PolicyValidationError
 from c7n.filters import (
     FilterRegistry, Filter, CrossAccountAccessFilter, MetricsFilter,
@@ -121,14 +133,222 @@ class S3(query.QueryResourceManager):
 
 class DescribeS3(query.DescribeSource):
 
+    regions_loaded = False
+
+    def resources(self, query):
+        buckets = super(DescribeS3, self).resources(query)
+        store = BucketStateStore.get(self.manager)
+        if store is not None:
+            store.retain([b['Name'] for b in buckets])
+        return buckets
+
     def augment(self, buckets):
+        if not DescribeS3.regions_loaded:
+            load_bucket_regions(self.manager.config)
+            DescribeS3.regions_loaded = True
+        store = BucketStateStore.get(self.manager)
+        if store is not None:
+            fetch = store.get_stale(self.manager.session_factory, buckets)
+        else:
+            fetch = buckets
         with self.manager.executor_factory(
-                max_workers=min((10, len(buckets) + 1))) as w:
+                max_workers=min((10, len(fetch) + 1))) as w:
             results = w.map(
                 assemble_bucket,
-                zip(itertools.repeat(self.manager.session_factory), buckets))
+                zip(itertools.repeat(self.manager.session_factory), fetch))
             results = list(filter(None, results))
+        if fetch:
+            save_bucket_regions(self.manager.config)
+        if store is None:
             return results
+        store.update(results, [b['Name'] for b in fetch])
+        return [store.get_bucket(b['Name']) for b in buckets if b['Name'] in store]
+
+
+class BucketStateStore(object):
+    """Assembled bucket documents persisted across runs.
+
+    Bucket configuration changes rarely, so rather than fetching every
+    augment for every bucket on each run, we keep the documents on disk,
+    and only refetch buckets that are new, or that have write api events
+    in cloudtrail since our last sweep.
+
+    Enabled with the `s3_state` option, the path of a json file holding
+    the state of each account and region that policies run against.
+    Buckets no longer listed are evicted, and datetimes in the documents
+    are tagged in the file so they're restored as datetimes on load.
+    """
+
+    # Seconds of cloudtrail event delivery lag we allow for.
+    event_lag = 15 * 60
+    # Beyond this many seconds since the last sweep, fetch everything.
+    max_age = 7 * 24 * 60 * 60
+
+    _stores = SharedCache(period=None)
+    _lock = threading.Lock()
+
+    def __init__(self, path, name):
+        self.path = os.path.abspath(os.path.expanduser(path))
+        self.name = name
+        self.buckets = {}
+        self.swept = None
+        # names of buckets known to be stale, computed once per process
+        self.stale = None
+        self.pending = set()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def get(cls, manager):
+        path = getattr(manager.config, 's3_state', None)
+        if not path:
+            return None
+        account_id = getattr(manager.config, 'account_id', None)
+        if account_id is None:
+            log.warning("s3 state is kept per account, no account id to use")
+            return None
+        with cls._lock:
+            store = cls._stores.get(manager, path)
+            if store is None:
+                store = cls(path, "%s:%s" % (account_id, manager.config.region))
+                store.load()
+                cls._stores.save(manager, store, path)
+            return store
+
+    def __contains__(self, name):
+        return name in self.buckets
+
+    def get_bucket(self, name):
+        return copy.deepcopy(self.buckets[name])
+
+    def read(self):
+        if not os.path.isfile(self.path):
+            return {}
+        try:
+            with open(self.path) as fh:
+                return json.load(fh, object_hook=self.decode)
+        except ValueError as e:
+            log.warning("Could not load s3 state %s err: %s", self.path, e)
+            return {}
+
+    def load(self):
+        state = self.read().get(self.name)
+        if not state:
+            return
+        self.swept = state['swept']
+        self.buckets = state['buckets']
+        self.pending = set(state['pending'])
+
+    @staticmethod
+    def encode(value):
+        if isinstance(value, datetime.datetime):
+            return {'c7n:datetime': value.isoformat()}
+        raise TypeError("%r is not JSON serializable" % (value,))
+
+    @staticmethod
+    def decode(value):
+        if len(value) == 1 and 'c7n:datetime' in value:
+            return parse_date(value['c7n:datetime'])
+        return value
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        pending = self.pending if self.stale is None else self.stale
+        # Stores for other accounts and regions share the file.
+        with self._lock:
+            state = self.read()
+            state[self.name] = {
+                'swept': self.swept, 'buckets': self.buckets,
+                'pending': sorted(pending)}
+            fd, tmp = tempfile.mkstemp(dir=directory)
+            with os.fdopen(fd, 'w') as fh:
+                json.dump(state, fh, default=self.encode)
+            os.rename(tmp, self.path)
+
+    def retain(self, names):
+        """Evict buckets missing from a full listing, ie. deleted.
+
+        Otherwise they'd be kept forever, and their regions searched for
+        events on every sweep.
+        """
+        names = set(names)
+        with self.lock:
+            for name in set(self.buckets).difference(names):
+                del self.buckets[name]
+            self.pending.intersection_update(names)
+            if self.stale is not None:
+                self.stale.intersection_update(names)
+
+    def get_stale(self, session_factory, buckets):
+        """Return the buckets that need fetching, ie. new or changed."""
+        with self.lock:
+            if self.stale is None:
+                now = time.time()
+                changed = self.get_changed(session_factory)
+                if changed is None:
+                    self.stale = set(self.buckets)
+                else:
+                    self.stale = changed.union(self.pending)
+                self.swept = now
+            return [b for b in buckets if b['Name'] in self.stale or
+                    b['Name'] not in self.buckets or
+                    self.buckets[b['Name']].get('CreationDate') != b.get(
+                        'CreationDate')]
+
+    def get_changed(self, session_factory):
+        """Names of buckets with write events since the last sweep.
+
+        Returns None if we can't tell, and every bucket is stale.
+        """
+        if self.swept is None or time.time() - self.swept > self.max_age:
+            return None
+        start = datetime.datetime.fromtimestamp(
+            self.swept - self.event_lag, tz=tzutc())
+        regions = set(
+            b.get('Location') and get_region(b) or 'us-east-1'
+            for b in self.buckets.values())
+        changed = set()
+        session = local_session(session_factory)
+        for region in regions:
+            try:
+                client = session.client('cloudtrail', region_name=region)
+                for page in client.get_paginator('lookup_events').paginate(
+                        LookupAttributes=[{
+                            'AttributeKey': 'EventSource',
+                            'AttributeValue': 's3.amazonaws.com'}],
+                        StartTime=start):
+                    for e in page['Events']:
+                        if e.get('ReadOnly') == 'true':
+                            continue
+                        changed.update(
+                            r['ResourceName'] for r in e.get('Resources', ())
+                            if r.get('ResourceType') == 'AWS::S3::Bucket')
+            except Exception as e:
+                log.warning(
+                    "Unable to lookup s3 events in %s, refetching all buckets: %s",
+                    region, e)
+                return None
+        log.debug("s3 state %d of %d buckets changed since last sweep",
+                  len(changed), len(self.buckets))
+        return changed
+
+    def update(self, buckets, fetched=()):
+        """Record assembled buckets.
+
+        Fetched buckets that couldn't be assembled (ie. deleted) are
+        evicted, rather than served from the state on later runs.
+        """
+        with self.lock:
+            for b in buckets:
+                self.buckets[b['Name']] = copy.deepcopy(b)
+                self.stale.discard(b['Name'])
+            assembled = set(b['Name'] for b in buckets)
+            for name in fetched:
+                if name not in assembled:
+                    self.buckets.pop(name, None)
+                    self.stale.discard(name)
+            self.save()
 
 
 class ConfigS3(query.ConfigSource):
@@ -405,14 +625,19 @@ S3_AUGMENT_TABLE = (
 def assemble_bucket(item):
     """Assemble a document representing all the config state around a bucket.
 
-    TODO: Refactor this, the logic here feels quite muddled.
+    Calls are routed to the bucket's region when known from a previous
+    lookup, else we discover it via the location call that goes first.
     """
     factory, b = item
-    s = factory()
-    c = s.client('s3')
-    # Bucket Location, Current Client Location, Default Location
-    b_location = c_location = location = "us-east-1"
+    s = local_session(factory)
+    region = BUCKET_REGIONS.get(b['Name'])
     methods = list(S3_AUGMENT_TABLE)
+    if region is not None:
+        b['Location'] = {
+            'LocationConstraint': region != 'us-east-1' and region or None}
+        methods = methods[1:]
+    c_region = region or s.region_name or 'us-east-1'
+    c = region_client(s, c_region)
     for m, k, default, select in methods:
         try:
             method = getattr(c, m)
@@ -430,10 +655,15 @@ def assemble_bucket(item):
             code = e.response['Error']['Code']
             if code.startswith("NoSuch") or "NotFound" in code:
                 v = default
-            elif code == 'PermanentRedirect':
-                s = factory()
-                c = bucket_client(s, b)
-                # Requeue with the correct region given location constraint
+            elif code == 'PermanentRedirect' and get_redirect_region(
+                    e, b) != c_region:
+                # Our known region is stale, requeue against the bucket's
+                # region per the redirect.
+                c_region = BUCKET_REGIONS[b['Name']] = get_redirect_region(e, b)
+                b['Location'] = {
+                    'LocationConstraint': (
+                        c_region != 'us-east-1' and c_region or None)}
+                c = region_client(s, c_region)
                 methods.append((m, k, default, select))
                 continue
             else:
@@ -463,26 +693,80 @@ def assemble_bucket(item):
             elif b_location == 'EU':
                 b_location = "eu-west-1"
                 v['LocationConstraint'] = 'eu-west-1'
-            if v and v != c_location:
-                c = s.client('s3', region_name=b_location)
-            elif c_location != location:
-                c = s.client('s3', region_name=location)
+            BUCKET_REGIONS[b['Name']] = b_location
+            if b_location != c_region:
+                c_region = b_location
+                c = region_client(s, c_region)
         b[k] = v
     return b
 
 
+# Bucket name to region, shared by augments and actions in a process.
+BUCKET_REGIONS = shared_cache({})
+
+# Pooled s3 clients by session, and region.
+_region_clients = weakref.WeakKeyDictionary()
+_region_clients_lock = threading.Lock()
+
+
+def region_client(session, region, kms=False):
+    """Get a pooled s3 client for the session and region."""
+    with _region_clients_lock:
+        clients = _region_clients.setdefault(session, {})
+        if (region, kms) not in clients:
+            if kms:
+                # Need v4 signature for aws:kms crypto, else let the sdk decide
+                # based on region support.
+                config = Config(
+                    signature_version='s3v4',
+                    read_timeout=200, connect_timeout=120)
+            else:
+                config = Config(read_timeout=200, connect_timeout=120)
+            clients[(region, kms)] = session.client(
+                's3', region_name=region, config=config)
+        return clients[(region, kms)]
+
+
+def get_redirect_region(error, b):
+    """Region of a bucket per a PermanentRedirect error."""
+    headers = error.response.get('ResponseMetadata', {}).get('HTTPHeaders', {})
+    return headers.get('x-amz-bucket-region') or get_region(b)
+
+
+def get_bucket_regions_path(config):
+    cache = getattr(config, 'cache', None)
+    if not cache or cache == 'memory' or not getattr(config, 'cache_period', 0):
+        return None
+    return os.path.abspath(
+        os.path.expanduser(os.path.expandvars(cache))) + '.s3-regions'
+
+
+def load_bucket_regions(config):
+    """Load bucket regions persisted alongside the resource cache."""
+    path = get_bucket_regions_path(config)
+    if path is None or not os.path.isfile(path):
+        return
+    try:
+        with open(path) as fh:
+            regions = json.load(fh)
+    except ValueError:
+        return
+    for name, region in regions.items():
+        BUCKET_REGIONS.setdefault(name, region)
+
+
+def save_bucket_regions(config):
+    path = get_bucket_regions_path(config)
+    if path is None or not os.path.isdir(os.path.dirname(path)):
+        return
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, 'w') as fh:
+        json.dump(dict(BUCKET_REGIONS), fh)
+    os.rename(tmp, path)
+
+
 def bucket_client(session, b, kms=False):
-    region = get_region(b)
-
-    if kms:
-        # Need v4 signature for aws:kms crypto, else let the sdk decide
-        # based on region support.
-        config = Config(
-            signature_version='s3v4',
-            read_timeout=200, connect_timeout=120)
-    else:
-        config = Config(read_timeout=200, connect_timeout=120)
-    return session.client('s3', region_name=region, config=config)
+    return region_client(session, get_region(b), kms)
 
 
 def modify_bucket_tags(session_factory, buckets, add_tags=(), remove_tags=()):
@@ -539,6 +823,8 @@ def get_region(b):
     Returns:
         string: an aws region string
     """
+    if not b.get('Location') and b.get('Name') in BUCKET_REGIONS:
+        return BUCKET_REGIONS[b['Name']]
     remap = {None: 'us-east-1', 'EU': 'eu-west-1'}
     region = b.get('Location', {}).get('LocationConstraint')
     return remap.get(region, region)
@@ -1500,6 +1786,7 @@ class BucketScanLog(object):
         self.name = name
         self.fh = None
         self.count = 0
+        self.lock = threading.Lock()
 
     @property
     def path(self):
@@ -1528,16 +1815,133 @@ class BucketScanLog(object):
         return False
 
     def add(self, keys):
-        self.count += len(keys)
-        if self.fh is None:
-            return
-        self.fh.write(dumps(keys))
-        self.fh.write(",\n")
+        with self.lock:
+            self.count += len(keys)
+            if self.fh is None:
+                return
+            self.fh.write(dumps(keys))
+            self.fh.write(",\n")
+
+
+class ScanCheckpoint(object):
+    """Resumable position of each partition of a bucket scan.
+
+    Positions are the listing parameters to continue a partition from,
+    or True for a completed partition. They're written to a json file
+    next to the scan log as pages of keys complete, and the file is
+    removed when the bucket scan finishes, so an interrupted scan of a
+    large bucket resumes where it left off on the next run.
+    """
+
+    def __init__(self, log_dir, name):
+        self.log_dir = log_dir
+        self.name = name
+        self.positions = {}
+        self.lock = threading.Lock()
+
+    @property
+    def path(self):
+        return os.path.join(self.log_dir, "%s.checkpoint.json" % self.name)
+
+    def load(self):
+        if self.log_dir is None or not os.path.exists(self.path):
+            return self
+        with open(self.path) as fh:
+            self.positions = json.load(fh)
+        return self
+
+    def get(self, partition):
+        return self.positions.get(partition)
+
+    def set(self, partition, position):
+        with self.lock:
+            self.positions[partition] = position
+            if self.log_dir is None:
+                return
+            fd, path = tempfile.mkstemp(dir=self.log_dir)
+            with os.fdopen(fd, 'w') as fh:
+                json.dump(self.positions, fh)
+            os.rename(path, self.path)
+
+    def clear(self):
+        self.positions = {}
+        if self.log_dir is not None and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class ScanProgress(object):
+    """Throughput and estimated time to completion of a bucket scan.
+
+    The total is the bucket's daily NumberOfObjects storage metric,
+    only fetched once a scan runs past its first page of keys.
+    """
+
+    def __init__(self, bucket, session_factory):
+        self.bucket = bucket
+        self.session_factory = session_factory
+        self.count = 0
+        self.total = None
+        self.start = time.time()
+        self.lock = threading.Lock()
+
+    def add(self, count):
+        with self.lock:
+            self.count += count
+
+    @property
+    def rate(self):
+        return self.count / max(time.time() - self.start, 0.001)
+
+    @property
+    def eta(self):
+        if not self.total or not self.count:
+            return None
+        return max(self.total - self.count, 0) / self.rate
+
+    def get_object_count(self):
+        client = local_session(self.session_factory).client(
+            'cloudwatch', region_name=get_region(self.bucket))
+        now = datetime.datetime.utcnow()
+        try:
+            points = client.get_metric_statistics(
+                Namespace='AWS/S3',
+                MetricName='NumberOfObjects',
+                Dimensions=[
+                    {'Name': 'BucketName', 'Value': self.bucket['Name']},
+                    {'Name': 'StorageType', 'Value': 'AllStorageTypes'}],
+                StartTime=now - datetime.timedelta(days=3),
+                EndTime=now,
+                Period=86400,
+                Statistics=['Average']).get('Datapoints', ())
+        except ClientError as e:
+            log.debug("Unable to get object count bucket:%s error:%s",
+                      self.bucket['Name'], e)
+            return None
+        if not points:
+            return None
+        points = sorted(points, key=lambda p: p['Timestamp'])
+        return int(points[-1]['Average'])
+
+    def report(self, remediated):
+        with self.lock:
+            if self.total is None:
+                self.total = self.get_object_count() or 0
+        eta = self.eta
+        log.debug(
+            'Scan progress bucket:%s keys:%d remediated:%d '
+            'rate:%0.2f/s eta:%s',
+            self.bucket['Name'], self.count, remediated, self.rate,
+            eta is None and 'unknown' or '%0.0fs' % eta)
 
 
 class ScanBucket(BucketActionBase):
 
-    permissions = ("s3:ListBucket",)
+    permissions = ("s3:ListBucket", "cloudwatch:GetMetricStatistics")
+
+    # Pages of listed keys processing while listing continues
+    max_pending_pages = 4
+    # Partitions of a bucket listed concurrently
+    partition_workers = 3
 
     bucket_ops = {
         'standard': {
@@ -1615,17 +2019,26 @@ class ScanBucket(BucketActionBase):
 
         s = self.manager.session_factory()
         s3 = bucket_client(s, b)
+        checkpoint = None
+        if self.data.get('checkpoint'):
+            checkpoint = ScanCheckpoint(self.manager.log_dir, b['Name']).load()
+        progress = ScanProgress(b, self.manager.session_factory)
 
         # The bulk of _process_bucket function executes inline in
         # calling thread/worker context, neither paginator nor
         # bucketscan log should be used across worker boundary.
-        p = s3.get_paginator(
-            self.get_bucket_op(b, 'iterator')).paginate(Bucket=b['Name'])
-
+        p = None
         with BucketScanLog(self.manager.log_dir, b['Name']) as key_log:
             with self.executor_factory(max_workers=10) as w:
                 try:
-                    return self._process_bucket(b, p, key_log, w)
+                    partitions = self.get_partitions(b, s3, checkpoint)
+                    if len(partitions) == 1:
+                        name, p = partitions[0]
+                        self._process_bucket(
+                            b, p, key_log, w, name, checkpoint, progress)
+                    else:
+                        self._process_partitions(
+                            b, partitions, key_log, w, checkpoint, progress)
                 except ClientError as e:
                     if e.response['Error']['Code'] == 'NoSuchBucket':
                         log.warning(
@@ -1639,43 +2052,217 @@ class ScanBucket(BucketActionBase):
                     log.exception(
                         "Error processing bucket:%s paginator:%s" % (
                             b['Name'], p))
+                    return
+
+        if checkpoint is not None:
+            checkpoint.clear()
+        log.info('Scan Complete bucket:%s keys:%d remediated:%d rate:%0.2f/s',
+                 b['Name'], progress.count, key_log.count, progress.rate)
+        b['KeyScanCount'] = progress.count
+        b['KeyRemediated'] = key_log.count
+        return {
+            'Bucket': b['Name'], 'Remediated': key_log.count,
+            'Count': progress.count}
 
     __call__ = process_bucket
 
-    def _process_bucket(self, b, p, key_log, w):
+    def get_partitions(self, b, s3, checkpoint=None):
+        """Return a list of (name, key set pages) for the bucket key space.
+
+        By default the bucket is a single partition listed in key order,
+        with `partition` each top level prefix is listed separately, and
+        with `inventory` each data file of the latest delivered inventory
+        is a partition, so very large buckets are not serially listed.
+        """
+        partitions = None
+        if self.data.get('inventory'):
+            partitions = self.get_inventory_partitions(b, s3)
+        if partitions is None and self.data.get('partition'):
+            partitions = [('/', {'Delimiter': '/'})]
+            pager = s3.get_paginator(self.get_bucket_op(b, 'iterator'))
+            for page in pager.paginate(Bucket=b['Name'], Delimiter='/'):
+                for prefix in page.get('CommonPrefixes', ()):
+                    partitions.append(
+                        (prefix['Prefix'], {'Prefix': prefix['Prefix']}))
+        if partitions is None:
+            partitions = [('', {})]
+
+        results = []
+        for name, params in partitions:
+            position = checkpoint and checkpoint.get(name) or None
+            if position is True:
+                continue
+            if callable(params):
+                results.append((name, params()))
+                continue
+            params = dict(params, Bucket=b['Name'])
+            if position:
+                log.info("Resuming scan bucket:%s partition:%s from:%s",
+                         b['Name'], name, position)
+                params.update(position)
+            results.append((name, s3.get_paginator(
+                self.get_bucket_op(b, 'iterator')).paginate(**params)))
+        return results or [('', iter(()))]
+
+    def get_inventory_partitions(self, b, s3):
+        """Partitions over the data files of the latest bucket inventory.
+
+        Returns None, to list the bucket, if there is no matching csv
+        inventory with a delivered manifest. Note objects written since
+        the inventory was generated are not scanned.
+        """
+        versioned = self.get_bucket_style(b) == 'versioned'
+        inventories = s3.list_bucket_inventory_configurations(
+            Bucket=b['Name']).get('InventoryConfigurationList', ())
+        for i in inventories:
+            dest = i['Destination']['S3BucketDestination']
+            if (not fnmatch.fnmatch(i['Id'], self.data['inventory']) or
+                    not i['IsEnabled'] or dest['Format'] != 'CSV' or
+                    versioned != (i['IncludedObjectVersions'] == 'All')):
+                continue
+            prefix = "%s/%s/%s/" % (
+                dest.get('Prefix', ''), b['Name'], i['Id'])
+            manifest = self.get_inventory_manifest(
+                b, dest['Bucket'].rsplit(':')[-1], prefix.lstrip('/'))
+            if manifest is not None:
+                return manifest
+        log.info("No inventory found bucket:%s, listing keys", b['Name'])
+        return None
+
+    def get_inventory_manifest(self, b, bucket, prefix):
+        client = bucket_client(
+            local_session(self.manager.session_factory), {'Name': bucket})
+        # Deliveries are in timestamp named folders, next to data/ and hive/
+        deliveries = [
+            p['Prefix'] for p in client.list_objects(
+                Bucket=bucket, Prefix=prefix, Delimiter='/').get(
+                    'CommonPrefixes', ())
+            if p['Prefix'][len(prefix):][:1].isdigit()]
+        if not deliveries:
+            return None
+        try:
+            manifest = json.loads(client.get_object(
+                Bucket=bucket,
+                Key="%smanifest.json" % max(deliveries))['Body'].read())
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'NoSuchKey':
+                raise
+            return None
+        schema = [f.strip() for f in manifest['fileSchema'].split(',')]
+        log.info("Scanning bucket:%s from inventory:%s files:%d",
+                 b['Name'], max(deliveries), len(manifest['files']))
+        return [(f['key'], functools.partial(
+            self.get_inventory_pages, b, client, bucket, f['key'], schema))
+            for f in manifest['files']]
+
+    def get_inventory_pages(self, b, client, bucket, key, schema):
+        """Key set pages, in listing response form, from an inventory file."""
+        contents_key = self.get_bucket_op(b, 'contents_key')[0]
+        fields = {n: schema.index(n) for n in (
+            'Key', 'VersionId', 'IsLatest', 'IsDeleteMarker',
+            'EncryptionStatus') if n in schema}
+        with tempfile.TemporaryFile() as fh:
+            body = client.get_object(Bucket=bucket, Key=key)['Body']
+            for data in iter(functools.partial(body.read, 1024 * 1024), b''):
+                fh.write(data)
+            fh.seek(0)
+            reader = gzip.GzipFile(fileobj=fh, mode='rb')
+            if six.PY3:
+                reader = io.TextIOWrapper(reader)
+            for rows in chunks(csv.reader(reader), 1000):
+                keys = []
+                for r in rows:
+                    if 'IsDeleteMarker' in fields and (
+                            r[fields['IsDeleteMarker']] == 'true'):
+                        continue
+                    k = {'Key': unquote_plus(r[fields['Key']])}
+                    if 'VersionId' in fields:
+                        k['VersionId'] = r[fields['VersionId']]
+                        k['IsLatest'] = r[fields['IsLatest']] == 'true'
+                    if 'EncryptionStatus' in fields:
+                        k['EncryptionStatus'] = r[fields['EncryptionStatus']]
+                    keys.append(k)
+                yield {contents_key: keys, 'IsTruncated': True,
+                       'Inventory': key}
+
+    def get_scan_position(self, b, key_set):
+        """Listing parameters to continue after the given page of keys."""
+        if 'Inventory' in key_set:
+            # inventory partitions resume per data file
+            return None
+        if self.get_bucket_style(b) == 'versioned':
+            if 'NextKeyMarker' not in key_set:
+                return None
+            return {'KeyMarker': key_set['NextKeyMarker'],
+                    'VersionIdMarker': key_set['NextVersionIdMarker']}
+        marker = key_set.get('NextMarker')
+        if marker is None and key_set.get('Contents'):
+            marker = key_set['Contents'][-1]['Key']
+        return marker and {'Marker': marker} or None
+
+    def _process_partitions(self, b, partitions, key_log, w, checkpoint,
+                            progress):
+        with self.executor_factory(max_workers=self.partition_workers) as lw:
+            futures = [
+                lw.submit(self._process_bucket, b, p, key_log, w,
+                          name, checkpoint, progress)
+                for name, p in partitions]
+            # Surface partition errors to the bucket.
+            for f in futures:
+                f.result()
+
+    def _process_bucket(self, b, p, key_log, w, partition='',
+                        checkpoint=None, progress=None):
+        """Process the keys of a bucket partition.
+
+        Listing continues while earlier pages of keys are processed, up
+        to `max_pending_pages`, pages complete in listing order so that
+        the checkpoint position never runs ahead of processed keys.
+        """
         count = 0
+        pending = collections.deque()
 
         for key_set in p:
             keys = self.get_keys(b, key_set)
             count += len(keys)
+            if progress is not None:
+                progress.add(len(keys))
             futures = []
 
             for batch in chunks(keys, size=100):
                 if not batch:
                     continue
                 futures.append(w.submit(self.process_chunk, batch, b))
-
-            for f in as_completed(futures):
-                if f.exception():
-                    log.exception("Exception Processing bucket:%s key batch %s" % (
-                        b['Name'], f.exception()))
-                    continue
-                r = f.result()
-                if r:
-                    key_log.add(r)
-
-            # Log completion at info level, progress at debug level
-            if key_set['IsTruncated']:
-                log.debug('Scan progress bucket:%s keys:%d remediated:%d ...',
-                          b['Name'], count, key_log.count)
-            else:
-                log.info('Scan Complete bucket:%s keys:%d remediated:%d',
-                         b['Name'], count, key_log.count)
-
-        b['KeyScanCount'] = count
-        b['KeyRemediated'] = key_log.count
-        return {
-            'Bucket': b['Name'], 'Remediated': key_log.count, 'Count': count}
+            pending.append((self.get_scan_position(b, key_set), futures))
+
+            while pending and (
+                    len(pending) > self.max_pending_pages or
+                    all(f.done() for f in pending[0][1])):
+                self._complete_page(
+                    b, partition, pending.popleft(), key_log, checkpoint)
+
+            if key_set.get('IsTruncated') and progress is not None:
+                progress.report(key_log.count)
+
+        while pending:
+            self._complete_page(
+                b, partition, pending.popleft(), key_log, checkpoint)
+        if checkpoint is not None:
+            checkpoint.set(partition, True)
+        return count
+
+    def _complete_page(self, b, partition, page, key_log, checkpoint):
+        position, futures = page
+        for f in as_completed(futures):
+            if f.exception():
+                log.exception("Exception Processing bucket:%s key batch %s" % (
+                    b['Name'], f.exception()))
+                continue
+            r = f.result()
+            if r:
+                key_log.add(r)
+        if checkpoint is not None and position:
+            checkpoint.set(partition, position)
 
     def process_chunk(self, batch, bucket):
         raise NotImplementedError()
@@ -1702,6 +2289,25 @@ class EncryptExtantKeys(ScanBucket):
                   - type: encrypt-keys
                     crypto: aws:kms
                     key-id: 9c3983be-c6cf-11e6-9d9d-cec0c932ce01
+
+    For very large buckets, keys can be read from the latest delivered
+    csv inventory matching `inventory` (falling back to listing), or the
+    bucket listed concurrently per top level prefix with `partition`.
+    With `checkpoint` the scan position of each partition is saved in
+    the policy output directory, and an interrupted scan resumes from
+    it on the next run.
+
+    .. code-block:: yaml
+
+            policies:
+              - name: s3-encrypt-large-buckets
+                resource: s3
+                actions:
+                  - type: encrypt-keys
+                    crypto: AES256
+                    inventory: "*"
+                    partition: true
+                    checkpoint: true
     """
 
     permissions = (
@@ -1720,7 +2326,10 @@ class EncryptExtantKeys(ScanBucket):
             'glacier': {'type': 'boolean'},
             'large': {'type': 'boolean'},
             'crypto': {'enum': ['AES256', 'aws:kms']},
-            'key-id': {'type': 'string'}
+            'key-id': {'type': 'string'},
+            'inventory': {'type': 'string'},
+            'partition': {'type': 'boolean'},
+            'checkpoint': {'type': 'boolean'}
         },
         'dependencies': {
             'key-id': {
@@ -1748,7 +2357,9 @@ class EncryptExtantKeys(ScanBucket):
                       's3:AbortMultipartUpload',
                       's3:ListBucket',
                       's3:ListBucketVersions')
-        return perms
+        if self.data.get('inventory'):
+            perms += ('s3:GetInventoryConfiguration',)
+        return perms + ('cloudwatch:GetMetricStatistics',)
 
     def process(self, buckets):
 
@@ -1800,6 +2411,10 @@ class EncryptExtantKeys(ScanBucket):
     def process_key(self, s3, key, bucket_name, info=None):
         k = key['Key']
         if info is None:
+            # Keys from an inventory may already tell us they're encrypted.
+            if not self.kms_id and key.get(
+                    'EncryptionStatus', 'NOT-SSE') != 'NOT-SSE':
+                return False
             info = s3.head_object(Bucket=bucket_name, Key=k)
 
         # If the data is already encrypted with AES256 and this request is also
@@ -1858,6 +2473,8 @@ class EncryptExtantKeys(ScanBucket):
         return k
 
     def process_version(self, s3, key, bucket_name):
+        if key.get('EncryptionStatus', 'NOT-SSE') != 'NOT-SSE':
+            return False
         info = s3.head_object(
             Bucket=bucket_name,
             Key=key['Key'],
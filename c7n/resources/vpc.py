@@ -30,6 +30,7 @@ from c7n.filters.iamaccess import CrossAccountAccessFilter
 from c7n.filters.related import RelatedResourceFilter
 from c7n.filters.revisions import Diff
 from c7n.filters.locked import Locked
+from c7n.filters.usage import UsageGraph
 from c7n import query, resolver
 from c7n.manager import resources
 from c7n.utils import (
@@ -610,38 +611,16 @@ class SGUsage(Filter):
     def get_launch_config_sgs(self):
         # Note assuming we also have launch config garbage collection
         # enabled.
-        sg_ids = set()
-        for cfg in self.manager.get_resource_manager('launch-config').resources():
-            for g in cfg['SecurityGroups']:
-                sg_ids.add(g)
-            for g in cfg['ClassicLinkVPCSecurityGroups']:
-                sg_ids.add(g)
-        return sg_ids
+        return set(UsageGraph.get(self.manager).references('launch-config-sg'))
 
     def get_lambda_sgs(self):
-        sg_ids = set()
-        for func in self.manager.get_resource_manager('lambda').resources():
-            if 'VpcConfig' not in func:
-                continue
-            for g in func['VpcConfig']['SecurityGroupIds']:
-                sg_ids.add(g)
-        return sg_ids
+        return set(UsageGraph.get(self.manager).references('lambda-sg'))
 
     def get_eni_sgs(self):
-        sg_ids = set()
-        for nic in self.manager.get_resource_manager('eni').resources():
-            for g in nic['Groups']:
-                sg_ids.add(g['GroupId'])
-        return sg_ids
+        return set(UsageGraph.get(self.manager).references('eni-sg'))
 
     def get_sg_refs(self):
-        sg_ids = set()
-        for sg in self.manager.get_resource_manager('security-group').resources():
-            for perm_type in ('IpPermissions', 'IpPermissionsEgress'):
-                for p in sg.get(perm_type, []):
-                    for g in p.get('UserIdGroupPairs', ()):
-                        sg_ids.add(g['GroupId'])
-        return sg_ids
+        return set(UsageGraph.get(self.manager).references('sg-sg'))
 
 
 @SecurityGroup.filter_registry.register('unused')
@@ -878,6 +857,7 @@ class SGPermission(Filter):
 
     def process(self, resources, event=None):
         self.vfilters = []
+        self.cidr_filters = {}
         fattrs = list(sorted(self.perm_attrs.intersection(self.data.keys())))
         self.ports = 'Ports' in self.data and self.data['Ports'] or ()
         self.only_ports = (
@@ -915,11 +895,13 @@ class SGPermission(Filter):
         if not ip_perms:
             return False
 
-        match_range = self.data[cidr_key]
-        match_range['key'] = cidr_type
-
-        vf = ValueFilter(match_range)
-        vf.annotate = False
+        vf = self.cidr_filters.get(cidr_key)
+        if vf is None:
+            match_range = self.data[cidr_key]
+            match_range['key'] = cidr_type
+            vf = self.cidr_filters[cidr_key] = ValueFilter(
+                match_range, self.manager)
+            vf.annotate = False
 
         for ip_range in ip_perms:
             found = vf(ip_range)
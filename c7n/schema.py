@@ -28,26 +28,37 @@ the utils.type_schema function.
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 from collections import Counter
+import hashlib
 import json
 import logging
+import os
+import tempfile
 
 from jsonschema import Draft4Validator as Validator
 from jsonschema.exceptions import best_match
 
 from c7n.policy import execution
 from c7n.provider import clouds
+from c7n.registry import PluginRegistry
 from c7n.resources import load_resources
 from c7n.filters import ValueFilter, EventFilter, AgeFilter
+from c7n.version import version
+
+log = logging.getLogger('custodian.schema')
+
+# Directory for on disk copies of the generated schema, an empty value
+# disables the disk cache.
+SCHEMA_CACHE_DIR = os.environ.get(
+    'C7N_SCHEMA_CACHE', '~/.cache/cloud-custodian-schema')
 
 
 def validate(data, schema=None):
     if schema is None:
-        schema = generate()
-        Validator.check_schema(schema)
-
-    validator = Validator(schema)
+        validator = get_validator()
+    else:
+        validator = PolicyValidator.from_schema(schema)
 
-    errors = list(validator.iter_errors(data))
+    errors = validator.validate(data)
 
     if not errors:
         counter = Counter([p['name'] for p in data.get('policies')])
@@ -78,6 +89,144 @@ def validate(data, schema=None):
     ]))
 
 
+class PolicyValidator(object):
+    """Validate policy documents against a generated schema.
+
+    The full schema is a single anyOf across every resource type, which
+    means a jsonschema validator has to try each resource's policy
+    definition in turn for every policy. As a policy's resource is
+    known upfront, we instead validate each policy against only its
+    resource's sub-schema, and fall back to the full schema to produce
+    human friendly errors when validation fails.
+    """
+
+    key = None
+    _last = None
+
+    def __init__(self, schema):
+        self.schema = schema
+        self.validator = Validator(schema)
+        self.resource_validators = {}
+        self.document_validator = Validator(dict(
+            schema, properties=dict(
+                schema['properties'],
+                policies={'type': 'array', 'items': {'type': 'object'}})))
+
+    @classmethod
+    def from_schema(cls, schema):
+        # callers typically hand us the same schema for many documents
+        if cls._last is None or cls._last.schema is not schema:
+            cls._last = cls(schema)
+        return cls._last
+
+    def get_resource_validator(self, resource_type):
+        if '.' not in resource_type:
+            resource_type = 'aws.%s' % resource_type
+        if resource_type in self.resource_validators:
+            return self.resource_validators[resource_type]
+        resource_defs = self.schema['definitions']['resources']
+        validator = None
+        if resource_type in resource_defs:
+            validator = Validator({
+                'definitions': self.schema['definitions'],
+                '$ref': '#/definitions/resources/%s/policy' % resource_type})
+        self.resource_validators[resource_type] = validator
+        return validator
+
+    def is_valid(self, data):
+        if not self.document_validator.is_valid(data):
+            return False
+        for p in data.get('policies', ()):
+            validator = self.get_resource_validator(
+                str(p.get('resource', '')))
+            if validator is None or not validator.is_valid(p):
+                return False
+        return True
+
+    def iter_errors(self, data):
+        return self.validator.iter_errors(data)
+
+    def validate(self, data):
+        if self.is_valid(data):
+            return []
+        return list(self.iter_errors(data))
+
+
+def schema_cache_key():
+    """Key for the generated schema, c7n version and the loaded plugin set
+    along with their schemas, so schema edits on an unchanged version
+    aren't served from a stale cache.
+    """
+    h = hashlib.sha256(version.encode('utf8'))
+
+    def update(name, klass):
+        h.update(('%s:%s.%s' % (
+            name, klass.__module__, klass.__name__)).encode('utf8'))
+        h.update(json.dumps(
+            getattr(klass, 'schema', None), sort_keys=True).encode('utf8'))
+
+    for mode_name, mode in sorted(execution.items()):
+        update(mode_name, mode)
+    for cloud_name, cloud_type in sorted(clouds.items()):
+        for type_name, resource_type in sorted(cloud_type.resources.items()):
+            h.update(('%s.%s' % (cloud_name, type_name)).encode('utf8'))
+            for registry in (resource_type.filter_registry,
+                             resource_type.action_registry):
+                for name, klass in sorted(registry.items()):
+                    update(name, klass)
+    return h.hexdigest()
+
+
+def load_schema(cache_dir=None, key=None):
+    """Return the generated schema, using an on disk copy when available.
+    """
+    if cache_dir is None:
+        cache_dir = SCHEMA_CACHE_DIR
+    if not cache_dir:
+        schema = generate()
+        Validator.check_schema(schema)
+        return schema
+
+    cache_dir = os.path.abspath(os.path.expanduser(cache_dir))
+    cache_path = os.path.join(
+        cache_dir, 'schema-%s.json' % (key or schema_cache_key()))
+    if os.path.isfile(cache_path):
+        try:
+            with open(cache_path) as fh:
+                return json.load(fh)
+        except ValueError:
+            log.warning("Ignoring invalid schema cache %s", cache_path)
+
+    schema = generate()
+    Validator.check_schema(schema)
+    try:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        # write and rename so concurrent readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'w') as fh:
+            json.dump(schema, fh)
+        os.rename(tmp_path, cache_path)
+    except (IOError, OSError) as e:
+        log.warning("Could not save schema cache %s err: %s", cache_path, e)
+    return schema
+
+
+_validator = None
+
+
+def get_validator():
+    """Process wide policy validator for the currently loaded resources.
+    """
+    global _validator
+    # plugins may register resources after our first use
+    generation = PluginRegistry.generation
+    if _validator is None or _validator.generation != generation:
+        _validator = PolicyValidator(load_schema())
+        _validator.generation = generation
+    return _validator
+
+
 def specific_error(error):
     """Try to find the best error for humans to resolve
 
@@ -25,6 +25,7 @@ import six
 import yaml
 
 from c7n import policy
+from c7n.cache import reset_shared_caches
 from c7n.schema import validate as schema_validate
 from c7n.ctx import ExecutionContext
 from c7n.utils import CONN_CACHE
@@ -55,6 +56,8 @@ class TestUtils(unittest.TestCase):
     def cleanUp(self):
         # Clear out thread local session cache
         CONN_CACHE.session = None
+        # Clear out reports and snapshots shared across policies
+        reset_shared_caches()
 
     def write_policy_file(self, policy, format="yaml"):
         """ Write a policy file to disk in the specified format.
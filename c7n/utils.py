@@ -15,6 +15,7 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 import copy
 import csv
+from bisect import bisect_right
 from datetime import datetime, timedelta
 import functools
 import json
@@ -28,6 +29,8 @@ import time
 import six
 import sys
 
+from dateutil.parser import parse
+from dateutil.tz import tzoffset, tzutc
 
 from c7n.exceptions import ClientError
 from c7n import ipaddress
@@ -382,8 +385,16 @@ def backoff_delays(start, stop, factor=2.0, jitter=False):
         cur = cur * factor
 
 
+_cidr_cache = {}
+CIDR_CACHE_SIZE = 10000
+
+
 def parse_cidr(value):
     """Process cidr ranges."""
+    # rule cidrs are heavily repeated across resources, so cache parsing
+    cacheable = isinstance(value, six.string_types)
+    if cacheable and value in _cidr_cache:
+        return _cidr_cache[value]
     klass = IPv4Network
     if '/' not in value:
         klass = ipaddress.ip_address
@@ -391,9 +402,96 @@ def parse_cidr(value):
         v = klass(six.text_type(value))
     except (ipaddress.AddressValueError, ValueError):
         v = None
+    if cacheable:
+        if len(_cidr_cache) >= CIDR_CACHE_SIZE:
+            _cidr_cache.clear()
+        _cidr_cache[value] = v
     return v
 
 
+class CidrSet(object):
+    """A set of ipv4 and ipv6 cidr ranges supporting fast lookups.
+
+    Ranges are kept as sorted, merged integer intervals per ip version,
+    so containment and overlap checks are a binary search, O(log n),
+    regardless of the number of cidrs in the set.
+
+    >>> cidrs = CidrSet(['10.0.0.0/8', '192.168.1.1', '2001:db8::/32'])
+    >>> '10.1.2.0/24' in cidrs
+    True
+    >>> cidrs.overlaps('192.168.0.0/16')
+    True
+    >>> '172.16.0.1' in cidrs
+    False
+    """
+
+    def __init__(self, cidrs=()):
+        intervals = {4: [], 6: []}
+        for c in cidrs:
+            r = self.parse(c)
+            if r is None:
+                continue
+            intervals[r[0]].append(r[1:])
+        self.starts = {}
+        self.ends = {}
+        for version, ranges in intervals.items():
+            starts, ends = [], []
+            for start, end in sorted(ranges):
+                if ends and start <= ends[-1] + 1:
+                    ends[-1] = max(ends[-1], end)
+                    continue
+                starts.append(start)
+                ends.append(end)
+            self.starts[version] = starts
+            self.ends[version] = ends
+        self._cache = {}
+
+    @staticmethod
+    def parse(value):
+        """Return (version, first, last) integer ip range for a cidr or ip."""
+        if isinstance(value, (ipaddress._BaseNetwork, ipaddress._BaseAddress)):
+            network = value
+        else:
+            try:
+                network = ipaddress.ip_network(
+                    six.text_type(value), strict=False)
+            except (ipaddress.AddressValueError, ValueError, TypeError):
+                return None
+        if isinstance(network, ipaddress._BaseAddress):
+            return network.version, int(network), int(network)
+        return (network.version,
+                int(network.network_address),
+                int(network.broadcast_address))
+
+    def _lookup(self, value):
+        if isinstance(value, six.string_types):
+            if value not in self._cache:
+                if len(self._cache) >= CIDR_CACHE_SIZE:
+                    self._cache.clear()
+                self._cache[value] = self.parse(value)
+            return self._cache[value]
+        return self.parse(value)
+
+    def __contains__(self, value):
+        r = self._lookup(value)
+        if r is None:
+            return False
+        version, start, end = r
+        idx = bisect_right(self.starts[version], start) - 1
+        return idx >= 0 and end <= self.ends[version][idx]
+
+    def overlaps(self, value):
+        r = self._lookup(value)
+        if r is None:
+            return False
+        version, start, end = r
+        idx = bisect_right(self.starts[version], end) - 1
+        return idx >= 0 and self.ends[version][idx] >= start
+
+    def __len__(self):
+        return sum(len(s) for s in self.starts.values())
+
+
 class IPv4Network(ipaddress.IPv4Network):
 
     # Override for net 2 net containment comparison
@@ -535,3 +633,46 @@ class FormatDate(object):
         if increments:
             fmt = self.date_increment.sub("", fmt)
         return d.__format__(fmt)
+
+
+ISO_DATE = re.compile(
+    r'(\d{4})-(\d\d)-(\d\d)[T ](\d\d):(\d\d):(\d\d)(?:\.(\d{1,6})\d*)?'
+    r'(Z|[+-]\d\d:?\d\d)?$')
+EPOCH = datetime(1970, 1, 1, tzinfo=tzutc())
+
+_date_offsets = {'Z': tzutc(), '+00:00': tzutc(), '+0000': tzutc()}
+
+
+def parse_date(v, default=None):
+    """Parse a date string, the iso 8601 timestamps returned by aws apis
+    are parsed directly, anything else falls back to dateutil.
+    """
+    if isinstance(v, datetime):
+        return v
+    m = ISO_DATE.match(v)
+    if m is None:
+        if default is not None:
+            return parse(v, default=default)
+        return parse(v)
+    year, month, day, hour, minute, second, fraction, offset = m.groups()
+    # like dateutil, dates without an offset take the default's timezone
+    tz = default is not None and default.tzinfo or None
+    if offset:
+        tz = _date_offsets.get(offset)
+        if tz is None:
+            seconds = int(offset[1:3]) * 3600 + int(offset[-2:]) * 60
+            tz = _date_offsets[offset] = tzoffset(
+                None, offset[0] == '-' and -seconds or seconds)
+    return datetime(
+        int(year), int(month), int(day), int(hour), int(minute), int(second),
+        fraction and int(fraction.ljust(6, '0')) or 0, tz)
+
+
+def date_epoch(v):
+    """Seconds since the epoch of a date, naive dates are taken as utc."""
+    if v is None:
+        return None
+    v = parse_date(v)
+    if v.tzinfo is None:
+        v = v.replace(tzinfo=tzutc())
+    return (v - EPOCH).total_seconds()
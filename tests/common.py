@@ -20,6 +20,7 @@ import unittest
 import uuid
 from functools import partial
 
+from c7n import schema
 from c7n.schema import generate
 from c7n.resources import load_resources
 from c7n.config import Bag, Config
@@ -34,6 +35,9 @@ logging.getLogger("botocore").setLevel(logging.WARNING)
 
 load_resources()
 
+# Tests shouldn't read or write the user's on disk schema cache.
+schema.SCHEMA_CACHE_DIR = ""
+
 ACCOUNT_ID = "644160558196"
 
 
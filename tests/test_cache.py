@@ -15,9 +15,11 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 from unittest import TestCase
 from c7n import cache
+from c7n.filters.related import RelatedResourceFilter
 from argparse import Namespace
 from six.moves import cPickle as pickle
 import tempfile
+import time
 import mock
 
 
@@ -30,6 +32,113 @@ class TestCache(TestCase):
         test_config.cache = None
         self.assertIsInstance(cache.factory(test_config), cache.NullCache)
 
+    def test_related_factory(self):
+        self.assertFalse(cache.related_factory(None).load())
+        self.assertFalse(cache.related_factory(Namespace()).load())
+        self.assertTrue(
+            cache.related_factory(Namespace(related_cache_period=5)).load())
+
+
+class RelatedResourceCacheTest(TestCase):
+
+    def test_get_save(self):
+        c = cache.RelatedResourceCache(5)
+        key = {"account": "12345678901234", "region": "us-west-2",
+               "resource": "SecurityGroup-test-get-save"}
+        c.save(key, [{"GroupId": "sg-1"}, {"GroupId": "sg-2"}], "GroupId")
+        self.assertEqual(
+            cache.RelatedResourceCache(5).get(key, ["sg-1", "sg-3"]),
+            {"sg-1": {"GroupId": "sg-1"}})
+
+    def test_expiration(self):
+        c = cache.RelatedResourceCache(5)
+        key = {"account": "12345678901234", "region": "us-west-2",
+               "resource": "SecurityGroup-test-expiration"}
+        c.save(key, [{"GroupId": "sg-1"}], "GroupId")
+        with mock.patch("c7n.cache.time.time", return_value=time.time() + 301):
+            self.assertEqual(c.get(key, ["sg-1"]), {})
+
+    def test_get_related_warm_cache(self):
+        fetches = []
+
+        class GroupManager(object):
+
+            def get_model(self):
+                return Namespace(id="GroupId")
+
+            def get_cache_key(self, query):
+                return {"account": "12345678901234", "region": "us-west-2",
+                        "resource": "SecurityGroup-test-warm-cache"}
+
+            def get_resources(self, ids):
+                fetches.append(sorted(ids))
+                return [{"GroupId": i, "Tags": []} for i in ids]
+
+        class GroupFilter(RelatedResourceFilter):
+            RelatedResource = "c7n.resources.vpc.SecurityGroup"
+            RelatedIdsExpression = "GroupIds[]"
+
+            def get_resource_manager(self):
+                return GroupManager()
+
+        def get_related(ids):
+            f = GroupFilter({}, Namespace(
+                config=Namespace(related_cache_period=5)))
+            return f.get_related([{"GroupIds": ids}])
+
+        related = get_related(["sg-1"])
+        # callers modifying related resources don't change the cache
+        related["sg-1"]["Tags"].append({"Key": "c7n", "Value": "x"})
+
+        related = get_related(["sg-1", "sg-2"])
+        self.assertEqual(fetches, [["sg-1"], ["sg-2"]])
+        self.assertEqual(related, {
+            "sg-1": {"GroupId": "sg-1", "Tags": []},
+            "sg-2": {"GroupId": "sg-2", "Tags": []}})
+
+    def test_disabled(self):
+        c = cache.RelatedResourceCache(0)
+        c.save("key", [{"GroupId": "sg-1"}], "GroupId")
+        self.assertEqual(c.get("key", ["sg-1"]), {})
+
+
+class SharedCacheTest(TestCase):
+
+    def get_manager(self, account_id="123456789012", region="us-east-1"):
+        return mock.MagicMock(
+            config=Namespace(account_id=account_id, region=region))
+
+    def test_scoped_to_account_region(self):
+        c = cache.SharedCache()
+        c.save(self.get_manager(), "graph")
+        self.assertEqual(c.get(self.get_manager()), "graph")
+        self.assertIsNone(c.get(self.get_manager(region="us-west-2")))
+        self.assertIsNone(c.get(self.get_manager(account_id="210987654321")))
+        self.assertIsNone(c.get(self.get_manager(), "streams"))
+
+    def test_not_shared_without_account(self):
+        c = cache.SharedCache()
+        c.save(self.get_manager(account_id=None), "graph")
+        self.assertIsNone(c.get(self.get_manager(account_id=None)))
+        self.assertEqual(c.data, {})
+
+    def test_expiration(self):
+        c = cache.SharedCache(60)
+        c.save(self.get_manager(), "graph")
+        unbounded = cache.SharedCache(None)
+        unbounded.save(self.get_manager(), "report")
+        with mock.patch("c7n.cache.time.time", return_value=time.time() + 61):
+            self.assertIsNone(c.get(self.get_manager()))
+            self.assertEqual(unbounded.get(self.get_manager()), "report")
+
+    def test_reset_shared_caches(self):
+        c = cache.SharedCache(None)
+        regions = cache.shared_cache({"bucket": "us-east-1"})
+        c.save(self.get_manager(), "report")
+        cache.reset_shared_caches()
+        self.assertIsNone(c.get(self.get_manager()))
+        self.assertEqual(regions, {})
+
 
 class FileCacheManagerTest(TestCase):
 
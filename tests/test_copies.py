@@ -0,0 +1,153 @@
+# Copyright 2018 Capital One Services, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+
+import mock
+from botocore.exceptions import ClientError
+
+from c7n.config import Bag
+from c7n.resources.copies import CopyQueue
+
+from .common import BaseTest
+
+
+class CopyQueueTest(BaseTest):
+
+    def get_queue(self, target_region='us-west-2', region='us-east-1'):
+        manager = mock.MagicMock()
+        manager.config = Bag(
+            account_id='123456789012', region=region,
+            cache=os.path.join(self.cache_dir, 'c7n.cache'), cache_period=15)
+        return CopyQueue.get(manager, 'snapshot', target_region, 'SnapshotId')
+
+    def setUp(self):
+        self.cache_dir = self.get_temp_dir()
+        self.patch(CopyQueue, 'delay', 0)
+
+    def start(self, item):
+        self.started.append(item['SnapshotId'])
+        return 'copy-%s' % item['SnapshotId']
+
+    def test_admit_under_limit(self):
+        self.started = []
+        queue = self.get_queue()
+        queue.add([{'SnapshotId': 'snap-%d' % i} for i in range(5)])
+        states = [
+            {'copy-snap-0': 'pending', 'copy-snap-1': 'pending'},
+            {'copy-snap-0': 'completed', 'copy-snap-1': 'pending'},
+            {'copy-snap-1': 'completed', 'copy-snap-2': 'pending'},
+            {'copy-snap-2': 'completed', 'copy-snap-3': 'pending'},
+        ]
+        copies = queue.run(2, self.start, lambda ids: states.pop(0))
+        self.assertEqual(
+            [copy_id for item, copy_id in copies],
+            ['copy-snap-0', 'copy-snap-1', 'copy-snap-2', 'copy-snap-3',
+             'copy-snap-4'])
+        self.assertEqual(states, [])
+        self.assertEqual(
+            queue.in_flight, {'copy-snap-3': 'snap-3', 'copy-snap-4': 'snap-4'})
+        self.assertEqual(queue.pending, [])
+
+    def test_resume_across_runs(self):
+        self.started = []
+        queue = self.get_queue()
+        queue.add([{'SnapshotId': 'snap-%d' % i} for i in range(3)])
+        queue.run(2, self.start, lambda ids: {}, max_wait=0)
+        self.assertEqual(self.started, ['snap-0', 'snap-1'])
+
+        # other destination regions are tracked separately
+        self.assertEqual(self.get_queue('eu-west-1').pending, [])
+
+        queue = self.get_queue()
+        self.assertEqual(queue.pending, [{'SnapshotId': 'snap-2'}])
+        self.assertEqual(
+            queue.in_flight, {'copy-snap-0': 'snap-0', 'copy-snap-1': 'snap-1'})
+
+        # queued and in-flight sources aren't queued again
+        queue.add([{'SnapshotId': 'snap-1'}, {'SnapshotId': 'snap-2'}])
+        self.assertEqual(len(queue.pending), 1)
+
+        queue.run(
+            2, self.start,
+            lambda ids: {'copy-snap-0': 'completed', 'copy-snap-1': 'error'})
+        self.assertEqual(self.started, ['snap-0', 'snap-1', 'snap-2'])
+        self.assertEqual(queue.in_flight, {'copy-snap-2': 'snap-2'})
+
+        queue.update({'copy-snap-2': 'completed'})
+        with open(queue.path) as fh:
+            self.assertEqual(fh.read(), '{}')
+
+    def test_shared_across_source_regions(self):
+        self.started = []
+        queue = self.get_queue()
+        queue.add([{'SnapshotId': 'snap-0'}])
+        queue.admit(1, self.start)
+        queue = self.get_queue(region='eu-west-1')
+        self.assertEqual(queue.in_flight, {'copy-snap-0': 'snap-0'})
+
+    def test_update_keeps_missing_copies(self):
+        self.started = []
+        queue = self.get_queue()
+        queue.add([{'SnapshotId': 'snap-0'}, {'SnapshotId': 'snap-1'}])
+        queue.admit(2, self.start)
+        queue.update({'copy-snap-1': 'recoverable'})
+        self.assertEqual(
+            queue.in_flight, {'copy-snap-0': 'snap-0', 'copy-snap-1': 'snap-1'})
+        queue.update({'copy-snap-0': 'completed', 'copy-snap-1': 'error'})
+        self.assertEqual(queue.in_flight, {})
+
+    def test_update_expires_unconfirmed_copies(self):
+        self.started = []
+        queue = self.get_queue()
+        queue.add([{'SnapshotId': 'snap-0'}, {'SnapshotId': 'snap-1'}])
+        queue.admit(2, self.start)
+        self.assertEqual(sorted(queue.unconfirmed), ['copy-snap-0', 'copy-snap-1'])
+
+        # once seen, a copy missing from describe is gone
+        queue.update({'copy-snap-0': 'pending'})
+        self.assertEqual(list(queue.unconfirmed), ['copy-snap-1'])
+        queue.update({})
+        self.assertEqual(queue.in_flight, {'copy-snap-1': 'snap-1'})
+
+        # never seen copies are dropped after confirm_wait
+        queue = self.get_queue()
+        queue.unconfirmed['copy-snap-1'] -= queue.confirm_wait
+        queue.update({})
+        self.assertEqual(queue.in_flight, {})
+        self.assertEqual(queue.unconfirmed, {})
+
+    def test_admit_start_failure(self):
+        self.started = []
+        queue = self.get_queue()
+        queue.add([{'SnapshotId': 'snap-%d' % i} for i in range(3)])
+
+        def start(item):
+            if item['SnapshotId'] == 'snap-1':
+                raise ClientError(
+                    {'Error': {'Code': error_code[0]}}, 'CopySnapshot')
+            return self.start(item)
+
+        error_code = ['ResourceLimitExceeded']
+        copies = queue.admit(3, start)
+        self.assertEqual([c for i, c in copies], ['copy-snap-0'])
+        self.assertEqual(
+            [i['SnapshotId'] for i in queue.pending], ['snap-1', 'snap-2'])
+
+        error_code[0] = 'InvalidSnapshot.NotFound'
+        self.assertRaises(ClientError, queue.admit, 3, start)
+        self.assertEqual(
+            [i['SnapshotId'] for i in self.get_queue().pending],
+            ['snap-1', 'snap-2'])
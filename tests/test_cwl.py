@@ -15,6 +15,8 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 from .common import BaseTest
 
+from c7n.resources.cw import LastWriteDays
+
 
 class LogGroupTest(BaseTest):
 
@@ -49,6 +51,40 @@ class LogGroupTest(BaseTest):
         self.assertEqual(len(resources), 1)
         self.assertEqual(resources[0]["logGroupName"], "/aws/lambda/ec2-instance-type")
 
+    def test_last_write_shared(self):
+        factory = self.replay_flight_data("test_log_group_last_write")
+        calls = []
+        retry = LastWriteDays.retry
+
+        def counting_retry(func, *args, **kw):
+            calls.append(kw["logGroupName"])
+            return retry(func, *args, **kw)
+
+        self.patch(LastWriteDays, "retry", staticmethod(counting_retry))
+        policy = {
+            "name": "stale-groups",
+            "resource": "log-group",
+            "filters": [
+                {"logGroupName": "/aws/lambda/ec2-instance-type"},
+                {"type": "last-write", "days": 0.1},
+            ],
+        }
+        for i in range(2):
+            resources = self.load_policy(
+                policy, config={"account_id": self.account_id},
+                session_factory=factory).run()
+            self.assertEqual(len(resources), 1)
+            self.assertTrue(resources[0]["streams"])
+        self.assertEqual(calls, ["/aws/lambda/ec2-instance-type"])
+
+        # groups created after the threshold are never stale
+        policy["filters"][1]["days"] = 100000
+        resources = self.load_policy(
+            policy, config={"account_id": self.account_id},
+            session_factory=factory).run()
+        self.assertEqual(resources, [])
+        self.assertEqual(len(calls), 1)
+
     def test_retention(self):
         log_group = "c7n-test-a"
         factory = self.replay_flight_data("test_log_group_retention")
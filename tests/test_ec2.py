@@ -22,6 +22,7 @@ from dateutil import tz, zoneinfo
 from mock import mock
 from jsonschema.exceptions import ValidationError
 
+from c7n.config import Config
 from c7n.exceptions import PolicyValidationError
 from c7n.resources import ec2
 from c7n.resources.ec2 import actions, QueryFilter
@@ -169,6 +170,59 @@ class TestDisableApiTermination(BaseTest):
             ["i-02117c13e1d21b229", "i-0718418de3bb4ae2a"],
         )
 
+    def test_term_prot_shared_attributes(self):
+        session_factory = self.replay_flight_data(
+            "test_ec2_termination-protected_filter"
+        )
+        policy = self.load_policy(
+            {
+                "name": "ec2-termination-enabled",
+                "resource": "ec2",
+                "filters": [{"type": "termination-protected"}],
+            },
+            config={"account_id": self.account_id},
+            session_factory=session_factory,
+        )
+        self.assertEqual(len(policy.run()), 1)
+
+        # the instance-attribute filter reuses the fetched values
+        self.patch(
+            ec2.InstanceAttributes, "fetch_value",
+            mock.Mock(side_effect=AssertionError("refetched")))
+        policy = self.load_policy(
+            {
+                "name": "ec2-termination-attribute",
+                "resource": "ec2",
+                "filters": [{
+                    "type": "instance-attribute",
+                    "attribute": "disableApiTermination",
+                    "key": "Value",
+                    "value": False,
+                }],
+            },
+            config={"account_id": self.account_id},
+            session_factory=session_factory,
+        )
+        resources = policy.run()
+        self.assertEqual(
+            sorted([r["InstanceId"] for r in resources]),
+            ["i-02117c13e1d21b229", "i-0718418de3bb4ae2a"],
+        )
+
+    def test_instance_attributes_modes(self):
+        config = Config.empty(account_id=self.account_id)
+        manager = mock.MagicMock(config=config, data={})
+        attrs = ec2.InstanceAttributes.get(manager)
+        self.assertIs(ec2.InstanceAttributes.get(manager), attrs)
+        self.assertEqual(attrs.max_rate, ec2.InstanceAttributes.max_rate)
+
+        # event modes don't see values cached by earlier invocations
+        manager.data = {"mode": {"type": "cloudtrail"}}
+        self.assertIsNot(ec2.InstanceAttributes.get(manager), attrs)
+
+        config["instance_attribute_rate"] = 5
+        self.assertEqual(ec2.InstanceAttributes.get(manager).max_rate, 5)
+
     def test_policy_permissions(self):
         session_factory = self.replay_flight_data(
             "test_ec2_termination-protected_filter"
@@ -1396,3 +1450,25 @@ class TestUserData(BaseTest):
         )
         resources = policy.run()
         self.assertGreater(len(resources), 0)
+
+    def test_user_data_decoded_once(self):
+        session_factory = self.replay_flight_data("test_ec2_userdata")
+        decode = mock.Mock(side_effect=ec2.deserialize_user_data)
+        self.patch(ec2, "deserialize_user_data", decode)
+        policy_data = {
+            "name": "ec2_userdata",
+            "resource": "ec2",
+            "filters": [{"or": [
+                {"type": "user-data", "op": "regex", "value": "(?smi).*A[KS]IA"}]}],
+        }
+        config = {"account_id": self.account_id}
+        found = self.load_policy(
+            policy_data, config=config, session_factory=session_factory).run()
+        calls = decode.call_count
+        self.assertTrue(calls)
+        self.assertEqual(
+            len(self.load_policy(
+                policy_data, config=config,
+                session_factory=session_factory).run()),
+            len(found))
+        self.assertEqual(decode.call_count, calls)
@@ -123,6 +123,11 @@ class TestValueFilter(unittest.TestCase):
         value = "10.10.10.10"
         res = vf.process_value_type(sentinel, value, resource)
         self.assertEqual((str(res[0]), str(res[1])), (sentinel, value))
+        sentinel = ["10.0.0.0/16", "192.168.0.0/16"]
+        res = vf.process_value_type(sentinel, "10.0.10.10", resource)
+        self.assertTrue(res[1] in res[0])
+        self.assertFalse("10.11.0.0/24" in res[0])
+        sentinel = "10.0.0.0/16"
         vf.vtype = "cidr_size"
         value = "10.10.10.300"
         res = vf.process_value_type(sentinel, value, resource)
@@ -164,6 +169,24 @@ class TestAgeFilter(unittest.TestCase):
         af = base_filters.AgeFilter({})
         self.assertRaises(NotImplementedError, af.validate)
 
+    def test_age_filter_process(self):
+
+        class CreatedAge(base_filters.AgeFilter):
+            date_attribute = 'Created'
+
+        now = datetime.now(tz=tz.tzutc())
+        resources = [
+            {'Created': (now - timedelta(days=3)).strftime('%Y-%m-%dT%H:%M:%S.000Z')},
+            {'Created': now - timedelta(hours=1)},
+            {'Created': (now - timedelta(days=2)).replace(tzinfo=None)},
+            {'Created': now.strftime('%a, %d %b %Y %H:%M:%S GMT')}]
+        af = CreatedAge({'days': 1})
+        self.assertEqual(af.process(resources), [resources[0], resources[2]])
+        self.assertEqual(
+            [r for r in resources if af(r)], [resources[0], resources[2]])
+        af = CreatedAge({'days': 1, 'op': 'less-than'})
+        self.assertEqual(af.process(resources), [resources[1], resources[3]])
+
 
 class TestGlobValue(unittest.TestCase):
 
@@ -272,6 +295,11 @@ class TestValueTypes(BaseFilterTest):
         self.assertFilter(fdata, i(now), True)
         self.assertFilter(fdata, i(now.isoformat()), True)
         self.assertFilter(fdata, i(now.isoformat()), True)
+        # iso dates without an offset
+        self.assertFilter(
+            fdata, i(one_month.strftime('%Y-%m-%dT%H:%M:%S')), True)
+        self.assertFilter(
+            fdata, i(two_months.strftime('%Y-%m-%dT%H:%M:%S')), False)
         self.assertFilter(fdata, i(calendar.timegm(now.timetuple())), True)
         self.assertFilter(fdata, i(str(calendar.timegm(now.timetuple()))), True)
 
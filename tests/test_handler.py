@@ -17,7 +17,10 @@ import json
 import logging
 import os
 
+import mock
+
 from .common import BaseTest
+from c7n.exceptions import BatchEventsError
 from c7n.policy import Policy
 
 
@@ -46,6 +49,7 @@ class HandleTest(BaseTest):
         from c7n import handler
 
         self.patch(handler, "account_id", "111222333444555")
+        self.patch(handler, "output_dir", None)
 
         with open(os.path.join(self.run_dir, "config.json"), "w") as fh:
             json.dump(
@@ -76,3 +80,122 @@ class HandleTest(BaseTest):
             pass
         else:
             self.fail("should have raised an error")
+
+    def test_handler_reuses_config(self):
+        self.run_dir = self.change_cwd()
+        self.change_environment(C7N_OUTPUT_DIR=self.run_dir)
+
+        policy_execution = []
+
+        def push(self, event, context):
+            policy_execution.append(self)
+            # as if assuming into a member account
+            self.options["account_id"] = "210987654321"
+            self.session_factory.assume_role = "arn:aws:iam::210987654321:role/c7n"
+
+        self.patch(Policy, "push", push)
+
+        from c7n import handler
+
+        self.patch(handler, "account_id", "111222333444555")
+        self.patch(handler, "output_dir", None)
+        self.patch(handler, "policy_cache", {})
+
+        def write_config(name):
+            with open(os.path.join(self.run_dir, "config.json"), "w") as fh:
+                json.dump({"policies": [{"resource": "asg", "name": name}]}, fh)
+
+        write_config("autoscaling")
+        self.assertEqual(handler.dispatch_event({"detail": {}}, None), True)
+        config = handler.policy_cache["config"]
+        self.assertEqual(handler.dispatch_event({"detail": {}}, None), True)
+        # the parsed config and policies are reused, with their options reset
+        self.assertIs(handler.policy_cache["config"], config)
+        self.assertIs(policy_execution[0], policy_execution[1])
+        policies = handler.load_policies()
+        self.assertEqual(policies.policies[0].options.account_id, "111222333444555")
+        self.assertEqual(policies.policies[0].session_factory.assume_role, None)
+        self.assertEqual(
+            policy_execution[0].options.related_cache_period,
+            handler.RELATED_CACHE_PERIOD)
+
+        # changes to the config file are picked up on the next event
+        os.remove(os.path.join(self.run_dir, "config.json"))
+        write_config("autoscaling-v2")
+        self.assertEqual(handler.dispatch_event({"detail": {}}, None), True)
+        self.assertEqual(policy_execution[-1].name, "autoscaling-v2")
+
+    def test_handler_sqs_batch(self):
+        self.run_dir = self.change_cwd()
+        self.change_environment(C7N_OUTPUT_DIR=self.run_dir)
+
+        policy_execution = []
+
+        def push_batch(self, events, context):
+            policy_execution.append(events)
+
+        self.patch(Policy, "push_batch", push_batch)
+
+        from c7n import handler
+
+        self.patch(handler, "account_id", "111222333444555")
+        self.patch(handler, "output_dir", None)
+        self.patch(handler, "policy_cache", {})
+
+        with open(os.path.join(self.run_dir, "config.json"), "w") as fh:
+            json.dump({"policies": [{"resource": "asg", "name": "autoscaling"}]}, fh)
+
+        event = {"Records": [
+            {"eventSource": "aws:sqs", "body": json.dumps({"detail": {"n": 1}})},
+            {"eventSource": "aws:sqs", "body": json.dumps({"detail": {"n": 2}})}]}
+        self.assertEqual(handler.dispatch_event(event, None), True)
+        self.assertEqual(
+            policy_execution, [[{"detail": {"n": 1}}, {"detail": {"n": 2}}]])
+
+    def test_handler_sqs_batch_failed_events(self):
+        self.run_dir = self.change_cwd()
+        self.change_environment(C7N_OUTPUT_DIR=self.run_dir)
+
+        def push_batch(self, events, context):
+            raise BatchEventsError("failed", events[1:], [])
+
+        self.patch(Policy, "push_batch", push_batch)
+
+        from c7n import handler
+
+        self.patch(handler, "account_id", "111222333444555")
+        self.patch(handler, "output_dir", None)
+        self.patch(handler, "policy_cache", {})
+        deleted = []
+        self.patch(handler, "delete_messages", deleted.extend)
+
+        with open(os.path.join(self.run_dir, "config.json"), "w") as fh:
+            json.dump({"policies": [{"resource": "asg", "name": "autoscaling"}]}, fh)
+
+        records = [
+            {"eventSource": "aws:sqs", "receiptHandle": "r%d" % n,
+             "eventSourceARN": "arn:aws:sqs:us-east-1:111222333444:events",
+             "body": json.dumps({"detail": {"n": n}})}
+            for n in range(3)]
+        with self.assertRaises(BatchEventsError) as e:
+            handler.dispatch_event({"Records": records}, None)
+        self.assertEqual(
+            e.exception.events, [{"detail": {"n": 1}}, {"detail": {"n": 2}}])
+        self.assertEqual(deleted, records[:1])
+
+    @mock.patch("c7n.handler.boto3")
+    def test_delete_messages(self, boto3):
+        from c7n import handler
+
+        client = boto3.Session.return_value.client.return_value
+        client.meta.endpoint_url = "https://sqs.us-west-2.amazonaws.com"
+        handler.delete_messages([
+            {"receiptHandle": "r%d" % n,
+             "eventSourceARN": "arn:aws:sqs:us-west-2:111222333444:events"}
+            for n in range(2)])
+        boto3.Session.return_value.client.assert_called_once_with(
+            "sqs", region_name="us-west-2")
+        client.delete_message_batch.assert_called_once_with(
+            QueueUrl="https://sqs.us-west-2.amazonaws.com/111222333444/events",
+            Entries=[{"Id": "0", "ReceiptHandle": "r0"},
+                     {"Id": "1", "ReceiptHandle": "r1"}])
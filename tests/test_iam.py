@@ -17,12 +17,15 @@ import json
 import datetime
 import os
 import tempfile
+import time
 
 from unittest import TestCase
 from .common import load_data, BaseTest, functional, TestConfig as Config
 from .test_offhours import mock_datetime_now
 
+from botocore.exceptions import ClientError
 from dateutil import parser
+import mock
 
 from c7n.filters.iamaccess import CrossAccountAccessFilter, PolicyChecker
 from c7n.mu import LambdaManager, LambdaFunction, PythonPackageArchive
@@ -38,6 +41,7 @@ from c7n.resources.iam import (
     IamGroupUsers,
     UserPolicy,
     GroupMembership,
+    AuthorizationSnapshot,
     UserCredentialReport,
     UserAccessKey,
     IamUserInlinePolicy,
@@ -133,6 +137,61 @@ class UserCredentialReportTest(BaseTest):
             sorted([r["UserName"] for r in resources]), ["anthony", "chrissy", "matt"]
         )
 
+    def test_credential_report_shared(self):
+        session_factory = self.replay_flight_data("test_iam_user_console_old")
+        fetches = []
+        fetch = UserCredentialReport.fetch_credential_report
+
+        def counting_fetch(f):
+            fetches.append(f)
+            return fetch(f)
+
+        self.patch(UserCredentialReport, "fetch_credential_report", counting_fetch)
+        policies = [
+            self.load_policy(
+                {
+                    "name": "console-users-%s" % key,
+                    "resource": "iam-user",
+                    "filters": [
+                        {
+                            "type": "credential",
+                            "report_max_age": 86400 * 7,
+                            "key": key,
+                            "value": "present",
+                        }
+                    ],
+                },
+                config={"account_id": self.account_id},
+                session_factory=session_factory,
+            )
+            for key in ("password_last_used", "access_keys")
+        ]
+        with mock_datetime_now(parser.parse("2016-11-25T20:27:00+00:00"), datetime):
+            results = [p.run() for p in policies]
+        self.assertEqual(len(fetches), 1)
+        self.assertTrue(results[0])
+        self.assertTrue(results[1])
+
+    def test_credential_report_wait(self):
+        in_progress = ClientError(
+            {"Error": {"Code": "ReportInProgress"}}, "GetCredentialReport")
+        client = mock.MagicMock()
+        client.get_credential_report.side_effect = [
+            in_progress, in_progress, {"Content": "user\n"}]
+        sleeps = []
+        self.patch(time, "sleep", sleeps.append)
+        credential = UserCredentialReport({"report_delay": 5}, None)
+        self.assertEqual(
+            credential.wait_credential_report(client, "STARTED"),
+            {"Content": "user\n"})
+        self.assertEqual(sleeps, [0.5, 1, 2])
+
+        client.get_credential_report.side_effect = in_progress
+        sleeps[:] = []
+        self.assertRaises(
+            ClientError, credential.wait_credential_report, client, "STARTED")
+        self.assertEqual(sum(sleeps), 5)
+
     def test_record_transform(self):
         info = {
             "access_key_2_active": "false",
@@ -355,6 +414,66 @@ class IamUserGroupMembership(BaseTest):
         self.assertTrue(resources[0]["c7n:Groups"])
 
 
+class IamAuthorizationSnapshotTest(BaseTest):
+
+    def test_iam_user_filters_share_snapshot(self):
+        session_factory = self.replay_flight_data("test_iam_authorization_snapshot")
+        self.patch(AuthorizationSnapshot, "threshold", 0)
+        fetches = []
+        fetch = AuthorizationSnapshot.fetch
+
+        def counting_fetch(session_factory):
+            fetches.append(session_factory)
+            return fetch(session_factory)
+
+        self.patch(AuthorizationSnapshot, "fetch", staticmethod(counting_fetch))
+        p = self.load_policy(
+            {
+                "name": "iam-admin-users",
+                "resource": "iam-user",
+                "filters": [
+                    {"type": "policy", "key": "PolicyName",
+                     "value": "AdministratorAccess"},
+                    {"type": "group", "key": "GroupName", "value": "Admins"},
+                    {"type": "has-inline-policy", "value": True},
+                ],
+            },
+            config={"account_id": self.account_id},
+            session_factory=session_factory,
+        )
+        resources = p.run()
+        self.assertEqual(len(resources), 1)
+        self.assertEqual(resources[0]["UserName"], "alphabet_soup")
+        self.assertEqual(resources[0]["c7n:InlinePolicies"], ["inline-s3"])
+        self.assertEqual(resources[0]["c7n:Groups"][0]["GroupName"], "Admins")
+        self.assertNotIn("PolicyVersionList", resources[0]["c7n:Policies"][0])
+        self.assertEqual(len(fetches), 1)
+
+    def test_snapshot_indexes(self):
+        snapshot = AuthorizationSnapshot({
+            "UserDetailList": [
+                {"UserName": "bob", "GroupList": ["dev"],
+                 "UserPolicyList": [], "AttachedManagedPolicies": []}],
+            "GroupDetailList": [
+                {"GroupName": "dev", "GroupId": "g1",
+                 "GroupPolicyList": [{"PolicyName": "dev-inline"}]},
+                {"GroupName": "ops", "GroupId": "g2", "GroupPolicyList": []}],
+            "RoleDetailList": [
+                {"RoleName": "app", "RolePolicyList": []}],
+            "Policies": [],
+        })
+        self.assertEqual(snapshot.group_users("dev"), ["bob"])
+        self.assertEqual(snapshot.group_users("ops"), [])
+        self.assertEqual(snapshot.user_groups("bob"), [
+            {"GroupName": "dev", "GroupId": "g1"}])
+        self.assertEqual(snapshot.inline_policies("group", "dev"), ["dev-inline"])
+        self.assertEqual(snapshot.inline_policies("role", "app"), [])
+        # entities created after the snapshot fall back to api calls
+        self.assertEqual(snapshot.inline_policies("role", "new"), None)
+        self.assertEqual(snapshot.user_groups("alice"), None)
+        self.assertEqual(snapshot.user_policies(None, "alice"), None)
+
+
 class IamInstanceProfileFilterUsage(BaseTest):
 
     def test_iam_instance_profile_inuse(self):
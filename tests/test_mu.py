@@ -870,6 +870,29 @@ class PythonArchiveTest(unittest.TestCase):
         self.assertTrue("c7n/__init__.py" in filenames)
         self.assertTrue("pkg_resources/__init__.py" in filenames)
 
+    def test_custodian_archive_reuses_base_archive(self):
+        first = custodian_archive()
+        self.addCleanup(first.remove)
+        second = custodian_archive()
+        self.addCleanup(second.remove)
+        self.assertNotEqual(first.path, second.path)
+
+        first.add_contents("config.json", "{}")
+        first.close()
+        second.add_contents("config.json", "{}")
+        second.close()
+        self.assertEqual(first.get_checksum(), second.get_checksum())
+        self.assertTrue("config.json" in first.get_filenames())
+
+    def test_copy_is_independent_of_original(self):
+        original = self.make_archive()
+        copy = original.copy()
+        self.addCleanup(copy.remove)
+        copy.add_contents("cheese.txt", "So yummy!")
+        copy.close()
+        self.assertEqual(original.get_filenames(), [])
+        self.assertEqual(copy.get_filenames(), ["cheese.txt"])
+
     def make_file(self):
         bench = tempfile.mkdtemp()
         path = os.path.join(bench, "foo.txt")
@@ -21,7 +21,7 @@ import shutil
 import tempfile
 
 from c7n import policy, manager
-from c7n.exceptions import ResourceLimitExceeded
+from c7n.exceptions import BatchEventsError, ResourceLimitExceeded
 from c7n.resources.aws import AWS
 from c7n.resources.ec2 import EC2
 from c7n.utils import dumps
@@ -946,3 +946,126 @@ class GuardModeTest(BaseTest):
                 }
             ],
         )
+
+
+class LambdaModeBatchTest(BaseTest):
+
+    def get_event(self, queue_url, user):
+        return {
+            "account": "644160558196",
+            "region": "us-east-1",
+            "detail": {
+                "eventSource": "sqs.amazonaws.com",
+                "eventName": "CreateQueue",
+                "userIdentity": {"userName": user},
+                "responseElements": {"queueUrl": queue_url}}}
+
+    def get_policy(self, filters=(), **mode):
+        return self.load_policy({
+            "name": "queue-batch",
+            "resource": "sqs",
+            "mode": dict(mode, **{
+                "type": "cloudtrail",
+                "queue": "arn:aws:sqs:us-east-1:644160558196:c7n-events",
+                "events": [{
+                    "source": "sqs.amazonaws.com",
+                    "event": "CreateQueue",
+                    "ids": "responseElements.queueUrl"}]}),
+            "filters": list(filters),
+            "actions": [{
+                "type": "notify", "to": ["someone@example.com"],
+                "transport": {"type": "sqs", "queue": "xyz"}}]})
+
+    @mock.patch("c7n.actions.Notify.process")
+    @mock.patch("c7n.resources.sqs.SQS.get_resources")
+    def test_batch_resolves_resources_once(self, get_resources, notify):
+        notify.return_value = None
+        get_resources.side_effect = lambda ids: [{"QueueUrl": i} for i in ids]
+        p = self.get_policy()
+        resources = p.push_batch([
+            self.get_event("a", "bob"),
+            self.get_event("b", "alice"),
+            self.get_event("a", "bob"),
+            {"detail": {"errorCode": "AccessDenied"}}], None)
+
+        get_resources.assert_called_once_with(["a", "b"])
+        self.assertEqual([r["QueueUrl"] for r in resources], ["a", "b"])
+        # event actions still see each event
+        self.assertEqual(notify.call_count, 3)
+
+    @mock.patch("c7n.actions.Notify.process")
+    @mock.patch("c7n.resources.sqs.SQS.get_resources")
+    def test_batch_event_filters_per_event(self, get_resources, notify):
+        notify.return_value = None
+        get_resources.side_effect = lambda ids: [{"QueueUrl": i} for i in ids]
+        p = self.get_policy([{
+            "type": "event",
+            "key": "detail.userIdentity.userName",
+            "value": "bob"}])
+        resources = p.push_batch([
+            self.get_event("a", "bob"),
+            self.get_event("b", "alice"),
+            self.get_event("c", "bob")], None)
+
+        get_resources.assert_called_once_with(["a", "b", "c"])
+        self.assertEqual([r["QueueUrl"] for r in resources], ["a", "c"])
+        self.assertEqual(
+            [c[0][0] for c in notify.call_args_list],
+            [[{"QueueUrl": "a"}], [{"QueueUrl": "c"}]])
+
+    @mock.patch("c7n.actions.Notify.process")
+    @mock.patch("c7n.resources.sqs.SQS.get_resources")
+    def test_batch_log_disabled(self, get_resources, notify):
+        notify.return_value = None
+        get_resources.side_effect = lambda ids: [{"QueueUrl": i} for i in ids]
+        root = logging.getLogger()
+        self.patch(root, "handlers", list(root.handlers))
+        p = self.get_policy(log=False)
+        p.push_batch([self.get_event("a", "bob")], None)
+        self.assertEqual(
+            [type(h) for h in root.handlers], [logging.NullHandler])
+
+    @mock.patch("c7n.actions.Notify.process")
+    @mock.patch("c7n.resources.sqs.SQS.get_resources")
+    def test_batch_event_action_failure(self, get_resources, notify):
+        get_resources.side_effect = lambda ids: [{"QueueUrl": i} for i in ids]
+
+        def process(resources, event):
+            if event["detail"]["userIdentity"]["userName"] == "alice":
+                raise ValueError("notify failed")
+
+        notify.side_effect = process
+        p = self.get_policy()
+        events = [
+            self.get_event("a", "bob"),
+            self.get_event("b", "alice"),
+            self.get_event("c", "bob")]
+        with self.assertRaises(BatchEventsError) as e:
+            p.push_batch(events, None)
+        self.assertEqual(e.exception.events, [events[1]])
+        self.assertEqual(
+            [r["QueueUrl"] for r in e.exception.resources], ["a", "b", "c"])
+        self.assertEqual(notify.call_count, 3)
+
+    @mock.patch("c7n.resources.sqs.SQS.get_resources")
+    def test_batch_resolve_failure(self, get_resources):
+        get_resources.side_effect = ValueError("describe failed")
+        p = self.get_policy()
+        events = [self.get_event("a", "bob"), self.get_event("b", "alice")]
+        with self.assertRaises(BatchEventsError) as e:
+            p.push_batch(events, None)
+        self.assertEqual(e.exception.events, events)
+
+    @mock.patch("c7n.actions.Notify.process")
+    @mock.patch("c7n.resources.sqs.SQS.get_resources")
+    def test_push_writes_action_result(self, get_resources, notify):
+        notify.return_value = {"sent": 1}
+        get_resources.side_effect = lambda ids: [{"QueueUrl": i} for i in ids]
+        written = {}
+        p = self.get_policy()
+        self.patch(p, "_write_file", written.__setitem__)
+        p.push(self.get_event("a", "bob"), None)
+        self.assertEqual(written["action-notify"], dumps({"sent": 1}))
+
+        p.push_batch([self.get_event("a", "bob")], None)
+        self.assertEqual(written["action-notify"], dumps([{"sent": 1}]))
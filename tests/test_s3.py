@@ -15,6 +15,8 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 import datetime
 import functools
+import gzip
+import io
 import json
 import os
 import shutil
@@ -25,6 +27,7 @@ from unittest import TestCase
 
 from botocore.exceptions import ClientError
 from dateutil.tz import tzutc
+import mock
 
 from c7n.exceptions import PolicyValidationError
 from c7n.executor import MainThreadExecutor
@@ -77,6 +80,171 @@ class BucketScanLogTests(TestCase):
             self.assertEqual(data, [first_five, next_five, []])
 
 
+class LocalS3(object):
+    """In memory stand-in for the s3 api calls made by bucket scans."""
+
+    page_size = 2
+
+    def __init__(self, objects, fail_after=None):
+        self.objects = objects
+        self.fail_after = fail_after
+        self.inventories = []
+        self.listed = 0
+
+    def get_paginator(self, op):
+        return self
+
+    def paginate(self, **params):
+        params = dict(params)
+        while True:
+            page = self.list_objects(MaxKeys=self.page_size, **params)
+            yield page
+            if not page['IsTruncated']:
+                break
+            params['Marker'] = page['NextMarker']
+
+    def list_objects(self, Bucket, Prefix='', Delimiter=None, Marker='',
+                     MaxKeys=1000):
+        if self.fail_after is not None and self.listed >= self.fail_after:
+            raise ClientError(
+                {'Error': {'Code': 'SlowDown', 'Message': 'Reduce rate'}},
+                'ListObjects')
+        self.listed += 1
+        contents, prefixes = [], []
+        for k in sorted(self.objects[Bucket]):
+            if not k.startswith(Prefix) or k <= Marker:
+                continue
+            if Delimiter and Delimiter in k[len(Prefix):]:
+                p = k[:k.index(Delimiter, len(Prefix)) + 1]
+                if p not in prefixes:
+                    prefixes.append(p)
+                continue
+            if len(contents) == MaxKeys:
+                break
+            contents.append({'Key': k})
+        truncated = len(contents) == MaxKeys and (
+            contents[-1]['Key'] != max(
+                k for k in self.objects[Bucket] if k.startswith(Prefix)))
+        page = {'Contents': contents, 'IsTruncated': truncated,
+                'CommonPrefixes': [{'Prefix': p} for p in prefixes]}
+        if truncated:
+            page['NextMarker'] = contents[-1]['Key']
+        return page
+
+    def get_object(self, Bucket, Key):
+        return {'Body': io.BytesIO(self.objects[Bucket][Key])}
+
+    def list_bucket_inventory_configurations(self, Bucket):
+        return {'InventoryConfigurationList': self.inventories}
+
+
+class BucketScanTest(BaseTest):
+
+    class Scanner(s3.ScanBucket):
+
+        def process_chunk(self, batch, bucket):
+            self.scanned.extend(k['Key'] for k in batch)
+            return [k['Key'] for k in batch if k.get(
+                'EncryptionStatus', 'NOT-SSE') == 'NOT-SSE']
+
+    def get_scanner(self, client, data):
+        self.patch(s3, 'bucket_client', lambda s, b, kms=False: client)
+        self.patch(s3.ScanBucket, 'executor_factory', MainThreadExecutor)
+        self.patch(s3.ScanProgress, 'get_object_count', lambda self: 6)
+        p = self.load_policy(
+            {'name': 'scan', 'resource': 's3'}, session_factory=lambda: None)
+        p.resource_manager.log_dir = self.log_dir
+        scanner = self.Scanner(data, p.resource_manager)
+        scanner.scanned = []
+        return scanner
+
+    def setUp(self):
+        self.log_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.log_dir)
+
+    def test_scan_partition_checkpoint(self):
+        keys = ['a/1', 'a/2', 'a/3', 'b/1', 'b/2', 'root']
+        client = LocalS3(
+            {'bucket': {k: b'' for k in keys}}, fail_after=4)
+        scanner = self.get_scanner(
+            client, {'partition': True, 'checkpoint': True})
+        scanner.partition_workers = 1
+        checkpoint = s3.ScanCheckpoint(self.log_dir, 'bucket')
+
+        # listing is interrupted part way through the b/ partition
+        self.assertEqual(scanner.process_bucket({'Name': 'bucket'}), None)
+        self.assertEqual(scanner.scanned, ['root', 'a/1', 'a/2', 'a/3'])
+        self.assertEqual(
+            checkpoint.load().positions,
+            {'/': True, 'a/': True})
+
+        client.fail_after = None
+        scanner.scanned = []
+        result = scanner.process_bucket({'Name': 'bucket'})
+        self.assertEqual(scanner.scanned, ['b/1', 'b/2'])
+        self.assertEqual(
+            result, {'Bucket': 'bucket', 'Remediated': 2, 'Count': 2})
+        self.assertFalse(os.path.exists(checkpoint.path))
+
+    def test_scan_resume_position(self):
+        client = LocalS3({'bucket': {k: b'' for k in 'abcde'}})
+        scanner = self.get_scanner(client, {'checkpoint': True})
+        s3.ScanCheckpoint(self.log_dir, 'bucket').set('', {'Marker': 'b'})
+        scanner.process_bucket({'Name': 'bucket'})
+        self.assertEqual(scanner.scanned, ['c', 'd', 'e'])
+
+    def test_scan_progress(self):
+        progress = s3.ScanProgress({'Name': 'bucket'}, None)
+        self.patch(s3.ScanProgress, 'get_object_count', lambda self: 10)
+        self.assertEqual(progress.eta, None)
+        progress.start -= 2
+        progress.add(5)
+        progress.report(0)
+        self.assertEqual(progress.total, 10)
+        self.assertTrue(1.5 < progress.eta < 2.5)
+
+    def test_scan_inventory(self):
+        data = io.BytesIO()
+        with gzip.GzipFile(fileobj=data, mode='wb') as fh:
+            fh.write(
+                b'"bucket","a%2Fb","SSE-S3"\n'
+                b'"bucket","c+d","NOT-SSE"\n')
+        manifest = {'fileSchema': 'Bucket, Key, EncryptionStatus',
+                    'files': [{'key': 'inv/bucket/all/data/x.csv.gz'}]}
+        client = LocalS3({
+            'bucket': {'ignored': b''},
+            'inventories': {
+                'inv/bucket/all/2018-06-01T08-00Z/manifest.json': json.dumps(
+                    manifest).encode('utf8'),
+                'inv/bucket/all/data/x.csv.gz': data.getvalue()}})
+        client.inventories.append({
+            'Id': 'all', 'IsEnabled': True, 'IncludedObjectVersions': 'Current',
+            'Destination': {'S3BucketDestination': {
+                'Bucket': 'arn:aws:s3:::inventories', 'Prefix': 'inv',
+                'Format': 'CSV'}}})
+        scanner = self.get_scanner(client, {'inventory': 'al*'})
+        result = scanner.process_bucket({'Name': 'bucket'})
+        self.assertEqual(scanner.scanned, ['a/b', 'c d'])
+        self.assertEqual(
+            result, {'Bucket': 'bucket', 'Remediated': 1, 'Count': 2})
+
+        # without a delivered manifest the bucket is listed
+        scanner.data['inventory'] = 'other'
+        scanner.scanned = []
+        scanner.process_bucket({'Name': 'bucket'})
+        self.assertEqual(scanner.scanned, ['ignored'])
+
+    def test_encrypt_inventory_status(self):
+        action = s3.EncryptExtantKeys({'crypto': 'AES256'})
+        client = mock.MagicMock()
+        self.assertFalse(action.process_key(
+            client, {'Key': 'a', 'EncryptionStatus': 'SSE-KMS'}, 'bucket'))
+        self.assertFalse(action.process_version(
+            client, {'Key': 'a', 'VersionId': '1', 'IsLatest': True,
+                     'EncryptionStatus': 'SSE-S3'}, 'bucket'))
+        self.assertFalse(client.head_object.called)
+
+
 def destroyBucket(client, bucket):
     for o in client.list_objects(Bucket=bucket).get("Contents", []):
         client.delete_object(Bucket=bucket, Key=o["Key"])
@@ -112,6 +280,195 @@ def generateBucketContents(s3, bucket, contents=None):
         key.put(Body=v, ContentLength=len(v), ContentType="text/plain")
 
 
+class BucketStateStoreTest(BaseTest):
+
+    def get_store(self, path, name="644160558196:us-east-1"):
+        store = s3.BucketStateStore(path, name)
+        store.load()
+        return store
+
+    def test_state_store_refetches_changed(self):
+        path = os.path.join(self.get_temp_dir(), "s3", "state.json")
+        created = datetime.datetime(2018, 1, 1, tzinfo=tzutc())
+        buckets = [
+            {"Name": name, "CreationDate": created,
+             "Location": {"LocationConstraint": "us-west-2"}}
+            for name in ("a", "b")]
+
+        # first run, everything is fetched and persisted.
+        store = self.get_store(path)
+        self.assertEqual(store.get_stale(None, buckets), buckets)
+        store.update(buckets)
+        self.assertEqual(store.get_stale(None, buckets), [])
+
+        # next run, only changed buckets and new buckets are fetched.
+        store = self.get_store(path)
+        self.assertEqual(sorted(store.buckets), ["a", "b"])
+        self.patch(store, "get_changed", lambda factory: {"b"})
+        fetch = store.get_stale(None, buckets + [
+            {"Name": "c", "CreationDate": created}])
+        self.assertEqual([b["Name"] for b in fetch], ["b", "c"])
+        self.assertEqual(store.get_bucket("a"), buckets[0])
+        self.assertIsNot(store.get_bucket("a"), store.buckets["a"])
+
+        # buckets still stale when we stopped are refetched the next run.
+        store.save()
+        store = self.get_store(path)
+        self.patch(store, "get_changed", lambda factory: set())
+        self.assertEqual(
+            [b["Name"] for b in store.get_stale(None, buckets)], ["b"])
+
+    def test_state_store_changed_events(self):
+        store = s3.BucketStateStore("state", "644160558196:us-east-1")
+        self.assertEqual(store.get_changed(None), None)
+        store.swept = time.time()
+        store.buckets = {
+            "a": {"Name": "a", "Location": {"LocationConstraint": None}},
+            "b": {"Name": "b", "Location": None}}
+        client = mock.MagicMock()
+        client.get_paginator.return_value.paginate.return_value = [{"Events": [
+            {"ReadOnly": "false", "Resources": [
+                {"ResourceType": "AWS::S3::Bucket", "ResourceName": "a"}]},
+            {"ReadOnly": "true", "Resources": [
+                {"ResourceType": "AWS::S3::Bucket", "ResourceName": "b"}]}]}]
+        session = mock.MagicMock()
+        session.client.return_value = client
+        self.assertEqual(store.get_changed(lambda: session), {"a"})
+        session.client.assert_called_once_with("cloudtrail", region_name="us-east-1")
+
+        client.get_paginator.return_value.paginate.side_effect = ClientError(
+            {"Error": {"Code": "AccessDenied", "Message": "denied"}}, "LookupEvents")
+        self.assertEqual(store.get_changed(lambda: session), None)
+
+        session.client.side_effect = ValueError("no endpoint")
+        self.assertEqual(store.get_changed(lambda: session), None)
+
+    def test_state_store_evicts_failed_buckets(self):
+        path = os.path.join(self.get_temp_dir(), "state.json")
+        buckets = [{"Name": "a"}, {"Name": "b"}]
+        store = self.get_store(path)
+        store.get_stale(None, buckets)
+        store.update(buckets, ["a", "b"])
+        store.get_stale(None, buckets)
+        store.update([{"Name": "a"}], ["a", "b"])
+        self.assertEqual(sorted(self.get_store(path).buckets), ["a"])
+
+    def test_state_store_round_trips_datetimes(self):
+        path = os.path.join(self.get_temp_dir(), "state.json")
+        created = datetime.datetime(2018, 1, 1, tzinfo=tzutc())
+        bucket = {
+            "Name": "a", "CreationDate": created,
+            "Lifecycle": {"Rules": [{"Expiration": {"Date": created}}]},
+            "Tags": [{"Key": "c7n:datetime", "Value": "2018-01-01"}]}
+        store = self.get_store(path)
+        store.get_stale(None, [bucket])
+        store.update([bucket])
+        self.assertEqual(self.get_store(path).get_bucket("a"), bucket)
+
+    def test_state_store_evicts_unlisted_buckets(self):
+        path = os.path.join(self.get_temp_dir(), "state.json")
+        buckets = [{"Name": "a"}, {"Name": "b"}]
+        store = self.get_store(path)
+        store.get_stale(None, buckets)
+        store.update(buckets)
+        store.pending.add("b")
+
+        store.retain(["a"])
+        self.assertEqual(list(store.buckets), ["a"])
+        self.assertEqual(store.pending, set())
+        store.update([])
+        self.assertEqual(list(self.get_store(path).buckets), ["a"])
+
+        # listing buckets retains only those listed
+        manager = mock.MagicMock(config=Config.empty(
+            s3_state=path, account_id="644160558196"))
+        self.patch(
+            s3.query.DescribeSource, "resources", lambda self, query: [])
+        self.assertEqual(s3.DescribeS3(manager).resources({}), [])
+        self.assertEqual(s3.BucketStateStore.get(manager).buckets, {})
+
+    def test_state_store_per_account_region(self):
+        path = os.path.join(self.get_temp_dir(), "state.json")
+
+        def get_manager(account_id, region="us-east-1"):
+            return mock.MagicMock(config=Config.empty(
+                s3_state=path, account_id=account_id, region=region))
+
+        store = s3.BucketStateStore.get(get_manager("644160558196"))
+        self.assertIs(store, s3.BucketStateStore.get(get_manager("644160558196")))
+        self.assertIsNone(s3.BucketStateStore.get(get_manager(None)))
+        other = s3.BucketStateStore.get(get_manager("123456789012", "us-west-2"))
+        self.assertIsNot(store, other)
+
+        store.get_stale(None, [{"Name": "a"}])
+        store.update([{"Name": "a"}])
+        other.get_stale(None, [{"Name": "b"}])
+        other.update([{"Name": "b"}])
+        self.assertEqual(list(self.get_store(path).buckets), ["a"])
+        self.assertEqual(
+            list(self.get_store(path, "123456789012:us-west-2").buckets), ["b"])
+
+
+class BucketRegionTest(BaseTest):
+
+    def get_session(self):
+        clients = {}
+
+        def client(service, region_name=None, config=None):
+            return clients[region_name]
+
+        for region in ("us-east-1", "us-west-2", "eu-west-1"):
+            clients[region] = c = mock.MagicMock()
+            for m in s3.S3_AUGMENT_TABLE:
+                getattr(c, m[0]).side_effect = lambda **kw: {"ResponseMetadata": {}}
+        session = mock.MagicMock(region_name="us-east-1")
+        session.client.side_effect = client
+        self.patch(s3, "local_session", lambda factory: session)
+        return session, clients
+
+    def test_assemble_bucket_learns_region(self):
+        session, clients = self.get_session()
+        s3.assemble_bucket((None, {"Name": "a"}))
+        clients["us-east-1"].get_bucket_location.side_effect = lambda **kw: {
+            "LocationConstraint": "us-west-2", "ResponseMetadata": {}}
+        s3.assemble_bucket((None, {"Name": "b"}))
+        self.assertEqual(s3.BUCKET_REGIONS, {"a": "us-east-1", "b": "us-west-2"})
+        self.assertTrue(clients["us-west-2"].get_bucket_tagging.called)
+
+        # known regions go straight to a pooled client, without a location call
+        clients["us-west-2"].reset_mock()
+        b = s3.assemble_bucket((None, {"Name": "b"}))
+        self.assertEqual(b["Location"], {"LocationConstraint": "us-west-2"})
+        self.assertFalse(clients["us-west-2"].get_bucket_location.called)
+        self.assertTrue(clients["us-west-2"].get_bucket_acl.called)
+        self.assertEqual(
+            s3.bucket_client(session, {"Name": "b"}), clients["us-west-2"])
+        self.assertEqual(session.client.call_count, 2)
+
+    def test_assemble_bucket_redirect(self):
+        session, clients = self.get_session()
+        s3.BUCKET_REGIONS["a"] = "us-east-1"
+        clients["us-east-1"].get_bucket_tagging.side_effect = ClientError({
+            "Error": {"Code": "PermanentRedirect", "Message": "moved"},
+            "ResponseMetadata": {
+                "HTTPHeaders": {"x-amz-bucket-region": "eu-west-1"}}},
+            "GetBucketTagging")
+        b = s3.assemble_bucket((None, {"Name": "a"}))
+        self.assertEqual(s3.BUCKET_REGIONS["a"], "eu-west-1")
+        self.assertEqual(b["Location"], {"LocationConstraint": "eu-west-1"})
+        self.assertTrue(clients["eu-west-1"].get_bucket_tagging.called)
+
+    def test_bucket_regions_persisted(self):
+        cache = os.path.join(self.get_temp_dir(), "cloud-custodian.cache")
+        config = Config.empty(cache=cache, cache_period=15)
+        s3.BUCKET_REGIONS.update({"a": "us-west-2"})
+        s3.save_bucket_regions(config)
+        s3.BUCKET_REGIONS.clear()
+        s3.load_bucket_regions(config)
+        self.assertEqual(s3.BUCKET_REGIONS, {"a": "us-west-2"})
+        self.assertEqual(s3.get_bucket_regions_path(Config.empty()), None)
+
+
 class BucketMetrics(BaseTest):
 
     def test_metrics(self):
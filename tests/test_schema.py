@@ -14,11 +14,14 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 import mock
-from json import dumps
+import os
+from json import dumps, loads
 from jsonschema.exceptions import best_match
 
 from c7n.manager import resources
-from c7n.schema import Validator, validate, generate, specific_error
+from c7n.schema import (
+    Validator, PolicyValidator, validate, generate, get_validator,
+    load_schema, schema_cache_key, specific_error)
 from .common import BaseTest
 
 
@@ -95,6 +98,17 @@ class SchemaTest(BaseTest):
             "u'type': u'ebs'" in error.message or "'type': 'ebs'" in error.message
         )
 
+    def test_mode_queue_event_modes_only(self):
+        mode = {"queue": "arn:aws:sqs:us-east-1:123456789012:events",
+                "batch-size": 5}
+        data = {"policies": [{
+            "name": "test", "resource": "ec2",
+            "mode": dict(mode, type="cloudtrail", events=["RunInstances"])}]}
+        self.assertEqual(list(self.validator.iter_errors(data)), [])
+        data["policies"][0]["mode"] = dict(
+            mode, type="periodic", schedule="rate(1 hour)")
+        self.assertTrue(list(self.validator.iter_errors(data)))
+
     @mock.patch("c7n.schema.specific_error")
     def test_handle_specific_error_fail(self, mock_specific_error):
         from jsonschema.exceptions import ValidationError
@@ -318,3 +332,54 @@ class SchemaTest(BaseTest):
         self.assertEqual(len(errors_with("python2.7")), 0)
         self.assertEqual(len(errors_with("python3.6")), 0)
         self.assertEqual(len(errors_with("python4.5")), 1)
+
+    def test_policy_validator_resource_fast_path(self):
+        validator = PolicyValidator(generate())
+        data = {
+            "policies": [
+                {"name": "test", "resource": "ec2",
+                 "filters": [{"tag:Env": "dev"}]},
+                {"name": "test2", "resource": "aws.s3",
+                 "actions": ["delete"]}]}
+        self.assertTrue(validator.is_valid(data))
+        self.assertEqual(validator.validate(data), [])
+        self.assertEqual(
+            sorted(validator.resource_validators), ["aws.ec2", "aws.s3"])
+
+        data["policies"][1]["filters"] = [{"type": "ebs", "invalid": []}]
+        self.assertFalse(validator.is_valid(data))
+        self.assertEqual(len(validator.validate(data)), 1)
+
+    def test_policy_validator_unknown_resource(self):
+        validator = PolicyValidator(generate())
+        data = {"policies": [{"name": "test", "resource": "ec3"}]}
+        self.assertFalse(validator.is_valid(data))
+        self.assertIsNone(validator.get_resource_validator("ec3"))
+        self.assertEqual(len(validator.validate(data)), 1)
+
+    def test_schema_disk_cache(self):
+        cache_dir = self.get_temp_dir()
+        schema = load_schema(cache_dir)
+        self.assertEqual(
+            os.listdir(cache_dir), ["schema-%s.json" % schema_cache_key()])
+        with mock.patch("c7n.schema.generate") as generate_schema:
+            self.assertEqual(load_schema(cache_dir), loads(dumps(schema)))
+            self.assertFalse(generate_schema.called)
+
+    def test_validator_rebuilt_on_registration(self):
+        validator = get_validator()
+        with mock.patch("c7n.schema.schema_cache_key") as cache_key:
+            self.assertIs(get_validator(), validator)
+            self.assertFalse(cache_key.called)
+
+        registry = resources.get("ec2").filter_registry
+        registry.register(
+            "schema-test", type(str("SchemaTest"), (registry.get("value"),), {}))
+        self.addCleanup(registry.unregister, "schema-test")
+        self.assertIsNot(get_validator(), validator)
+
+    def test_schema_cache_key_includes_schemas(self):
+        key = schema_cache_key()
+        mark = resources.get("ec2").action_registry["mark"]
+        self.patch(mark, "schema", dict(mark.schema, extra={"type": "string"}))
+        self.assertNotEqual(schema_cache_key(), key)
@@ -0,0 +1,62 @@
+# Copyright 2018 Capital One Services, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import mock
+
+from c7n.config import Bag
+from c7n.filters.usage import UsageGraph
+
+from .common import BaseTest
+
+
+class UsageGraphTest(BaseTest):
+
+    def get_manager(self, region='us-east-1', **resources):
+        manager = mock.MagicMock()
+        manager.config = Bag(account_id='123456789012', region=region)
+        manager.get_resource_manager.side_effect = lambda rtype: mock.MagicMock(
+            resources=mock.MagicMock(return_value=resources[rtype.replace('-', '_')]))
+        return manager
+
+    def test_graph_shared_per_account_region(self):
+        manager = self.get_manager(ec2=[
+            {'InstanceId': 'i-1', 'ImageId': 'ami-1'},
+            {'InstanceId': 'i-2', 'ImageId': 'ami-1'}])
+        graph = UsageGraph.get(manager)
+        self.assertEqual(
+            graph.references('instance-image'), {'ami-1': {'i-1', 'i-2'}})
+        self.assertEqual(
+            UsageGraph.get(self.get_manager(ec2=[])).references('instance-image'),
+            {'ami-1': {'i-1', 'i-2'}})
+        self.assertEqual(manager.get_resource_manager.call_count, 1)
+        self.assertIsNot(
+            UsageGraph.get(self.get_manager(region='us-west-2')), graph)
+
+    def test_asg_references(self):
+        graph = UsageGraph(self.get_manager(
+            asg=[{'AutoScalingGroupName': 'web', 'LaunchConfigurationName': 'web-v2'},
+                 {'AutoScalingGroupName': 'worker'}],
+            launch_config=[
+                {'LaunchConfigurationName': 'web-v1', 'ImageId': 'ami-1',
+                 'SecurityGroups': ['sg-1'], 'ClassicLinkVPCSecurityGroups': []},
+                {'LaunchConfigurationName': 'web-v2', 'ImageId': 'ami-2',
+                 'SecurityGroups': [], 'ClassicLinkVPCSecurityGroups': ['sg-2']}]))
+        self.assertEqual(
+            graph.references('asg-launch-config'),
+            {'web-v2': {'web'}, 'worker': {'worker'}})
+        self.assertEqual(graph.references('asg-image'), {'ami-2': {'web-v2'}})
+        self.assertEqual(
+            graph.references('launch-config-sg'),
+            {'sg-1': {'web-v1'}, 'sg-2': {'web-v2'}})
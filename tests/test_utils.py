@@ -13,6 +13,7 @@
 # limitations under the License.
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+from datetime import datetime
 import json
 import os
 import unittest
@@ -22,6 +23,7 @@ import time
 
 from botocore.exceptions import ClientError
 from dateutil.parser import parse as parse_date
+from dateutil.tz import tzutc
 import six
 
 from c7n import ipaddress, utils
@@ -402,3 +404,62 @@ class UtilTest(unittest.TestCase):
                  'b': '{account_id}'}, account_id=21),
             {'k': '{limit}',
              'b': '21'})
+
+
+class ParseDateTest(unittest.TestCase):
+
+    def test_parse_iso_dates(self):
+        for v in (
+                '2018-01-02T03:04:05.000Z',
+                '2018-01-02T03:04:05Z',
+                '2018-01-02 03:04:05+05:30',
+                '2018-01-02T03:04:05.123456789-0800',
+                '2018-01-02T03:04:05',
+                'Tue, 02 Jan 2018 03:04:05 GMT'):
+            d = utils.parse_date(v)
+            self.assertEqual(d, parse_date(v))
+            self.assertEqual(d.utcoffset(), parse_date(v).utcoffset())
+
+    def test_parse_naive_date_default(self):
+        default = datetime.now(tz=tzutc())
+        v = '2018-01-02T03:04:05'
+        d = utils.parse_date(v, default=default)
+        self.assertEqual(d, parse_date(v, default=default))
+        self.assertEqual(d.tzinfo, tzutc())
+        self.assertEqual(utils.parse_date(v).tzinfo, None)
+
+    def test_date_epoch(self):
+        self.assertEqual(utils.date_epoch('1970-01-02T00:00:00Z'), 86400)
+        # naive dates are utc
+        self.assertEqual(utils.date_epoch('1970-01-02T00:00:00'), 86400)
+        self.assertEqual(
+            utils.date_epoch('1970-01-02T01:00:00+01:00'), 86400)
+        self.assertEqual(utils.date_epoch(None), None)
+
+
+class CidrSetTest(unittest.TestCase):
+
+    def test_contains(self):
+        cidrs = utils.CidrSet(
+            ["10.0.0.0/16", "10.1.0.0/16", "192.168.1.1", "2001:db8::/32", "bad"])
+        self.assertEqual(len(cidrs), 3)
+        self.assertTrue("10.1.255.0/24" in cidrs)
+        self.assertTrue("10.0.0.0/15" in cidrs)
+        self.assertTrue("192.168.1.1" in cidrs)
+        self.assertTrue("2001:db8:1::/48" in cidrs)
+        self.assertFalse("10.0.0.0/8" in cidrs)
+        self.assertFalse("192.168.1.2" in cidrs)
+        self.assertFalse("2001:db9::1" in cidrs)
+        self.assertFalse("not-a-cidr" in cidrs)
+
+    def test_overlaps(self):
+        cidrs = utils.CidrSet(["10.0.0.0/16", "0.0.0.0/32"])
+        self.assertTrue(cidrs.overlaps("10.0.0.0/8"))
+        self.assertTrue(cidrs.overlaps("10.0.255.255"))
+        self.assertFalse(cidrs.overlaps("10.1.0.0/16"))
+        self.assertFalse(cidrs.overlaps("::/0"))
+
+    def test_parse_cidr_cache(self):
+        self.assertIs(
+            utils.parse_cidr("10.0.0.0/24"), utils.parse_cidr("10.0.0.0/24"))
+        self.assertIsNone(utils.parse_cidr("10.0.0.300"))
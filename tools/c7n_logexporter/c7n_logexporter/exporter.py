@@ -15,6 +15,7 @@
 from botocore.exceptions import ClientError
 import boto3
 import click
+import collections
 import json
 from c7n.credentials import assumed_session
 from c7n.utils import get_retry, dumps, chunks
@@ -331,19 +332,19 @@ def process_account(account, start, end, destination, incremental=True):
                     account.get('name', account_id), "\n  ".join(
                         [g['logGroupName'] for g in all_groups]))
     t = time.time()
+    scheduler = ExportScheduler(
+        client, boto3.Session().client('s3'), destination['bucket'],
+        name=account['name'])
     for g in groups:
-        export.callback(
-            g,
-            destination['bucket'], prefix,
-            g['exportStart'], end, account['role'],
-            name=account['name'])
+        scheduler.add(g, prefix, g['exportStart'], end)
+    scheduler.run()
 
     log.info("account:%s exported %d log groups in time:%0.2f",
              account.get('name') or account_id,
              len(groups), time.time() - t)
 
 
-def get_session(role, region, session_name="c7n-log-exporter", session=None):
+def get_session(role, region=None, session_name="c7n-log-exporter", session=None):
     if role == 'self':
         session = boto3.Session()
     elif isinstance(role, six.string_types):
@@ -449,6 +450,206 @@ def filter_extant_exports(client, bucket, prefix, days, start, end=None):
     return [d for d in sorted(days) if d > last_export]
 
 
+class ExportScheduler(object):
+    """Keep an account's export task slot busy.
+
+    CloudWatch Logs runs one export task at a time per account, so the
+    days to export across an account's groups are queued, the state of
+    the running task is polled, and the next export is created as soon
+    as it finishes rather than after a fixed sleep.
+
+    Export progress is kept in the tags on a group's prefix key in the
+    destination bucket, LastExport is the last day whose export completed
+    and ExportTask/ExportDay the export in flight, so a restarted run
+    waits on or retries that export and resumes with the next day.
+    """
+
+    # Seconds between export task status checks.
+    poll_period = 15
+
+    active_states = ('PENDING', 'RUNNING', 'PENDING_CANCEL')
+
+    def __init__(self, client, s3, bucket, name="", poll_period=None):
+        self.client = client
+        self.s3 = s3
+        self.bucket = bucket
+        self.name = name
+        if poll_period is not None:
+            self.poll_period = poll_period
+        self.queue = collections.deque()
+        self.resumed = []
+        self.retry = get_retry(('SlowDown',))
+        self.exported = 0
+
+    def add(self, group, prefix, start, end):
+        """Queue the days of a group not yet exported."""
+        start = start.replace(tzinfo=tzlocal()).astimezone(tzutc())
+        end = end.replace(tzinfo=tzlocal()).astimezone(tzutc())
+        if prefix:
+            prefix = "%s/%s" % (prefix.rstrip('/'), group['logGroupName'].strip('/'))
+        else:
+            prefix = group['logGroupName']
+        named_group = "%s:%s" % (self.name, group['logGroupName'])
+        log.info(
+            "Log exporting group:%s start:%s end:%s bucket:%s prefix:%s size:%s",
+            named_group, start.strftime('%Y/%m/%d'), end.strftime('%Y/%m/%d'),
+            self.bucket, prefix, group['storedBytes'])
+
+        days = [(
+            start + timedelta(i)).replace(minute=0, hour=0, second=0, microsecond=0)
+            for i in range((end - start).days)]
+        day_count = len(days)
+        days = filter_extant_exports(self.s3, self.bucket, prefix, days, start, end)
+        self.ensure_prefix(prefix)
+
+        tags = self.get_tags(prefix)
+        if 'ExportTask' in tags:
+            day = parse(tags['ExportDay'])
+            self.resumed.append(
+                (tags['ExportTask'], (group['logGroupName'], prefix, day)))
+            days = [d for d in days if d > day]
+
+        log.info("Group:%s filtering s3 extant keys from %d to %d start:%s end:%s",
+                 named_group, day_count, len(days),
+                 days[0] if days else '', days[-1] if days else '')
+        self.queue.extend([(group['logGroupName'], prefix, d) for d in days])
+
+    def run(self):
+        """Export all queued days, one export task at a time."""
+        for task_id, export in self.resumed:
+            log.info("group:%s:%s waiting on resumed export task:%s",
+                     self.name, export[0], task_id)
+            status = self.wait(task_id)
+            if status == 'COMPLETED':
+                self.complete(export, task_id, status)
+            else:
+                # export again
+                self.queue.appendleft(export)
+        self.resumed = []
+
+        while self.queue:
+            export = self.queue.popleft()
+            task_id = self.start(export)
+            self.complete(export, task_id, self.wait(task_id))
+        return self.exported
+
+    def start(self, export):
+        group_name, prefix, day = export
+        params = get_export_params(group_name, self.bucket, prefix, day)
+        while True:
+            try:
+                task_id = self.client.create_export_task(**params)['taskId']
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'LimitExceededException':
+                    raise
+                # an export started elsewhere is running, wait on it.
+                self.wait(self.get_active_task())
+                continue
+            self.set_tags(prefix, ExportTask=task_id, ExportDay=day.isoformat())
+            return task_id
+
+    def wait(self, task_id):
+        """Poll an export task until it finishes, returning its status."""
+        t = time.time()
+        while task_id is not None:
+            try:
+                tasks = self.client.describe_export_tasks(
+                    taskId=task_id).get('exportTasks', ())
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ResourceNotFoundException':
+                    raise
+                tasks = ()
+            if not tasks:
+                return None
+            status = tasks[0]['status']['code']
+            if status not in self.active_states:
+                log.debug("export task:%s %s time:%0.2f",
+                          task_id, status, time.time() - t)
+                return status
+            time.sleep(self.poll_period)
+        time.sleep(self.poll_period)
+
+    def get_active_task(self):
+        for state in ('RUNNING', 'PENDING'):
+            tasks = self.client.describe_export_tasks(
+                statusCode=state, limit=1).get('exportTasks', ())
+            if tasks:
+                return tasks[0]['taskId']
+
+    def complete(self, export, task_id, status):
+        group_name, prefix, day = export
+        if status == 'COMPLETED':
+            self.set_tags(prefix, LastExport=day.isoformat())
+            self.exported += 1
+            log.info(
+                "Log export group:%s:%s day:%s bucket:%s prefix:%s task:%s",
+                self.name, group_name, day.strftime("%Y-%m-%d"),
+                self.bucket, prefix, task_id)
+            return
+        # Later days can't be marked exported past a missing day, they're
+        # left to the next run.
+        self.set_tags(prefix)
+        skipped = [e for e in self.queue if e[1] == prefix]
+        for e in skipped:
+            self.queue.remove(e)
+        log.error(
+            "Log export group:%s:%s day:%s task:%s status:%s skipped days:%d",
+            self.name, group_name, day.strftime("%Y-%m-%d"), task_id,
+            status, len(skipped))
+
+    def ensure_prefix(self, prefix):
+        try:
+            self.s3.head_object(Bucket=self.bucket, Key=prefix)
+        except ClientError as e:
+            if e.response['Error']['Code'] != '404':  # Not Found
+                raise
+            self.s3.put_object(
+                Bucket=self.bucket,
+                Key=prefix,
+                Body=json.dumps({}),
+                ACL="bucket-owner-full-control",
+                ServerSideEncryption="AES256")
+
+    def get_tags(self, prefix):
+        try:
+            tag_set = self.s3.get_object_tagging(
+                Bucket=self.bucket, Key=prefix).get('TagSet', [])
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'NoSuchKey':
+                raise
+            tag_set = []
+        return {t['Key']: t['Value'] for t in tag_set}
+
+    def set_tags(self, prefix, **values):
+        """Update export state tags, the in-flight export is always reset."""
+        tags = self.get_tags(prefix)
+        tags.pop('ExportTask', None)
+        tags.pop('ExportDay', None)
+        tags.update(values)
+        self.retry(
+            self.s3.put_object_tagging,
+            Bucket=self.bucket, Key=prefix,
+            Tagging={'TagSet': [
+                {'Key': k, 'Value': v} for k, v in sorted(tags.items())]})
+
+
+def get_export_params(group_name, bucket, prefix, day):
+    date = day.replace(minute=0, microsecond=0, hour=0)
+    return {
+        'taskName': "%s-%s" % ("c7n-log-exporter",
+                               date.strftime("%Y-%m-%d")),
+        'logGroupName': group_name,
+        'fromTime': int(time.mktime(
+            date.replace(
+                minute=0, microsecond=0, hour=0).timetuple()) * 1000),
+        'to': int(time.mktime(
+            date.replace(
+                minute=59, hour=23, microsecond=0).timetuple()) * 1000),
+        'destination': bucket,
+        'destinationPrefix': "%s%s" % (prefix, date.strftime("/%Y/%m/%d"))
+    }
+
+
 @cli.command()
 @click.option('--config', type=click.Path(), required=True)
 @click.option('-a', '--accounts', multiple=True)
@@ -763,143 +964,48 @@ def get_exports(client, bucket, prefix, latest=True):
 @click.option('--start', required=True, help="export logs from this date")
 @click.option('--end')
 @click.option('--role', help="sts role to assume for log group access")
-@click.option('--poll-period', type=float, default=300)
+@click.option('--poll-period', type=float, default=15,
+              help="seconds between export task status checks")
 # @click.option('--bucket-role', help="role to scan destination bucket")
 # @click.option('--stream-prefix)
 @lambdafan
-def export(group, bucket, prefix, start, end, role, poll_period=120, session=None, name=""):
+def export(group, bucket, prefix, start, end, role, poll_period=None,
+           session=None, name=""):
     """export a given log group to s3"""
     start = start and isinstance(start, six.string_types) and parse(start) or start
     end = (end and isinstance(start, six.string_types) and
            parse(end) or end or datetime.now())
-    start = start.replace(tzinfo=tzlocal()).astimezone(tzutc())
-    end = end.replace(tzinfo=tzlocal()).astimezone(tzutc())
 
     if session is None:
         session = get_session(role)
 
     client = session.client('logs')
 
-    paginator = client.get_paginator('describe_log_groups')
-    for p in paginator.paginate():
-        found = False
-        for _group in p['logGroups']:
-            if _group['logGroupName'] == group:
-                group = _group
-                found = True
-                break
-        if found:
-            break
-
-    if not found:
-        raise ValueError("Log group %s not found." % group)
-
-    if prefix:
-        prefix = "%s/%s" % (prefix.rstrip('/'), group['logGroupName'].strip('/'))
-    else:
-        prefix = group['logGroupName']
+    if isinstance(group, six.string_types):
+        groups = client.describe_log_groups(
+            logGroupNamePrefix=group).get('logGroups', ())
+        groups = [g for g in groups if g['logGroupName'] == group]
+        if not groups:
+            raise ValueError("Log group %s not found." % group)
+        group = groups[0]
 
-    named_group = "%s:%s" % (name, group['logGroupName'])
-    log.info(
-        "Log exporting group:%s start:%s end:%s bucket:%s prefix:%s size:%s",
-        named_group,
-        start.strftime('%Y/%m/%d'),
-        end.strftime('%Y/%m/%d'),
-        bucket,
-        prefix,
-        group['storedBytes'])
-
-    t = time.time()
-    days = [(
-        start + timedelta(i)).replace(minute=0, hour=0, second=0, microsecond=0)
-        for i in range((end - start).days)]
-    day_count = len(days)
-    s3 = boto3.Session().client('s3')
-    days = filter_extant_exports(s3, bucket, prefix, days, start, end)
-
-    log.info("Group:%s filtering s3 extant keys from %d to %d start:%s end:%s",
-             named_group, day_count, len(days),
-             days[0] if days else '', days[-1] if days else '')
     t = time.time()
-
-    retry = get_retry(('SlowDown',))
-
-    for idx, d in enumerate(days):
-        date = d.replace(minute=0, microsecond=0, hour=0)
-        export_prefix = "%s%s" % (prefix, date.strftime("/%Y/%m/%d"))
-        params = {
-            'taskName': "%s-%s" % ("c7n-log-exporter",
-                                   date.strftime("%Y-%m-%d")),
-            'logGroupName': group['logGroupName'],
-            'fromTime': int(time.mktime(
-                date.replace(
-                    minute=0, microsecond=0, hour=0).timetuple()) * 1000),
-            'to': int(time.mktime(
-                date.replace(
-                    minute=59, hour=23, microsecond=0).timetuple()) * 1000),
-            'destination': bucket,
-            'destinationPrefix': export_prefix
-        }
-
-        # if stream_prefix:
-        #    params['logStreamPrefix'] = stream_prefix
-        try:
-            s3.head_object(Bucket=bucket, Key=prefix)
-        except ClientError as e:
-            if e.response['Error']['Code'] != '404':  # Not Found
-                raise
-            s3.put_object(
-                Bucket=bucket,
-                Key=prefix,
-                Body=json.dumps({}),
-                ACL="bucket-owner-full-control",
-                ServerSideEncryption="AES256")
-
-        t = time.time()
-        counter = 0
-        while True:
-            counter += 1
-            try:
-                result = client.create_export_task(**params)
-            except ClientError as e:
-                if e.response['Error']['Code'] == 'LimitExceededException':
-                    time.sleep(poll_period)
-                    # log every 30m of export waiting
-                    if counter % 6 == 0:
-                        log.debug(
-                            "group:%s day:%s waiting for %0.2f minutes",
-                            named_group, d.strftime('%Y-%m-%d'),
-                            (counter * poll_period) / 60.0)
-                    continue
-                raise
-            retry(
-                s3.put_object_tagging,
-                Bucket=bucket, Key=prefix,
-                Tagging={
-                    'TagSet': [{
-                        'Key': 'LastExport',
-                        'Value': d.isoformat()}]})
-            break
-
-        log.info(
-            "Log export time:%0.2f group:%s day:%s bucket:%s prefix:%s task:%s",
-            time.time() - t,
-            named_group,
-            d.strftime("%Y-%m-%d"),
-            bucket,
-            params['destinationPrefix'],
-            result['taskId'])
+    scheduler = ExportScheduler(
+        client, boto3.Session().client('s3'), bucket,
+        name=name, poll_period=poll_period)
+    scheduler.add(group, prefix, start, end)
+    days = scheduler.run()
 
     log.info(
-        ("Exported log group:%s time:%0.2f days:%d start:%s"
-         " end:%s bucket:%s prefix:%s"),
-        named_group,
+        ("Exported log group:%s:%s time:%0.2f days:%d start:%s"
+         " end:%s bucket:%s"),
+        name,
+        group['logGroupName'],
         time.time() - t,
-        len(days),
+        days,
         start.strftime('%Y/%m/%d'),
         end.strftime('%Y/%m/%d'),
-        bucket,
-        prefix)
+        bucket)
 
 
 if __name__ == '__main__':
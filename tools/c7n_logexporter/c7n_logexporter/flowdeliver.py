@@ -19,21 +19,25 @@ Intermediate lambda to convert firehose s3 to log group export format.
 import boto3
 from datetime import datetime
 import gc
-import gzip
 import json
 import logging
 import os
-import tempfile
 import uuid
 
 from six.moves.urllib.parse import unquote_plus
 
+from c7n_logexporter.reaggregate import DecompressingReader, Reaggregator
+
 s3 = boto3.client('s3')
 log = logging.getLogger('logregate')
 
 BUCKET = os.environ.get('DESTINATION_BUCKET')
 BUCKET_PREFIX = os.environ.get('DESTINATION_PREFIX')
-EVENTS_SIZE_BUFFER = int(os.environ.get('EVENTS_SIZE_BUFFER', 1900000))
+# Compressed bytes buffered across streams before flushing parts.
+BUFFER_SIZE = int(os.environ.get('BUFFER_SIZE', 1024 * 1024 * 64))
+PART_SIZE = int(os.environ.get('PART_SIZE', 1024 * 1024 * 8))
+MAX_STREAMS = int(os.environ.get('MAX_STREAMS', 64))
+FLUSH_PERIOD = int(os.environ.get('FLUSH_PERIOD', 300))
 
 
 def handle(event, context):
@@ -62,77 +66,37 @@ def handle(event, context):
 
 
 def process_firehose_archive(bucket, key):
-    """Download firehose archive, aggregate records in memory and write back."""
-    data = {}
-    with tempfile.NamedTemporaryFile(mode='w+b') as fh:
-        s3.download_file(bucket, key, fh.name)
-        log.warning("Downloaded Key Size:%s Key:%s",
-                    sizeof_fmt(os.path.getsize(fh.name)), key)
-        fh.seek(0, 0)
-        record_count = 0
-        iteration_count = 0
-        for r in records_iter(gzip.GzipFile(fh.name, mode='r')):
+    """Stream a firehose archive, writing back records per log stream."""
+    body = s3.get_object(Bucket=bucket, Key=key)['Body']
+    aggregator = Reaggregator(
+        s3, BUCKET, get_record_key, buffer_size=BUFFER_SIZE,
+        part_size=PART_SIZE, max_streams=MAX_STREAMS,
+        flush_period=FLUSH_PERIOD)
+    record_count = 0
+    try:
+        for r in records_iter(DecompressingReader(body)):
             record_count += len(r['logEvents'])
-            iteration_count += 1
-            key = '%s/%s/%s' % (r['owner'], r['logGroup'], r['logStream'])
-            data.setdefault(key, []).extend(r['logEvents'])
-            if record_count > EVENTS_SIZE_BUFFER:
-                log.warning(
-                    "Incremental Data Load records:%d enis:%d",
-                    record_count,
-                    len(data))
-                for k in data:
-                    process_record_set(k, data[k])
-                data.clear()
-                gc.collect()
-                record_count = 0
-
-        for k in data:
-            process_record_set(k, data[k])
-        data.clear()
-        gc.collect()
-
-
-def process_record_set(k, records):
-    owner, group, stream = k.split('/')
-    records_begin = datetime.fromtimestamp(
-        records[0]['timestamp'] / 1000)
-
-    records_key = str(uuid.uuid4())
-    out_key = "%s/%s/%s/%s/%s/%s/%s.gz" % (
+            aggregator.add(
+                (r['owner'], r['logGroup'], r['logStream']), r['logEvents'])
+        aggregator.close()
+    finally:
+        aggregator.abort()
+    log.warning("Processed Key:%s records:%d keys:%d",
+                key, record_count, len(aggregator.keys))
+    gc.collect()
+
+
+def get_record_key(stream_id, first_event):
+    owner, group, stream = stream_id
+    records_begin = datetime.fromtimestamp(first_event['timestamp'] / 1000)
+    return "%s/%s/%s/%s/%s/%s/%s.gz" % (
         BUCKET_PREFIX.strip('/'),
         owner,
         group,
         records_begin.strftime('%Y/%m/%d'),
         '00000000-0000-0000-0000-000000000000',
         stream,
-        records_key)
-
-    with tempfile.NamedTemporaryFile() as out_fh:
-        with gzip.GzipFile(
-                records_key, mode='wb',
-                fileobj=open(out_fh.name, 'wb')) as records_fh:
-            timestamp = None
-            record_counter = 0
-            buf = []
-            for r in records:
-                record_counter += 1
-                timestamp = datetime.fromtimestamp(
-                    r['timestamp'] / 1000).strftime(
-                        '%Y-%m-%dT%H:%M:%S.%fZ')
-                buf.append('%s %s\n' % (timestamp, r['message']))
-                if record_counter % 100 == 0:
-                    records_fh.write("".join(buf).encode('utf8'))
-                    buf = []
-            if buf:
-                records_fh.write("".join(buf).encode('utf8'))
-            records_fh.close()
-            s3.put_object(
-                Bucket=BUCKET,
-                Key=out_key,
-                ACL='bucket-owner-full-control',
-                ServerSideEncryption='AES256',
-                Body=out_fh.read())
+        str(uuid.uuid4()))
 
 
 def records_iter(fh, buffer_size=1024 * 1024 * 16):
@@ -143,25 +107,22 @@ def records_iter(fh, buffer_size=1024 * 1024 * 16):
     the records on boundaries. In the context of flow logs we're
     dealing with delimited records.
     """
-    buf = None
+    buf = b''
     while True:
         chunk = fh.read(buffer_size)
         if not chunk:
-            if buf:
-                yield json.loads(buf)
-            return
-        if buf:
-            chunk = b"%s%s" % (buf, chunk)
-            buf = None
-        while chunk:
-            idx = chunk.find(b'}{')
+            break
+        buf = buf and buf + chunk or chunk
+        start = 0
+        while True:
+            idx = buf.find(b'}{', start)
             if idx == -1:
-                buf = chunk
-                chunk = None
-                continue
-            record = chunk[:idx + 1]
-            yield json.loads(record)
-            chunk = chunk[idx + 1:]
+                break
+            yield json.loads(buf[start:idx + 1].decode('utf8'))
+            start = idx + 1
+        buf = buf[start:]
+    if buf:
+        yield json.loads(buf.decode('utf8'))
 
 
 def sizeof_fmt(num, suffix='B'):
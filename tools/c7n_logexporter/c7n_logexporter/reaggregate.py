@@ -0,0 +1,229 @@
+# Copyright 2018 Capital One Services, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Bounded memory re-aggregation of log events into s3 export format.
+
+Log events are routed to a gzip writer per log stream, which compresses
+them as they arrive and uploads its output in multipart upload parts
+once large enough. Memory use is bounded by the compressed bytes held
+across writers and the number of open writers, not the size of the
+input.
+"""
+from collections import OrderedDict
+from datetime import datetime
+import io
+import logging
+import time
+import zlib
+
+log = logging.getLogger('c7n_logexporter')
+
+# S3 minimum size for all but the last part of a multipart upload.
+MIN_PART_SIZE = 1024 * 1024 * 5
+
+
+def format_event(e):
+    return '%s %s\n' % (
+        datetime.fromtimestamp(e['timestamp'] / 1000).strftime(
+            '%Y-%m-%dT%H:%M:%S.%fZ'),
+        e['message'])
+
+
+class PartWriter(object):
+    """Gzip log events to an s3 key incrementally.
+
+    Compressed output is buffered until it reaches the part size and
+    then uploaded as a part of a multipart upload, output that never
+    reaches the part size is written with a single put.
+    """
+
+    def __init__(self, client, bucket, key, part_size=MIN_PART_SIZE,
+                 compresslevel=5):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.compressor = zlib.compressobj(
+            compresslevel, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+        self.buf = io.BytesIO()
+        self.upload_id = None
+        self.parts = []
+        self.created = time.time()
+        self.event_count = 0
+
+    @property
+    def buffered(self):
+        return self.buf.tell()
+
+    def write(self, events):
+        data = "".join([format_event(e) for e in events]).encode('utf8')
+        self.buf.write(self.compressor.compress(data))
+        self.event_count += len(events)
+        if self.buffered >= self.part_size:
+            self.flush()
+
+    def flush(self):
+        """Upload buffered output as a part, if it can be one."""
+        if self.buffered < MIN_PART_SIZE:
+            return False
+        if self.upload_id is None:
+            self.upload_id = self.client.create_multipart_upload(
+                Bucket=self.bucket, Key=self.key,
+                ACL='bucket-owner-full-control',
+                ServerSideEncryption='AES256')['UploadId']
+        self.upload_part(self.buf.getvalue())
+        self.buf = io.BytesIO()
+        return True
+
+    def upload_part(self, data):
+        part_number = len(self.parts) + 1
+        response = self.client.upload_part(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+            PartNumber=part_number, Body=data)
+        self.parts.append({'PartNumber': part_number, 'ETag': response['ETag']})
+
+    def close(self):
+        self.buf.write(self.compressor.flush())
+        data = self.buf.getvalue()
+        self.buf = None
+        if self.upload_id is None:
+            self.client.put_object(
+                Bucket=self.bucket, Key=self.key, Body=data,
+                ACL='bucket-owner-full-control',
+                ServerSideEncryption='AES256')
+            return
+        try:
+            self.upload_part(data)
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                MultipartUpload={'Parts': self.parts})
+        except Exception:
+            self.abort()
+            raise
+
+    def abort(self):
+        """Discard the output, aborting the multipart upload if started."""
+        self.buf = None
+        if self.upload_id is None:
+            return
+        upload_id, self.upload_id = self.upload_id, None
+        self.client.abort_multipart_upload(
+            Bucket=self.bucket, Key=self.key, UploadId=upload_id)
+
+
+class Reaggregator(object):
+    """Route log events to a part writer per stream.
+
+    key_func is called with a stream id and the first event written for
+    it and returns the output key. A stream's writer is closed when it
+    has been open longer than the flush period, and when the compressed
+    bytes buffered across writers exceed the buffer size or too many
+    writers are open, the largest or least recently used writers are
+    flushed or closed. Closed streams get a new output key on their next
+    event.
+    """
+
+    def __init__(self, client, bucket, key_func, buffer_size=1024 * 1024 * 64,
+                 part_size=MIN_PART_SIZE, max_streams=64, flush_period=300):
+        self.client = client
+        self.bucket = bucket
+        self.key_func = key_func
+        self.buffer_size = buffer_size
+        self.part_size = part_size
+        self.max_streams = max_streams
+        self.flush_period = flush_period
+        self.writers = OrderedDict()
+        self.buffered = 0
+        self.keys = []
+
+    def add(self, stream_id, events):
+        if not events:
+            return
+        writer = self.writers.pop(stream_id, None)
+        if writer is None:
+            writer = PartWriter(
+                self.client, self.bucket, self.key_func(stream_id, events[0]),
+                self.part_size)
+            self.keys.append(writer.key)
+        # most recently used last
+        self.writers[stream_id] = writer
+        before = writer.buffered
+        writer.write(events)
+        self.buffered += writer.buffered - before
+
+        if writer.created < time.time() - self.flush_period:
+            self.close_stream(stream_id)
+        self.shrink()
+
+    def shrink(self):
+        while len(self.writers) > self.max_streams:
+            self.close_stream(next(iter(self.writers)))
+        while self.buffered > self.buffer_size:
+            stream_id, writer = max(
+                self.writers.items(), key=lambda i: i[1].buffered)
+            before = writer.buffered
+            if writer.flush():
+                self.buffered -= before
+            else:
+                self.close_stream(stream_id)
+
+    def close_stream(self, stream_id):
+        writer = self.writers.pop(stream_id)
+        self.buffered -= writer.buffered
+        writer.close()
+
+    def close(self):
+        while self.writers:
+            self.close_stream(next(iter(self.writers)))
+
+    def abort(self):
+        """Abort the uploads of open writers, a no-op once closed.
+
+        Callers should abort when processing fails, else the parts of
+        open multipart uploads are kept (and billed) until s3 expires
+        them.
+        """
+        while self.writers:
+            stream_id, writer = self.writers.popitem(last=False)
+            try:
+                writer.abort()
+            except Exception as e:
+                log.warning("Error aborting upload of %s: %s", writer.key, e)
+        self.buffered = 0
+
+
+class DecompressingReader(object):
+    """File-like reads of a gzip stream, decompressed as they're read."""
+
+    def __init__(self, body, chunk_size=1024 * 1024):
+        self.body = body
+        self.chunk_size = chunk_size
+        self.decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+        self.pending = b''
+        self.eof = False
+
+    def read(self, size):
+        while len(self.pending) < size and not self.eof:
+            data = self.body.read(self.chunk_size)
+            if not data:
+                self.pending += self.decompressor.flush()
+                self.eof = True
+                break
+            self.pending += self.decompressor.decompress(data)
+            # concatenated gzip members
+            while self.decompressor.unused_data:
+                data = self.decompressor.unused_data
+                self.decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+                self.pending += self.decompressor.decompress(data)
+        data, self.pending = self.pending[:size], self.pending[size:]
+        return data
@@ -0,0 +1,215 @@
+# Copyright 2018 Capital One Services, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import binascii
+import gzip
+import io
+import os
+import unittest
+import zlib
+
+from c7n_logexporter.reaggregate import (
+    DecompressingReader, PartWriter, Reaggregator, format_event)
+
+
+class FakeS3(object):
+    """Records uploads, assembling completed multipart uploads by key."""
+
+    def __init__(self, fail=()):
+        self.fail = fail
+        self.objects = {}
+        self.uploads = {}
+        self.aborted = []
+
+    def check(self, op):
+        if op in self.fail:
+            raise ValueError(op)
+
+    def put_object(self, Bucket, Key, Body, **kw):
+        self.check('put_object')
+        self.objects[Key] = Body
+
+    def create_multipart_upload(self, Bucket, Key, **kw):
+        upload_id = 'upload-%d' % len(self.uploads)
+        self.uploads[upload_id] = []
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.check('upload_part')
+        self.uploads[UploadId].append(Body)
+        return {'ETag': '%s-%d' % (UploadId, PartNumber)}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self.check('complete_multipart_upload')
+        parts = self.uploads.pop(UploadId)
+        assert len(parts) == len(MultipartUpload['Parts'])
+        self.objects[Key] = b''.join(parts)
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.uploads.pop(UploadId)
+        self.aborted.append(Key)
+
+
+def get_events(count, start=0):
+    # random payloads, about 270 bytes an event once compressed
+    return [{'timestamp': 1520000000000 + i,
+             'message': binascii.hexlify(os.urandom(256)).decode('ascii')}
+            for i in range(start, start + count)]
+
+
+def decompress(data):
+    return zlib.decompress(data, zlib.MAX_WBITS | 16).decode('utf8')
+
+
+class PartWriterTest(unittest.TestCase):
+
+    def test_small_output_single_put(self):
+        client = FakeS3()
+        writer = PartWriter(client, 'bucket', 'key')
+        events = get_events(10)
+        writer.write(events)
+        self.assertFalse(writer.flush())
+        writer.close()
+        self.assertEqual(client.uploads, {})
+        self.assertEqual(
+            decompress(client.objects['key']),
+            ''.join(format_event(e) for e in events))
+
+    def test_multipart_upload(self):
+        client = FakeS3()
+        writer = PartWriter(client, 'bucket', 'key')
+        events = get_events(30000)
+        for idx in range(0, len(events), 1000):
+            writer.write(events[idx:idx + 1000])
+        writer.close()
+        self.assertTrue(len(writer.parts) > 1)
+        self.assertEqual(client.uploads, {})
+        self.assertEqual(
+            decompress(client.objects['key']),
+            ''.join(format_event(e) for e in events))
+
+    def test_close_failure_aborts(self):
+        client = FakeS3(fail=('complete_multipart_upload',))
+        writer = PartWriter(client, 'bucket', 'key')
+        writer.write(get_events(30000))
+        self.assertRaises(ValueError, writer.close)
+        self.assertEqual(client.aborted, ['key'])
+        self.assertEqual(client.uploads, {})
+        # aborting again is a no-op
+        writer.abort()
+        self.assertEqual(client.aborted, ['key'])
+
+
+class ReaggregatorTest(unittest.TestCase):
+
+    def get_aggregator(self, client, **kw):
+        return Reaggregator(
+            client, 'bucket', lambda stream_id, e: '%s/%d' % (
+                stream_id, e['timestamp']), **kw)
+
+    def test_streams_written_per_key(self):
+        client = FakeS3()
+        aggregator = self.get_aggregator(client)
+        aggregator.add('a', get_events(2))
+        aggregator.add('b', get_events(3))
+        aggregator.add('a', get_events(1, start=2))
+        aggregator.add('c', [])
+        aggregator.close()
+        self.assertEqual(aggregator.keys, ['a/1520000000000', 'b/1520000000000'])
+        self.assertEqual(len(decompress(
+            client.objects['a/1520000000000']).splitlines()), 3)
+        self.assertEqual(aggregator.buffered, 0)
+
+    def test_max_streams(self):
+        client = FakeS3()
+        aggregator = self.get_aggregator(client, max_streams=2)
+        for stream_id in 'abc':
+            aggregator.add(stream_id, get_events(1))
+        # least recently used stream was closed
+        self.assertEqual(list(client.objects), ['a/1520000000000'])
+        self.assertEqual(list(aggregator.writers), ['b', 'c'])
+        # and gets a new key on its next event
+        aggregator.add('a', get_events(1, start=5))
+        aggregator.close()
+        self.assertIn('a/1520000000005', client.objects)
+
+    def test_buffer_size_flushes_largest(self):
+        client = FakeS3()
+        aggregator = self.get_aggregator(
+            client, buffer_size=1024 * 1024 * 6, part_size=1024 * 1024 * 10)
+        aggregator.add('a', get_events(10))
+        aggregator.add('b', get_events(28000))
+        # the largest writer is flushed as a part rather than closed
+        self.assertEqual(list(aggregator.writers), ['a', 'b'])
+        self.assertEqual(len(client.uploads), 1)
+        self.assertEqual(aggregator.buffered, sum(
+            w.buffered for w in aggregator.writers.values()))
+        aggregator.close()
+        self.assertEqual(len(decompress(
+            client.objects['b/1520000000000']).splitlines()), 28000)
+
+    def test_buffer_size_closes_unflushable(self):
+        client = FakeS3()
+        aggregator = self.get_aggregator(client, buffer_size=1024)
+        aggregator.add('a', get_events(100))
+        # below the minimum part size, so closed rather than flushed
+        self.assertEqual(aggregator.writers, {})
+        self.assertEqual(list(client.objects), ['a/1520000000000'])
+
+    def test_flush_period(self):
+        client = FakeS3()
+        aggregator = self.get_aggregator(client, flush_period=-1)
+        aggregator.add('a', get_events(1))
+        self.assertEqual(aggregator.writers, {})
+        self.assertEqual(list(client.objects), ['a/1520000000000'])
+
+    def test_abort_open_uploads(self):
+        client = FakeS3(fail=('upload_part',))
+        aggregator = self.get_aggregator(client)
+        aggregator.add('a', get_events(1))
+        try:
+            aggregator.add('b', get_events(30000))
+        except ValueError:
+            aggregator.abort()
+        self.assertEqual(client.aborted, ['b/1520000000000'])
+        self.assertEqual(client.uploads, {})
+        self.assertEqual(aggregator.writers, {})
+        self.assertEqual(aggregator.buffered, 0)
+        # nothing was written for the open stream either
+        self.assertEqual(client.objects, {})
+
+
+class DecompressingReaderTest(unittest.TestCase):
+
+    def get_body(self, members):
+        data = b''
+        for m in members:
+            buf = io.BytesIO()
+            with gzip.GzipFile(fileobj=buf, mode='wb') as fh:
+                fh.write(m)
+            data += buf.getvalue()
+        return io.BytesIO(data)
+
+    def test_read_sizes(self):
+        payload = os.urandom(4096)
+        reader = DecompressingReader(self.get_body([payload]), chunk_size=100)
+        self.assertEqual(reader.read(10), payload[:10])
+        self.assertEqual(reader.read(5000), payload[10:])
+        self.assertEqual(reader.read(10), b'')
+
+    def test_concatenated_members(self):
+        reader = DecompressingReader(
+            self.get_body([b'abc', b'def', b'ghi']), chunk_size=7)
+        self.assertEqual(reader.read(100), b'abcdefghi')
@@ -0,0 +1,389 @@
+# Copyright 2018 Capital One Services, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+asyncio keyset worker (python 3, requires aiobotocore)
+
+The rq keyset worker processes a job at a time with a pool of ten
+threads, which caps a process at ten in-flight s3 requests. This worker
+instead pulls keyset jobs off the same queues and processes many of them
+concurrently on an event loop, with hundreds of in-flight requests.
+
+Key visitors are synchronous, so the reads they make on a key
+(head_object, get_object_acl) are prefetched with an async client and
+the visitors run against the responses on the loop. Only keys a visitor
+needs to modify (copies, acl puts), or whose reads failed with an error
+visitors back off on, fall back to a blocking client on a small thread
+pool.
+
+Stats are recorded to the same redis hashes as the rq worker, and jobs
+are tracked in the started job registry while they're processed. Redis
+calls are blocking, so they're made on the thread pool, not the loop.
+"""
+import asyncio
+import functools
+import json
+import logging
+import threading
+import time
+import traceback
+
+from aiobotocore import get_session as get_aio_session
+from aiobotocore.config import AioConfig
+from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
+from rq.exceptions import DequeueTimeout
+from rq.job import JobStatus
+from rq.queue import Queue, FailedQueue
+from rq.registry import StartedJobRegistry
+from rq.utils import utcformat, utcnow
+
+from c7n_salactus.worker import (
+    BucketLimiter, KeyMetadata, KEY_THROTTLE_RETRIES, connection,
+    get_key_info, get_key_stats, get_key_visitors, get_session,
+    merge_key_stats, patch_ssl, process_key_visitor, publish_key_stats_objects,
+    record_bucket_error, record_key_stats, s3config, update_backlog)
+
+log = logging.getLogger('salactus.aio')
+
+KEYSET_FUNC = 'c7n_salactus.worker.process_keyset'
+
+# The read call each visitor type makes on a key.
+VISITOR_READS = {
+    'encrypt-keys': 'head_object',
+    'object-acl': 'get_object_acl',
+}
+
+THROTTLE_CODES = ('503', '500', 'SlowDown')
+
+# Read errors visitors sleep on before giving up on a key (ie. expired
+# session tokens), keys with these are processed on the thread pool.
+BACKOFF_CODES = ('400',)
+
+
+class RemoteCallRequired(Exception):
+    """A visitor made a call that wasn't prefetched."""
+
+
+class PrefetchedReads(object):
+    """Client stand-in for visitors run against prefetched responses.
+
+    Used under KeyMetadata seeded with the prefetched responses, any
+    other call raises RemoteCallRequired before it has an effect, and
+    reads that failed re-raise their error for the visitor to handle.
+    """
+
+    def __init__(self, errors):
+        self.errors = errors
+
+    def __getattr__(self, name):
+        def method(**params):
+            if name in self.errors:
+                raise self.errors[name]
+            raise RemoteCallRequired(name)
+        return method
+
+
+class Unlimited(object):
+    """Limiter for visitors run against prefetched responses."""
+
+    def acquire(self):
+        pass
+
+    def success(self):
+        pass
+
+    def throttled(self):
+        pass
+
+
+class AsyncWorker(object):
+    """Process keyset jobs on an event loop.
+
+    max_requests bounds in-flight s3 requests, max_keysets bounds the
+    keyset jobs taken off the queue at a time.
+    """
+
+    # Seconds a client and its credentials are reused.
+    client_period = 60 * 30
+
+    # Seconds to block waiting for a job.
+    poll_timeout = 5
+
+    # Seconds a successful job's result is kept, as with rq workers.
+    default_result_ttl = 500
+
+    def __init__(self, queues=('bucket-keyset-scan',), max_requests=256,
+                 max_keysets=16, remote_workers=10):
+        self.queues = [Queue(q, connection=connection) for q in queues]
+        self.max_requests = max_requests
+        self.max_keysets = max_keysets
+        self.remote = ThreadPoolExecutor(max_workers=remote_workers)
+        self.dequeuer = ThreadPoolExecutor(max_workers=1)
+        self.clients = {}
+        self.local = threading.local()
+        self.loop = None
+
+    def run(self):
+        patch_ssl()
+        self.loop = asyncio.get_event_loop()
+        try:
+            self.loop.run_until_complete(self.work())
+        finally:
+            self.loop.run_until_complete(self.close())
+
+    async def work(self):
+        self.requests = asyncio.Semaphore(self.max_requests)
+        keysets = asyncio.Semaphore(self.max_keysets)
+        while True:
+            await keysets.acquire()
+            try:
+                result = await self.loop.run_in_executor(
+                    self.dequeuer, Queue.dequeue_any,
+                    self.queues, self.poll_timeout, connection)
+            except DequeueTimeout:
+                result = None
+            if result is None:
+                keysets.release()
+                continue
+            job, queue = result
+            task = asyncio.ensure_future(self.perform(job))
+            task.add_done_callback(lambda t: keysets.release())
+
+    async def close(self):
+        for created, client in self.clients.values():
+            await client.close()
+        self.clients = {}
+        self.remote.shutdown()
+        self.dequeuer.shutdown()
+
+    def blocking(self, func, *args, **kw):
+        """Run a blocking (ie. redis) call on the thread pool."""
+        return self.loop.run_in_executor(
+            self.remote, functools.partial(func, *args, **kw))
+
+    async def perform(self, job):
+        try:
+            await self.blocking(self.start_job, job)
+            if job.func_name == KEYSET_FUNC:
+                try:
+                    await self.process_keyset(*job.args, **job.kwargs)
+                finally:
+                    await self.blocking(update_backlog, job.args[0], -1)
+            else:
+                await self.blocking(job.perform)
+        except Exception:
+            log.exception("job:%s failed", job.id)
+            await self.blocking(
+                self.fail_job, job, traceback.format_exc())
+        else:
+            await self.blocking(self.finish_job, job)
+
+    def start_job(self, job):
+        """Register a job as started, as rq workers do."""
+        timeout = (job.timeout or Queue.DEFAULT_TIMEOUT) + 60
+        with connection.pipeline() as pipe:
+            StartedJobRegistry(job.origin, connection).add(
+                job, timeout, pipeline=pipe)
+            job.set_status(JobStatus.STARTED, pipeline=pipe)
+            pipe.hset(job.key, 'started_at', utcformat(utcnow()))
+            pipe.execute()
+
+    def finish_job(self, job):
+        job.ended_at = utcnow()
+        with connection.pipeline() as pipe:
+            result_ttl = job.get_result_ttl(self.default_result_ttl)
+            if result_ttl != 0:
+                job.set_status(JobStatus.FINISHED, pipeline=pipe)
+                job.save(pipeline=pipe)
+            job.cleanup(result_ttl, pipeline=pipe)
+            StartedJobRegistry(job.origin, connection).remove(
+                job, pipeline=pipe)
+            pipe.execute()
+
+    def fail_job(self, job, exc_info):
+        job.ended_at = utcnow()
+        with connection.pipeline() as pipe:
+            job.set_status(JobStatus.FAILED, pipeline=pipe)
+            StartedJobRegistry(job.origin, connection).remove(
+                job, pipeline=pipe)
+            pipe.execute()
+        FailedQueue(connection=connection).quarantine(job, exc_info=exc_info)
+
+    async def get_client(self, account_info, region):
+        ckey = (account_info['name'], region)
+        created, client = self.clients.get(ckey, (0, None))
+        if client is not None and created > time.time() - self.client_period:
+            return client
+        # role assumption and credential refresh make sts calls
+        creds = await self.blocking(
+            lambda: get_session(
+                account_info).get_credentials().get_frozen_credentials())
+        if client is not None:
+            # let requests in flight on the old client finish
+            self.loop.call_later(
+                s3config.read_timeout,
+                lambda c=client: asyncio.ensure_future(c.close()))
+        client = get_aio_session().create_client(
+            's3', region_name=region,
+            aws_access_key_id=creds.access_key,
+            aws_secret_access_key=creds.secret_key,
+            aws_session_token=creds.token,
+            config=AioConfig(
+                read_timeout=s3config.read_timeout,
+                connect_timeout=s3config.connect_timeout,
+                max_pool_connections=self.max_requests))
+        self.clients[ckey] = (time.time(), client)
+        return client
+
+    def get_remote_client(self, account_info, region):
+        ckey = (account_info['name'], region)
+        clients = getattr(self.local, 'clients', None)
+        if clients is None:
+            clients = self.local.clients = {}
+        if ckey not in clients:
+            clients[ckey] = get_session(account_info).client(
+                's3', region_name=region, config=s3config)
+        return clients[ckey]
+
+    def get_bucket_info(self, bid):
+        account, bucket = bid.split(':', 1)
+        with connection.pipeline() as pipe:
+            pipe.hget('bucket-regions', bid)
+            pipe.hget('bucket-versions', bid)
+            pipe.hget('bucket-accounts', account)
+            region, versioned, account_info = pipe.execute()
+        return region, bool(int(versioned)), json.loads(account_info)
+
+    async def process_keyset(self, bid, key_set):
+        account, bucket = bid.split(':', 1)
+        region, versioned, account_info = await self.blocking(
+            self.get_bucket_info, bid)
+
+        visitors = get_key_visitors(account_info)
+        object_reporting = account_info.get('object-reporting')
+        limiter = BucketLimiter.get(bid)
+
+        key_count = len(key_set)
+        start_time = time.time()
+        stats = get_key_stats(visitors, object_reporting)
+
+        # as worker.bucket_ops, with errors recorded off the loop
+        try:
+            client = await self.get_client(account_info, region)
+            results = await asyncio.gather(*[
+                self.process_key(
+                    client, account_info, region, bucket, get_key_info(k),
+                    visitors, versioned, bool(object_reporting), limiter)
+                for k in key_set], return_exceptions=True)
+            for r in results:
+                if isinstance(r, Exception):
+                    log.warning("key error: %s", r)
+                    stats['error'] += 1
+                    continue
+                merge_key_stats(stats, r)
+            await self.blocking(
+                record_key_stats, bid, key_count, stats,
+                time.time() - start_time)
+        except Exception as e:
+            if await self.blocking(record_bucket_error, bid, 'key', e):
+                raise
+
+        if object_reporting:
+            await self.blocking(
+                publish_key_stats_objects, bid, stats, object_reporting)
+
+    async def process_key(self, client, account_info, region, bucket, k,
+                          visitors, versioned, object_reporting, limiter):
+        stats = get_key_stats(visitors, object_reporting)
+        params = {'Bucket': bucket, 'Key': k['Key']}
+        if versioned:
+            params['VersionId'] = k['VersionId']
+
+        names = []
+        for v in visitors:
+            name = VISITOR_READS.get(v.visitor_name)
+            if name and name not in names:
+                names.append(name)
+        reads = await asyncio.gather(*[
+            self.prefetch(client, name, params, limiter, stats)
+            for name in names])
+
+        responses, errors = {}, {}
+        for name, (response, error) in zip(names, reads):
+            if response is not None:
+                responses[(name, k['Key'], params.get('VersionId'))] = response
+            elif error is not None:
+                errors[name] = error
+
+        remote = []
+        if any(e.response['Error']['Code'] in BACKOFF_CODES
+               for e in errors.values()):
+            # visitors sleep on these, which would stall the loop
+            remote = visitors
+        else:
+            prefetched = KeyMetadata(PrefetchedReads(errors))
+            prefetched.responses.update(responses)
+            for v in visitors:
+                processor = versioned and v.process_version or v.process_key
+                try:
+                    process_key_visitor(
+                        prefetched, bucket, k, processor, v.visitor_name,
+                        stats, object_reporting, Unlimited())
+                except RemoteCallRequired:
+                    remote.append(v)
+
+        if remote:
+            merge_key_stats(stats, await self.loop.run_in_executor(
+                self.remote, self.process_remote, account_info, region,
+                bucket, k, remote, versioned, object_reporting, limiter,
+                responses))
+        return stats
+
+    async def prefetch(self, client, name, params, limiter, stats):
+        """Read a key, returning the response or the error to raise.
+
+        Neither is returned for reads left to the blocking client,
+        after repeated throttling or connection errors.
+        """
+        for attempt in range(KEY_THROTTLE_RETRIES):
+            wait = limiter.reserve()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                async with self.requests:
+                    response = await getattr(client, name)(**params)
+            except ClientError as e:
+                if e.response['Error']['Code'] in THROTTLE_CODES:
+                    stats['throttle'] += 1
+                    limiter.throttled()
+                    continue
+                return None, e
+            except Exception as e:
+                log.debug("prefetch %s error: %s", name, e)
+                return None, None
+            limiter.success()
+            return response, None
+        return None, None
+
+    def process_remote(self, account_info, region, bucket, k, visitors,
+                       versioned, object_reporting, limiter, responses):
+        stats = get_key_stats(visitors, object_reporting)
+        client = KeyMetadata(self.get_remote_client(account_info, region))
+        client.responses.update(responses)
+        for v in visitors:
+            processor = versioned and v.process_version or v.process_key
+            process_key_visitor(
+                client, bucket, k, processor, v.visitor_name,
+                stats, object_reporting, limiter)
+        return stats
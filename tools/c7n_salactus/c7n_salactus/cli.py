@@ -276,6 +276,17 @@ def workers():
     pprint.pprint(dict(counter))
 
 
+@cli.command(name='aio-worker')
+@click.option('--queue', multiple=True, default=['bucket-keyset-scan'],
+              help='queues to process, defaults to bucket-keyset-scan')
+@click.option('--requests', default=256, help='max concurrent s3 requests')
+@click.option('--keysets', default=16, help='max concurrent keyset jobs')
+def aio_worker(queue, requests, keysets):
+    """Process keysets on an asyncio event loop (python 3)."""
+    from c7n_salactus.aioworker import AsyncWorker
+    AsyncWorker(queue, max_requests=requests, max_keysets=keysets).run()
+
+
 def format_accounts_csv(accounts, fh):
     field_names = ['name', 'matched', 'percent_scanned', 'scanned',
                    'size', 'bucket_count']
@@ -582,6 +593,38 @@ def watch(limit):
             keys=['bucket_id', 'scanned', 'gkrate', 'lrate', 'krate'])
 
 
+@cli.command()
+@click.option('--window', default=5, help="minutes to compute rates over")
+@click.option('--limit', default=50)
+@click.option('--workers', is_flag=True, help="show rates by worker")
+def stats(window, limit, workers):
+    """Current scan rates, backlog and eta by bucket."""
+    if workers:
+        rows = db.get_worker_stats(window)
+        keys = ['worker', 'krate', 'trate', 'erate', 'prate']
+    else:
+        rows = db.get_bucket_stats(window)
+        keys = ['bucket_id', 'krate', 'trate', 'erate', 'prate',
+                'backlog', 'remaining', 'eta']
+
+    totals = Counter({k: 0 for k in keys[1:]})
+    for r in rows:
+        for k in keys[1:]:
+            if k != 'eta':
+                totals[k] += r[k]
+    totals[keys[0]] = 'totals'
+    if not workers:
+        totals['eta'] = totals['krate'] and int(
+            totals['remaining'] / totals['krate']) or None
+
+    rows = sorted(rows, key=lambda x: x['krate'], reverse=True)
+    if limit:
+        rows = rows[:limit]
+    rows.insert(0, totals)
+    format_plain(
+        [Bag(r) for r in rows], None, explicit_only=True, keys=keys)
+
+
 @cli.command(name='inspect-partitions')
 @click.option('-b', '--bucket', required=True)
 def inspect_partitions(bucket):
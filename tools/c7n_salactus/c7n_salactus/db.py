@@ -13,11 +13,13 @@
 # limitations under the License.
 import json
 import os
+import time
 from collections import Counter
 
 from dateutil.parser import parse
 
-from c7n_salactus.worker import connection as conn
+from c7n_salactus.worker import (
+    connection as conn, BACKLOG_EXPIRY, TELEMETRY_PERIOD, TELEMETRY_RETENTION)
 
 
 class Database(object):
@@ -257,3 +259,80 @@ def agg(d):
         l, _ = k.split(":")
         m[l] += int(v)
         return m
+
+
+def get_telemetry(kind='buckets', window=5, now=None):
+    """Sum telemetry counters over the last window minutes.
+
+    Returns the elapsed seconds covered and a mapping of bucket (or
+    worker) id to its counters, only the minute hashes in the window
+    are read.
+    """
+    now = now or time.time()
+    window = min(window, TELEMETRY_RETENTION // TELEMETRY_PERIOD)
+    current = int(now // TELEMETRY_PERIOD) * TELEMETRY_PERIOD
+    minutes = [current - i * TELEMETRY_PERIOD for i in range(window + 1)]
+    elapsed = window * TELEMETRY_PERIOD + (now - current)
+
+    with conn.pipeline() as p:
+        for m in minutes:
+            p.hgetall('telemetry-%s:%d' % (kind, m))
+        counts = p.execute()
+
+    stats = {}
+    for minute_counts in counts:
+        for k, v in minute_counts.items():
+            if isinstance(k, bytes):
+                k = k.decode('utf8')
+            rid, name = k.rsplit('|', 1)
+            stats.setdefault(rid, Counter())[name] += int(v)
+    return elapsed, stats
+
+
+def get_bucket_stats(window=5, now=None):
+    """Current rates, backlog and eta for buckets active in the window.
+    """
+    now = now or time.time()
+    elapsed, telemetry = get_telemetry('buckets', window, now)
+    bids = sorted(telemetry)
+    if not bids:
+        return []
+    with conn.pipeline() as p:
+        p.hmget('bucket-sizes', bids)
+        p.hmget('keys-scanned', bids)
+        p.hmget('bucket-backlog', bids)
+        p.hmget('bucket-backlog-time', bids)
+        sizes, scanned, backlog, changed = p.execute()
+
+    results = []
+    for bid, size, count, pending, pchanged in zip(
+            bids, sizes, scanned, backlog, changed):
+        t = telemetry[bid]
+        # jobs that never finished leave the backlog counting them.
+        pending = int(pending or 0)
+        if pending < 0 or now - float(pchanged or 0) > BACKLOG_EXPIRY:
+            pending = 0
+        krate = t['scanned'] / elapsed
+        remaining = max(int(float(size or 0)) - int(float(count or 0)), 0)
+        results.append({
+            'bucket_id': bid,
+            'krate': round(krate, 1),
+            'trate': round(t['throttled'] / elapsed, 2),
+            'erate': round(t['errors'] / elapsed, 2),
+            'prate': round(t['pages'] / elapsed, 2),
+            'backlog': pending,
+            'remaining': remaining,
+            'eta': krate and int(remaining / krate) or None})
+    return results
+
+
+def get_worker_stats(window=5, now=None):
+    """Current rates for workers active in the window.
+    """
+    elapsed, telemetry = get_telemetry('workers', window, now)
+    return [{'worker': w,
+             'krate': round(t['scanned'] / elapsed, 1),
+             'trate': round(t['throttled'] / elapsed, 2),
+             'erate': round(t['errors'] / elapsed, 2),
+             'prate': round(t['pages'] / elapsed, 2)}
+            for w, t in sorted(telemetry.items())]
@@ -13,109 +13,190 @@
 # limitations under the License.
 """
 Utility functions for working with inventories.
+
+Inventory data files are streamed and decompressed straight from the
+object body, rows that no key visitor has work for are dropped on their
+column values before any key is materialized.
 """
 
 import csv
 import datetime
-import functools
 import fnmatch
-import gzip
 import json
-import random
-import tempfile
+import zlib
 
+import six
 from six.moves.urllib_parse import unquote_plus
 
 from c7n.utils import chunks
 
+# Columns read from inventory files, by csv schema name and the
+# equivalent orc/parquet column name.
+INVENTORY_COLUMNS = {
+    'Key': 'key',
+    'VersionId': 'version_id',
+    'IsLatest': 'is_latest',
+    'IsDeleteMarker': 'is_delete_marker',
+    'EncryptionStatus': 'encryption_status',
+}
+
 
-def load_manifest_file(client, bucket, schema, versioned, ifilters, key_info):
-    """Given an inventory csv file, return an iterator over keys
+def load_manifest_file(client, bucket, schema, versioned, ifilters, key_info,
+                       file_format='CSV'):
+    """Given an inventory data file, return an iterator over pages of keys.
+
+    ifilters is a list of column skip specs, a mapping of column name to
+    values for which a visitor has no work on a key, a row is skipped
+    only when every visitor's spec matches it.
     """
     # To avoid thundering herd downloads, we do an immediate yield for
     # interspersed i/o
     yield None
 
-    # Inline these values to avoid the local var lookup, they are constants
-    # rKey = schema['Key'] # 1
-    # rIsLatest = schema['IsLatest'] # 3
-    # rVersionId = schema['VersionId'] # 2
-
-    with tempfile.NamedTemporaryFile() as fh:
-        client.download_fileobj(Bucket=bucket, Key=key_info['key'], Fileobj=fh)
-        fh.seek(0)
-        reader = csv.reader(gzip.GzipFile(fileobj=fh, mode='r'))
-        for key_set in chunks(reader, 1000):
-            keys = []
-            for kr in key_set:
-                k = kr[1]
-                if inventory_filter(ifilters, schema, kr):
-                    continue
-                k = unquote_plus(k)
-                if versioned:
-                    if kr[3] == 'true':
-                        keys.append((k, kr[2], True))
-                    else:
-                        keys.append((k, kr[2]))
+    body = client.get_object(Bucket=bucket, Key=key_info['key'])['Body']
+    if file_format == 'CSV':
+        rows = load_csv_rows(body, schema, ifilters)
+    else:
+        rows = load_columnar_rows(body, file_format, ifilters)
+
+    for key_set in chunks(rows, 1000):
+        keys = []
+        for k, version, latest in key_set:
+            if versioned:
+                if latest:
+                    keys.append((k, version, True))
                 else:
-                    keys.append(k)
-            yield keys
-
-
-def inventory_filter(ifilters, ischema, kr):
-    if 'IsDeleteMarker' in ischema and kr[ischema['IsDeleteMarker']] == 'true':
-        return True
-
-    for f in ifilters:
-        if f(ischema, kr):
-            return True
-    return False
-
-
-def load_bucket_inventory(
-        client, inventory_bucket, inventory_prefix, versioned, ifilters):
-    """Given an inventory location for a bucket, return an iterator over keys
-
-    on the most recent delivered manifest.
+                    keys.append((k, version))
+            else:
+                keys.append(k)
+        yield keys
+
+
+def stream_lines(body, chunk_size=1024 * 1024):
+    """Decompress a gzip body as its read, yielding lines."""
+    decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+    pending = b''
+    while True:
+        data = body.read(chunk_size)
+        if not data:
+            break
+        pending += decompressor.decompress(data)
+        # concatenated gzip members
+        while decompressor.unused_data:
+            data = decompressor.unused_data
+            decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+            pending += decompressor.decompress(data)
+        lines = pending.split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line.decode('utf8') if six.PY3 else line
+    pending += decompressor.flush()
+    if pending:
+        yield pending.decode('utf8') if six.PY3 else pending
+
+
+def load_csv_rows(body, schema, ifilters):
+    """Yield (key, version, is latest) for rows of a csv inventory file."""
+    rKey = schema['Key']
+    rVersionId = schema.get('VersionId')
+    rIsLatest = schema.get('IsLatest')
+    rDeleteMarker = schema.get('IsDeleteMarker')
+    skips = []
+    if all(c in schema for spec in ifilters for c in spec):
+        skips = [[(schema[c], set(values)) for c, values in spec.items()]
+                 for spec in ifilters]
+
+    for kr in csv.reader(stream_lines(body)):
+        if not kr:
+            continue
+        if rDeleteMarker is not None and kr[rDeleteMarker] == 'true':
+            continue
+        if skips and all(
+                any(kr[i] in values for i, values in spec) for spec in skips):
+            continue
+        yield (unquote_plus(kr[rKey]),
+               rVersionId is not None and kr[rVersionId] or None,
+               rIsLatest is None or kr[rIsLatest] == 'true')
+
+
+def load_columnar_rows(body, file_format, ifilters):
+    """Yield (key, version, is latest) for rows of an orc or parquet file.
+
+    Requires pyarrow, filters are evaluated on whole columns, and only
+    the key columns of remaining rows are converted to python values.
+    Unlike csv, keys in columnar formats are not url encoded.
+    """
+    import pyarrow
+    import pyarrow.compute as pc
+
+    data = pyarrow.BufferReader(body.read())
+    if file_format == 'ORC':
+        from pyarrow import orc
+        reader = orc.ORCFile(data)
+        names = set(reader.schema.names)
+    else:
+        from pyarrow import parquet
+        reader = parquet.ParquetFile(data)
+        names = set(reader.schema_arrow.names)
+    columns = [c for c in INVENTORY_COLUMNS.values() if c in names]
+    table = reader.read(columns=columns)
+
+    mask = None
+    if 'is_delete_marker' in names:
+        mask = pc.invert(pc.fill_null(table.column('is_delete_marker'), False))
+    specs = [{INVENTORY_COLUMNS[c]: values for c, values in spec.items()}
+             for spec in ifilters]
+    if specs and all(c in names for spec in specs for c in spec):
+        skip = None
+        for spec in specs:
+            spec_skip = None
+            for c, values in spec.items():
+                m = pc.is_in(table.column(c), value_set=pyarrow.array(list(values)))
+                spec_skip = m if spec_skip is None else pc.or_(spec_skip, m)
+            skip = spec_skip if skip is None else pc.and_(skip, spec_skip)
+        keep = pc.invert(pc.fill_null(skip, False))
+        mask = keep if mask is None else pc.and_(mask, keep)
+    if mask is not None:
+        table = table.filter(mask)
+
+    keys = table.column('key').to_pylist()
+    versions = ('version_id' in names and
+                table.column('version_id').to_pylist() or [None] * len(keys))
+    latest = ('is_latest' in names and
+              table.column('is_latest').to_pylist() or [True] * len(keys))
+    for k, v, l in zip(keys, versions, latest):
+        yield k, v, bool(l)
+
+
+def get_inventory_manifest(client, inventory_bucket, inventory_prefix):
+    """Return the most recently delivered manifest of an inventory, or None.
     """
     now = datetime.datetime.now()
-    key_prefix = "%s/%s" % (inventory_prefix, now.strftime('%Y-%m-'))
-    keys = client.list_objects(
-        Bucket=inventory_bucket, Prefix=key_prefix).get('Contents', [])
-    keys = [k['Key'] for k in keys if k['Key'].endswith('.json')]
-    keys.sort()
-    if not keys:
+    # check the previous month as well, for deliveries early in the month
+    last_month = now.replace(day=1) - datetime.timedelta(days=1)
+    for month in (now, last_month):
+        key_prefix = "%s/%s" % (inventory_prefix, month.strftime('%Y-%m-'))
+        keys = client.list_objects(
+            Bucket=inventory_bucket, Prefix=key_prefix).get('Contents', [])
+        keys = [k['Key'] for k in keys if k['Key'].endswith('.json')]
+        if keys:
+            break
+    else:
         # no manifest delivery
         return None
+    keys.sort()
     latest_manifest = keys[-1]
     manifest = client.get_object(Bucket=inventory_bucket, Key=latest_manifest)
-    manifest_data = json.load(manifest['Body'])
+    manifest_data = json.loads(manifest['Body'].read().decode('utf8'))
 
     # schema as column name to column index mapping
-    schema = dict([(k, i) for i, k in enumerate(
-        [n.strip() for n in manifest_data['fileSchema'].split(',')])])
-
-    processor = functools.partial(
-        load_manifest_file, client, inventory_bucket,
-        schema, versioned, ifilters)
-    generators = map(processor, manifest_data.get('files', ()))
-    return random_chain(generators)
-
-
-def random_chain(generators):
-    """Generator to generate a set of keys from
-    from a set of generators, each generator is selected
-    at random and consumed to exhaustion.
-    """
-    while generators:
-        g = random.choice(generators)
-        try:
-            v = g.next()
-            if v is None:
-                continue
-            yield v
-        except StopIteration:
-            generators.remove(g)
+    if manifest_data.get('fileSchema', '').startswith('message') or (
+            manifest_data.get('fileFormat', 'CSV') != 'CSV'):
+        manifest_data['schema'] = {}
+    else:
+        manifest_data['schema'] = dict([(k, i) for i, k in enumerate(
+            [n.strip() for n in manifest_data['fileSchema'].split(',')])])
+    return manifest_data
 
 
 def get_bucket_inventory(client, bucket, inventory_id):
@@ -18,7 +18,7 @@ rq worker customizations
 """
 import datetime
 import msgpack
-import cPickle
+from six.moves import cPickle
 import logging
 
 from lz4.frame import compress, decompress
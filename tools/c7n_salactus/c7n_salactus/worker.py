@@ -39,7 +39,9 @@ monitor:
 """
 import collections
 from contextlib import contextmanager
+import copy
 from datetime import datetime, timedelta
+import functools
 import gc
 import itertools
 import json
@@ -47,6 +49,7 @@ import logging
 import math
 import os
 import random
+import socket
 import string
 import sys
 import threading
@@ -71,7 +74,8 @@ from c7n.resources.s3 import EncryptExtantKeys
 from c7n.utils import chunks, dumps
 
 from c7n_salactus.objectacl import ObjectAclCheck
-from c7n_salactus.inventory import load_bucket_inventory, get_bucket_inventory
+from c7n_salactus.inventory import (
+    get_bucket_inventory, get_inventory_manifest, load_manifest_file)
 
 
 def patch_ssl():
@@ -132,6 +136,21 @@ keyconfig = {
 
 log = logging.getLogger("salactus")
 
+# Telemetry is kept as per minute hashes of counters by bucket and by
+# worker, expiring after the retention period.
+TELEMETRY_PERIOD = 60
+TELEMETRY_RETENTION = 60 * 60 * 2
+WORKER_ID = "%s:%d" % (socket.gethostname(), os.getpid())
+
+# Jobs counted in a bucket's backlog while queued or running.
+BACKLOG_JOBS = (
+    'process_bucket_partitions', 'process_bucket_iterator', 'process_keyset')
+
+# A bucket's backlog changes as its jobs are queued and finish, one left
+# unchanged this long is counting jobs that never finished (ie. a work
+# horse killed on timeout) and is reported as empty.
+BACKLOG_EXPIRY = 60 * 60
+
 
 def get_session(account_info):
     """Get a boto3 sesssion potentially cross account sts assumed
@@ -154,9 +173,51 @@ def bucket_id(account_info, bucket_name):
 
 
 def invoke(func, *args, **kw):
+    if getattr(func, '__name__', None) in BACKLOG_JOBS:
+        update_backlog(args[0], 1)
     func.delay(*args, **kw)
 
 
+def update_backlog(bid, count, pipeline=None):
+    """Add count jobs to a bucket's backlog, recording when it changed."""
+    if pipeline is None:
+        with connection.pipeline() as pipe:
+            update_backlog(bid, count, pipe)
+            pipe.execute()
+        return
+    pipeline.hincrby('bucket-backlog', bid, count)
+    pipeline.hset('bucket-backlog-time', bid, time.time())
+
+
+def tracks_backlog(func):
+    """Remove a bucket job from the bucket's backlog when it finishes."""
+    @functools.wraps(func)
+    def wrapper(bid, *args, **kw):
+        try:
+            return func(bid, *args, **kw)
+        finally:
+            update_backlog(bid, -1)
+    return wrapper
+
+
+def record_telemetry(pipeline, bid, counters, now=None):
+    """Add counters to the current minute's telemetry for a bucket.
+
+    Only buckets and workers active in a minute appear in its hashes,
+    so reading recent rates doesn't scale with the number of buckets.
+    """
+    minute = int((now or time.time()) // TELEMETRY_PERIOD) * TELEMETRY_PERIOD
+    bkey = 'telemetry-buckets:%d' % minute
+    wkey = 'telemetry-workers:%d' % minute
+    for name, value in counters.items():
+        if not value:
+            continue
+        pipeline.hincrby(bkey, "%s|%s" % (bid, name), int(value))
+        pipeline.hincrby(wkey, "%s|%s" % (WORKER_ID, name), int(value))
+    pipeline.expire(bkey, TELEMETRY_RETENTION)
+    pipeline.expire(wkey, TELEMETRY_RETENTION)
+
+
 def bulk_invoke(func, args, nargs):
     """Bulk invoke a function via queues
 
@@ -181,10 +242,13 @@ def bulk_invoke(func, args, nargs):
         description="bucket-%s" % func.func_name,
         origin=q.name, status=JobStatus.QUEUED, timeout=ctx.timeout,
         result_ttl=0, ttl=ctx.ttl)
+    backlog = getattr(func, '__name__', None) in BACKLOG_JOBS
 
     for n in chunks(nargs, 100):
         job.created_at = datetime.utcnow()
         with connection.pipeline() as pipe:
+            if backlog:
+                update_backlog(args[0], len(n), pipe)
             for s in n:
                 argv[-1] = s
                 job._id = unicode(uuid4())
@@ -201,7 +265,14 @@ def bucket_ops(bid, api=""):
     """
     try:
         yield 42
-    except ClientError as e:
+    except Exception as e:
+        if record_bucket_error(bid, api, e):
+            raise
+
+
+def record_bucket_error(bid, api, e):
+    """Record an error on a bucket, returns True if it should be raised."""
+    if isinstance(e, ClientError):
         code = e.response['Error']['Code']
         log.info(
             "bucket error bucket:%s error:%s",
@@ -216,13 +287,13 @@ def bucket_ops(bid, api=""):
                 'buckets-unknown-errors',
                 bid,
                 "%s:%s" % (api, e.response['Error']['Code']))
-    except Exception as e:
-        connection.hset(
-            'buckets-unknown-errors',
-            bid,
-            "%s:%s" % (api, str(e)))
-        # Let the error queue catch it
-        raise
+        return False
+    connection.hset(
+        'buckets-unknown-errors',
+        bid,
+        "%s:%s" % (api, str(e)))
+    # Let the error queue catch it
+    return True
 
 
 def page_strip(page, versioned):
@@ -610,6 +681,7 @@ def detect_partition_strategy(bid, delimiters=('/', '-'), prefix=''):
 
 @job('bucket-partition', timeout=3600 * 4, ttl=DEFAULT_TTL,
      connection=connection, result_ttl=0)
+@tracks_backlog
 def process_bucket_partitions(
         bid, prefix_set=('',), partition='/', strategy=None, limit=4):
     """Split up a bucket keyspace into smaller sets for parallel iteration.
@@ -707,36 +779,60 @@ def process_bucket_partitions(
      connection=connection, result_ttl=0)
 def process_bucket_inventory(bid, inventory_bucket, inventory_prefix):
     """Load last inventory dump and feed as key source.
+
+    Each data file of the manifest is dispatched as its own job, so
+    files are downloaded and filtered in parallel across workers.
     """
     log.info("Loading bucket %s keys from inventory s3://%s/%s",
              bid, inventory_bucket, inventory_prefix)
-    account, bucket = bid.split(':', 1)
     region = connection.hget('bucket-regions', bid)
-    versioned = bool(int(connection.hget('bucket-versions', bid)))
     session = boto3.Session()
     s3 = session.client('s3', region_name=region, config=s3config)
 
-    # find any key visitors with inventory filtering
-    account_info = json.loads(connection.hget('bucket-accounts', account))
-    ifilters = [v.inventory_filter for v
-                in get_key_visitors(account_info) if v.inventory_filter]
-
     with bucket_ops(bid, 'inventory'):
-        page_iterator = load_bucket_inventory(
-            s3, inventory_bucket, inventory_prefix, versioned, ifilters)
-        if page_iterator is None:
+        manifest = get_inventory_manifest(
+            s3, inventory_bucket, inventory_prefix)
+        if manifest is None or not manifest.get('files'):
             log.info("bucket:%s could not find inventory" % bid)
             # case: inventory configured but not delivered yet
             # action: dispatch to bucket partition (assumes 100k+ for inventory)
             # - todo consider max inventory age/staleness for usage
             return invoke(process_bucket_partitions, bid)
         connection.hset('buckets-inventory', bid, 1)
-        for page in page_iterator:
-            invoke(process_keyset, bid, page)
+        file_format = manifest.get('fileFormat', 'CSV')
+        for key_info in manifest['files']:
+            invoke(process_inventory_file, bid, inventory_bucket,
+                   manifest['schema'], file_format, key_info)
+
+
+@job('bucket-inventory', timeout=DEFAULT_TTL, ttl=DEFAULT_TTL,
+     connection=connection, result_ttl=0)
+def process_inventory_file(bid, inventory_bucket, schema, file_format, key_info):
+    """Stream one inventory data file, dispatching keys needing a visit.
+    """
+    account, bucket = bid.split(':', 1)
+    region = connection.hget('bucket-regions', bid)
+    versioned = bool(int(connection.hget('bucket-versions', bid)))
+    session = boto3.Session()
+    s3 = session.client('s3', region_name=region, config=s3config)
+
+    # rows are only skipped if no key visitor has work for them.
+    account_info = json.loads(connection.hget('bucket-accounts', account))
+    ifilters = [v.inventory_skip for v in get_key_visitors(account_info)]
+    if not all(ifilters):
+        ifilters = []
+
+    with bucket_ops(bid, 'inventory'):
+        for page in load_manifest_file(
+                s3, inventory_bucket, schema, versioned, ifilters,
+                key_info, file_format):
+            if page:
+                invoke(process_keyset, bid, page)
 
 
 @job('bucket-page-iterator', timeout=DEFAULT_TTL, ttl=DEFAULT_TTL,
      connection=connection, result_ttl=0)
+@tracks_backlog
 def process_bucket_iterator(bid, prefix="", delimiter="", **continuation):
     """Bucket pagination
     """
@@ -774,6 +870,7 @@ def process_bucket_iterator(bid, prefix="", delimiter="", **continuation):
                     nptime = time.time()
                     p.hincrby('bucket-pages', bid, 1)
                     p.hincrby('bucket-pages-time', bid, int(nptime - ptime))
+                    record_telemetry(p, bid, {'pages': 10}, nptime)
                     ptime = nptime
                     p.execute()
 
@@ -782,35 +879,150 @@ def process_bucket_iterator(bid, prefix="", delimiter="", **continuation):
                 nptime = time.time()
                 p.hincrby('bucket-pages', bid, 1)
                 p.hincrby('bucket-pages-time', bid, int(nptime - ptime))
+                record_telemetry(p, bid, {'pages': pcounter % 10}, nptime)
                 p.execute()
 
 
 def get_key_visitors(account_info):
     if not account_info.get('visitors'):
-        return [EncryptExtantKeys(keyconfig)]
+        vi = EncryptExtantKeys(keyconfig)
+        vi.visitor_name = 'encrypt-keys'
+        vi.inventory_skip = get_encrypted_skip(vi)
+        return [vi]
     visitors = []
     for v in account_info.get('visitors'):
         if v['type'] == 'encrypt-keys':
             vi = EncryptExtantKeys(v)
             vi.visitor_name = 'encrypt-keys'
-            vi.inventory_filter = filter_encrypted
+            vi.inventory_skip = get_encrypted_skip(vi)
             visitors.append(vi)
         elif v['type'] == 'object-acl':
             vi = ObjectAclCheck(v)
             vi.visitor_name = 'object-acl'
-            vi.inventory_filter = None
+            vi.inventory_skip = None
             visitors.append(vi)
     return visitors
 
 
-def filter_encrypted(ischema, kr):
-    if 'EncryptionStatus' not in ischema:
-        return False
-    return kr[ischema['EncryptionStatus']].startswith('SSE')
+def get_encrypted_skip(visitor):
+    """Inventory column values of keys an encrypt visitor leaves as is.
+
+    Any server side encryption will do unless a specific kms key is
+    wanted, which the inventory doesn't record.
+    """
+    if visitor.data.get('key-id'):
+        return None
+    return {'EncryptionStatus': ('SSE-S3', 'SSE-KMS', 'SSE-C')}
+
+
+class KeyMetadata(object):
+    """S3 client wrapper sharing key metadata across visitors.
+
+    Each visitor of a key would otherwise make its own head_object and
+    get_object_acl calls, read responses are cached per key and version
+    and any other call on a key (ie. a copy or acl put) invalidates them.
+    """
+
+    cached = ('head_object', 'get_object_acl')
+
+    def __init__(self, client):
+        self.client = client
+        self.responses = {}
+
+    def __getattr__(self, name):
+        method = getattr(self.client, name)
+        if not callable(method):
+            return method
+        if name in self.cached:
+            return functools.partial(self.cached_call, name, method)
+        return functools.partial(self.call, method)
+
+    def cached_call(self, name, method, **params):
+        rkey = (name, params.get('Key'), params.get('VersionId'))
+        if rkey not in self.responses:
+            self.responses[rkey] = method(**params)
+        # visitors modify responses
+        return copy.deepcopy(self.responses[rkey])
+
+    def call(self, method, **params):
+        if 'Key' in params:
+            for rkey in list(self.responses):
+                if rkey[1] == params['Key']:
+                    del self.responses[rkey]
+        return method(**params)
+
+
+class BucketLimiter(object):
+    """Adaptive request rate against a bucket, shared by a worker's threads.
+
+    The rate starts low and recovers additively as requests succeed, and
+    is halved when s3 throttles requests, so worker threads wait for their
+    turn instead of sleeping a fixed interval on each throttle. Limiters
+    of buckets a worker hasn't touched for idle_period seconds are dropped.
+    """
+
+    min_rate = 5.0
+    initial_rate = 50.0
+    max_rate = 1000.0
+    increase = 1.0
+    idle_period = 300
+
+    _limiters = {}
+    _lock = threading.Lock()
+    _pruned = 0
+
+    def __init__(self):
+        self.rate = self.initial_rate
+        self.next_time = 0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def get(cls, bid):
+        with cls._lock:
+            now = time.time()
+            if now - cls._pruned > cls.idle_period:
+                cls.prune(now)
+            if bid not in cls._limiters:
+                cls._limiters[bid] = cls()
+            return cls._limiters[bid]
+
+    @classmethod
+    def prune(cls, now):
+        idle = now - cls.idle_period
+        for bid, limiter in list(cls._limiters.items()):
+            if limiter.next_time < idle:
+                del cls._limiters[bid]
+        cls._pruned = now
+
+    def reserve(self):
+        """Reserve the next request slot, returning seconds to wait for it."""
+        with self.lock:
+            now = time.time()
+            wait = self.next_time - now
+            self.next_time = max(now, self.next_time) + 1.0 / self.rate
+        return wait
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    def success(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def throttled(self):
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate / 2.0)
+
+
+# Attempts on a key throttled by s3
+KEY_THROTTLE_RETRIES = 3
 
 
 @job('bucket-keyset-scan', timeout=DEFAULT_TTL, ttl=DEFAULT_TTL,
      connection=connection, result_ttl=0)
+@tracks_backlog
 def process_keyset(bid, key_set):
     account, bucket = bid.split(':', 1)
     region = connection.hget('bucket-regions', bid)
@@ -823,92 +1035,131 @@ def process_keyset(bid, key_set):
 
     patch_ssl()
     s3 = session.client('s3', region_name=region, config=s3config)
+    limiter = BucketLimiter.get(bid)
 
-    error_count = sesserr = connerr = enderr = missing_count = 0
-    throttle_count = denied_count = remediation_count = 0
     key_count = len(key_set)
     start_time = time.time()
-
-    objects = {v.visitor_name: [] for v in visitors}
-    objects['objects_denied'] = []
+    stats = get_key_stats(visitors, object_reporting)
 
     with bucket_ops(bid, 'key'):
         with ThreadPoolExecutor(max_workers=10) as w:
-            futures = {}
-            for kchunk in chunks(key_set, 100):
-                for v in visitors:
-                    processor = (versioned and
-                        v.process_version or v.process_key)
-                    futures[w.submit(
-                        process_key_chunk, s3, bucket, kchunk,
-                        processor, bool(object_reporting))] = v.visitor_name
+            futures = [
+                w.submit(process_key_chunk, s3, bucket, kchunk, visitors,
+                         versioned, bool(object_reporting), limiter)
+                for kchunk in chunks(key_set, 100)]
 
             for f in as_completed(futures):
                 if f.exception():
                     log.warning("key error: %s", f.exception())
-                    error_count += 1
+                    stats['error'] += 1
                     continue
-                stats = f.result()
-                remediation_count += stats['remediated']
-                denied_count += stats['denied']
-                missing_count += stats['missing']
-                throttle_count += stats['throttle']
-                sesserr += stats['session']
-                enderr += stats['endpoint']
-                connerr += stats['connection']
-                if object_reporting:
-                    vname = futures[f]
-                    objects[vname].extend(stats['objects'])
-                    objects['objects_denied'].extend(stats['objects_denied'])
-
-        with connection.pipeline() as p:
-            if remediation_count:
-                p.hincrby('keys-matched', bid, remediation_count)
-            if denied_count:
-                p.hincrby('keys-denied', bid, denied_count)
-            if missing_count:
-                p.hincrby('keys-missing', bid, missing_count)
-            if throttle_count:
-                p.hincrby('keys-throttled', bid, throttle_count)
-            if sesserr:
-                p.hincrby('keys-sesserr', bid, sesserr)
-            if connerr:
-                p.hincrby('keys-connerr', bid, connerr)
-            if enderr:
-                p.hincrby('keys-enderr', bid, enderr)
-            if error_count:
-                p.hincrby('keys-error', bid, error_count)
-
-            p.hincrby('keys-scanned', bid, key_count)
-            # track count again as we reset metrics period
-            p.hincrby('keys-count', bid, key_count)
-            p.hincrby('keys-time', bid, int(time.time() - start_time))
-            p.execute()
+                merge_key_stats(stats, f.result())
+        record_key_stats(bid, key_count, stats, time.time() - start_time)
 
     # write out object level info
     if object_reporting:
-        publish_object_records(bid, objects, object_reporting)
+        publish_key_stats_objects(bid, stats, object_reporting)
 
     # trigger some mem collection
     if getattr(sys, 'pypy_version_info', None):
         gc.collect()
 
 
-def process_key_chunk(s3, bucket, kchunk, processor, object_reporting):
+# Key stats counters and the hash they're recorded in.
+KEY_STATS = (
+    ('remediated', 'keys-matched'),
+    ('denied', 'keys-denied'),
+    ('missing', 'keys-missing'),
+    ('throttle', 'keys-throttled'),
+    ('session', 'keys-sesserr'),
+    ('connection', 'keys-connerr'),
+    ('endpoint', 'keys-enderr'),
+    ('error', 'keys-error'),
+)
+
+
+def get_key_stats(visitors, object_reporting):
     stats = collections.defaultdict(lambda: 0)
     if object_reporting:
-        stats['objects'] = []
+        stats['objects'] = {v.visitor_name: [] for v in visitors}
         stats['objects_denied'] = []
+    return stats
 
-    for k in kchunk:
-        if isinstance(k, str):
-            k = {'Key': k}
-        elif isinstance(k, (list, tuple)) and len(k) == 2:
-            k = {'Key': k[0], 'VersionId': k[1] or 'null', 'IsLatest': False}
+
+def merge_key_stats(stats, key_stats):
+    for k, v in key_stats.items():
+        if k == 'objects':
+            for vname, vobjects in v.items():
+                stats['objects'][vname].extend(vobjects)
+        elif k == 'objects_denied':
+            stats[k].extend(v)
         else:
-            k = {'Key': k[0], 'VersionId': k[1] or 'null', 'IsLatest': True}
+            stats[k] += v
+
+
+def record_key_stats(bid, key_count, stats, elapsed):
+    with connection.pipeline() as p:
+        for stat, counter in KEY_STATS:
+            if stats.get(stat):
+                p.hincrby(counter, bid, stats[stat])
+        p.hincrby('keys-scanned', bid, key_count)
+        # track count again as we reset metrics period
+        p.hincrby('keys-count', bid, key_count)
+        p.hincrby('keys-time', bid, int(elapsed))
+        record_telemetry(p, bid, {
+            'scanned': key_count,
+            'matched': stats.get('remediated'),
+            'throttled': stats.get('throttle'),
+            'errors': sum([stats.get(stat, 0) for stat, _ in KEY_STATS
+                           if stat not in ('remediated', 'throttle')])})
+        p.execute()
+
+
+def publish_key_stats_objects(bid, stats, object_reporting):
+    objects = dict(stats['objects'])
+    objects['objects_denied'] = stats['objects_denied']
+    publish_object_records(bid, objects, object_reporting)
+
+
+def get_key_info(k):
+    """Normalize a keyset entry to a key dict."""
+    if isinstance(k, str):
+        return {'Key': k}
+    elif isinstance(k, (list, tuple)) and len(k) == 2:
+        return {'Key': k[0], 'VersionId': k[1] or 'null', 'IsLatest': False}
+    return {'Key': k[0], 'VersionId': k[1] or 'null', 'IsLatest': True}
+
+
+def process_key_chunk(
+        s3, bucket, kchunk, visitors, versioned, object_reporting,
+        limiter=None):
+    """Run each key in a chunk through all visitors.
+
+    Key metadata fetched by one visitor is reused by the others, so
+    each key is only read once regardless of the number of visitors.
+    """
+    stats = get_key_stats(visitors, object_reporting)
+    if limiter is None:
+        limiter = BucketLimiter()
+
+    for k in kchunk:
+        k = get_key_info(k)
+        client = KeyMetadata(s3)
+        for v in visitors:
+            processor = versioned and v.process_version or v.process_key
+            process_key_visitor(
+                client, bucket, k, processor, v.visitor_name,
+                stats, object_reporting, limiter)
+    return stats
+
+
+def process_key_visitor(
+        client, bucket, k, processor, visitor_name, stats,
+        object_reporting, limiter):
+    for attempt in range(KEY_THROTTLE_RETRIES):
+        limiter.acquire()
         try:
-            result = processor(s3, bucket_name=bucket, key=k)
+            result = processor(client, bucket_name=bucket, key=k)
         except EndpointConnectionError:
             stats['endpoint'] += 1
         except ConnectionError:
@@ -923,19 +1174,21 @@ def process_key_chunk(s3, bucket, kchunk, processor, object_reporting):
             elif code in ('404', 'NoSuchKey', 'NoSuchVersion'):  # Not Found
                 stats['missing'] += 1
             elif code in ('503', '500', 'SlowDown'):  # Slow down, or throttle
-                time.sleep(3)
                 stats['throttle'] += 1
+                limiter.throttled()
+                continue
             elif code in ('400',):  # token err, typically
                 time.sleep(3)
                 stats['session'] += 1
             else:
                 raise
         else:
+            limiter.success()
             if result:
                 stats['remediated'] += 1
             if result and object_reporting:
-                stats['objects'].append(result)
-    return stats
+                stats['objects'][visitor_name].append(result)
+        return
 
 
 def publish_object_records(bid, objects, reporting):
@@ -35,4 +35,5 @@ setup(
         'console_scripts': [
             'c7n-salactus = c7n_salactus.cli:cli']},
     install_requires=["c7n", "click", "rq", "redis"],
+    extras_require={"columnar": ["pyarrow"], "async": ["aiobotocore"]},
 )
@@ -0,0 +1,148 @@
+# Copyright 2018 Capital One Services, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+import threading
+import unittest
+
+import mock
+from botocore.exceptions import ClientError
+
+os.environ.setdefault('SALACTUS_REDIS', 'localhost')
+
+try:
+    import asyncio
+    from c7n_salactus import aioworker
+    from c7n_salactus.worker import BucketLimiter
+except ImportError:
+    aioworker = None
+
+
+def client_error(code, op='HeadObject'):
+    return ClientError({'Error': {'Code': code}}, op)
+
+
+class AsyncClient(object):
+    """Async s3 client returning, or raising, queued results by call."""
+
+    def __init__(self, **results):
+        self.results = results
+        self.calls = []
+
+    def __getattr__(self, name):
+        async def method(**params):
+            self.calls.append(name)
+            result = self.results[name].pop(0)
+            if isinstance(result, Exception):
+                raise result
+            return result
+        return method
+
+
+class Visitor(object):
+
+    visitor_name = 'encrypt-keys'
+
+    def __init__(self):
+        self.threads = []
+
+    def process_key(self, client, bucket_name, key):
+        self.threads.append(threading.current_thread())
+        client.head_object(Bucket=bucket_name, Key=key['Key'])
+        return False
+
+    process_version = process_key
+
+
+@unittest.skipIf(aioworker is None, "requires aiobotocore and rq")
+class AsyncWorkerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.addCleanup(self.loop.close)
+        self.worker = aioworker.AsyncWorker(remote_workers=2)
+        self.addCleanup(self.worker.remote.shutdown)
+        self.addCleanup(self.worker.dequeuer.shutdown)
+        self.worker.loop = self.loop
+        self.worker.requests = asyncio.Semaphore(10)
+        self.worker.process_remote = mock.MagicMock(return_value={'session': 1})
+
+    def process_key(self, client, visitor):
+        return self.loop.run_until_complete(self.worker.process_key(
+            client, {'name': 'dev'}, 'us-east-1', 'bucket', {'Key': 'abc'},
+            [visitor], False, False, BucketLimiter()))
+
+    def test_process_key_prefetched(self):
+        visitor = Visitor()
+        client = AsyncClient(head_object=[{'ServerSideEncryption': 'AES256'}])
+        stats = self.process_key(client, visitor)
+        self.assertEqual(dict(stats), {})
+        self.assertEqual(client.calls, ['head_object'])
+        # the visitor ran on the loop against the prefetched response
+        self.assertEqual(visitor.threads, [threading.current_thread()])
+        self.assertFalse(self.worker.process_remote.called)
+
+    def test_process_key_prefetch_error(self):
+        visitor = Visitor()
+        stats = self.process_key(
+            AsyncClient(head_object=[client_error('403')]), visitor)
+        self.assertEqual(dict(stats), {'denied': 1})
+        self.assertFalse(self.worker.process_remote.called)
+
+    def test_process_key_prefetch_throttled(self):
+        visitor = Visitor()
+        client = AsyncClient(head_object=[client_error('SlowDown'), {}])
+        stats = self.process_key(client, visitor)
+        self.assertEqual(dict(stats), {'throttle': 1})
+        self.assertEqual(client.calls, ['head_object', 'head_object'])
+
+    def test_process_key_backoff_error_is_remote(self):
+        visitor = Visitor()
+        stats = self.process_key(
+            AsyncClient(head_object=[client_error('400')]), visitor)
+        # visitors sleep on session errors, so they run on the pool
+        self.assertEqual(dict(stats), {'session': 1})
+        self.assertEqual(visitor.threads, [])
+        self.assertEqual(
+            self.worker.process_remote.call_args[0][4], [visitor])
+
+    def test_process_keyset_records_errors_off_loop(self):
+        threads = []
+
+        def record_bucket_error(bid, api, e):
+            threads.append(threading.current_thread())
+            return not isinstance(e, ClientError)
+
+        async def get_client(account_info, region):
+            raise errors.pop(0)
+
+        errors = [client_error('NoSuchBucket'), ValueError('bad')]
+        self.worker.get_bucket_info = lambda bid: (
+            'us-east-1', False, {'name': 'dev'})
+        self.worker.get_client = get_client
+
+        with mock.patch.object(aioworker, 'get_key_visitors',
+                               return_value=[Visitor()]), \
+                mock.patch.object(aioworker, 'record_bucket_error',
+                                  side_effect=record_bucket_error):
+            self.loop.run_until_complete(
+                self.worker.process_keyset('dev:bucket', ['abc']))
+            self.assertRaises(
+                ValueError, self.loop.run_until_complete,
+                self.worker.process_keyset('dev:bucket', ['abc']))
+
+        self.assertEqual(len(threads), 2)
+        self.assertNotIn(threading.current_thread(), threads)
@@ -0,0 +1,158 @@
+# Copyright 2018 Capital One Services, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+import unittest
+
+import mock
+
+os.environ.setdefault('SALACTUS_REDIS', 'localhost')
+
+try:
+    from c7n_salactus import db, worker
+except ImportError:
+    db = worker = None
+
+
+class FakeRedis(object):
+    """Hashes only, commands on a pipeline run when it's executed."""
+
+    def __init__(self):
+        self.data = {}
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+    def hgetall(self, key):
+        return {k.encode('utf8'): str(v).encode('utf8')
+                for k, v in self.data.get(key, {}).items()}
+
+    def hmget(self, key, fields):
+        values = self.data.get(key, {})
+        return [values.get(f) is not None and str(values[f]).encode('utf8') or None
+                for f in fields]
+
+    def hset(self, key, field, value):
+        self.data.setdefault(key, {})[field] = value
+
+    def hincrby(self, key, field, amount=1):
+        values = self.data.setdefault(key, {})
+        values[field] = values.get(field, 0) + amount
+        return values[field]
+
+    def expire(self, key, seconds):
+        return True
+
+
+class FakePipeline(object):
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.commands = []
+
+    def __getattr__(self, name):
+        def command(*args):
+            self.commands.append((getattr(self.redis, name), args))
+        return command
+
+    def execute(self):
+        commands, self.commands = self.commands, []
+        return [c(*args) for c, args in commands]
+
+
+@unittest.skipIf(db is None, "requires redis and rq")
+class TelemetryTest(unittest.TestCase):
+
+    now = 1520000000 * 60 + 30
+
+    def setUp(self):
+        self.redis = FakeRedis()
+        for module, name in ((db, 'conn'), (worker, 'connection')):
+            patcher = mock.patch.object(module, name, self.redis)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def record(self, bid, minutes_ago, **counters):
+        with self.redis.pipeline() as p:
+            worker.record_telemetry(
+                p, bid, counters, self.now - minutes_ago * 60)
+            p.execute()
+
+    def test_get_telemetry_window(self):
+        self.record('dev:a', 0, scanned=100, pages=1)
+        self.record('dev:a', 2, scanned=50, throttled=2)
+        self.record('dev:b', 1, scanned=10)
+        # outside a 2 minute window
+        self.record('dev:b', 3, scanned=1000)
+
+        elapsed, stats = db.get_telemetry('buckets', 2, self.now)
+        self.assertEqual(elapsed, 150)
+        self.assertEqual(
+            stats, {'dev:a': {'scanned': 150, 'pages': 1, 'throttled': 2},
+                    'dev:b': {'scanned': 10}})
+        elapsed, stats = db.get_telemetry('workers', 5, self.now)
+        self.assertEqual(elapsed, 330)
+        self.assertEqual(
+            stats, {worker.WORKER_ID: {
+                'scanned': 1160, 'pages': 1, 'throttled': 2}})
+
+    def test_get_bucket_stats(self):
+        self.record('dev:a', 0, scanned=300, pages=3, errors=3)
+        self.record('dev:b', 0, scanned=0)
+        self.redis.data['bucket-sizes'] = {'dev:a': 1000}
+        self.redis.data['keys-scanned'] = {'dev:a': 400}
+        self.redis.data['bucket-backlog'] = {'dev:a': 4}
+        self.redis.data['bucket-backlog-time'] = {'dev:a': self.now - 10}
+
+        stats = db.get_bucket_stats(0, self.now)
+        self.assertEqual(stats, [{
+            'bucket_id': 'dev:a', 'krate': 10.0, 'trate': 0.0, 'erate': 0.1,
+            'prate': 0.1, 'backlog': 4, 'remaining': 600, 'eta': 60}])
+
+    def test_bucket_stats_backlog_clamped(self):
+        self.record('dev:a', 0, scanned=1)
+        self.record('dev:b', 0, scanned=1)
+        self.redis.data['bucket-backlog'] = {'dev:a': -2, 'dev:b': 3}
+        self.redis.data['bucket-backlog-time'] = {
+            'dev:a': self.now, 'dev:b': self.now - worker.BACKLOG_EXPIRY - 1}
+        # neither negative, nor left over from jobs that never finished
+        self.assertEqual(
+            [s['backlog'] for s in db.get_bucket_stats(0, self.now)], [0, 0])
+
+    def test_tracks_backlog(self):
+        def process_keyset(bid, keys):
+            if not keys:
+                raise ValueError()
+            return len(keys)
+        func = mock.MagicMock(__name__='process_keyset')
+        tracked = worker.tracks_backlog(process_keyset)
+
+        worker.invoke(func, 'dev:a', ['k1'])
+        worker.invoke(func, 'dev:a', [])
+        worker.invoke(mock.MagicMock(__name__='process_account'), 'dev')
+        self.assertEqual(self.redis.data['bucket-backlog'], {'dev:a': 2})
+        self.assertEqual(func.delay.call_count, 2)
+
+        self.assertEqual(tracked('dev:a', ['k1']), 1)
+        self.assertRaises(ValueError, tracked, 'dev:a', [])
+        self.assertEqual(self.redis.data['bucket-backlog'], {'dev:a': 0})
+        self.assertEqual(
+            list(self.redis.data['bucket-backlog-time']), ['dev:a'])
@@ -0,0 +1,139 @@
+# Copyright 2018 Capital One Services, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import gzip
+import io
+import unittest
+
+from c7n_salactus import inventory
+
+try:
+    import pyarrow
+    from pyarrow import orc
+except ImportError:
+    pyarrow = orc = None
+
+
+SCHEMA = {'Bucket': 0, 'Key': 1, 'VersionId': 2, 'IsLatest': 3,
+          'IsDeleteMarker': 4, 'EncryptionStatus': 5}
+
+ROWS = [
+    ('b', 'a+b%2Fc', 'v1', 'true', 'false', 'SSE-S3'),
+    ('b', 'plain', 'v2', 'false', 'false', 'NOT-SSE'),
+    ('b', 'gone', 'v3', 'true', 'true', 'NOT-SSE'),
+]
+
+
+class FakeClient(object):
+
+    def __init__(self, data):
+        self.data = data
+
+    def get_object(self, Bucket, Key):
+        return {'Body': io.BytesIO(self.data)}
+
+
+def csv_body(rows, members=1):
+    data = b''
+    for idx in range(members):
+        buf = io.BytesIO()
+        with gzip.GzipFile(fileobj=buf, mode='wb') as fh:
+            fh.write("".join(
+                '"%s"\n' % '","'.join(r) for r in rows[idx::members]).encode('utf8'))
+        data += buf.getvalue()
+    return data
+
+
+class StreamLinesTest(unittest.TestCase):
+
+    def test_stream_lines_small_chunks(self):
+        body = io.BytesIO(csv_body(ROWS))
+        lines = list(inventory.stream_lines(body, chunk_size=7))
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(lines[1], '"b","plain","v2","false","false","NOT-SSE"')
+
+    def test_stream_lines_concatenated_members(self):
+        body = io.BytesIO(csv_body(ROWS, members=3))
+        self.assertEqual(len(list(inventory.stream_lines(body))), 3)
+
+
+class CsvRowsTest(unittest.TestCase):
+
+    def test_csv_rows(self):
+        rows = list(inventory.load_csv_rows(
+            io.BytesIO(csv_body(ROWS)), SCHEMA, []))
+        # delete markers are dropped, keys are url decoded
+        self.assertEqual(rows, [('a b/c', 'v1', True), ('plain', 'v2', False)])
+
+    def test_csv_rows_unversioned_schema(self):
+        schema = {'Bucket': 0, 'Key': 1}
+        rows = list(inventory.load_csv_rows(
+            io.BytesIO(csv_body([r[:2] for r in ROWS])), schema, []))
+        self.assertEqual([r[0] for r in rows], ['a b/c', 'plain', 'gone'])
+        self.assertEqual(set(r[1:] for r in rows), {(None, True)})
+
+    def test_csv_skip_specs(self):
+        body = csv_body(ROWS)
+        # a row is skipped only when every spec matches it
+        rows = list(inventory.load_csv_rows(
+            io.BytesIO(body), SCHEMA, [{'EncryptionStatus': ['SSE-S3']}]))
+        self.assertEqual([r[0] for r in rows], ['plain'])
+        rows = list(inventory.load_csv_rows(
+            io.BytesIO(body), SCHEMA, [
+                {'EncryptionStatus': ['SSE-S3']},
+                {'EncryptionStatus': ['NOT-SSE']}]))
+        self.assertEqual([r[0] for r in rows], ['a b/c', 'plain'])
+
+    def test_csv_skip_spec_unknown_column(self):
+        # specs naming a column the inventory lacks can't skip anything
+        rows = list(inventory.load_csv_rows(
+            io.BytesIO(csv_body(ROWS)), SCHEMA,
+            [{'EncryptionStatus': ['SSE-S3'], 'ObjectLockMode': ['GOVERNANCE']}]))
+        self.assertEqual(len(rows), 2)
+
+    def test_load_manifest_file(self):
+        client = FakeClient(csv_body(ROWS))
+        pages = list(inventory.load_manifest_file(
+            client, 'inventory', SCHEMA, True, [], {'key': 'data.csv.gz'}))
+        self.assertEqual(
+            pages, [None, [('a b/c', 'v1', True), ('plain', 'v2')]])
+        pages = list(inventory.load_manifest_file(
+            client, 'inventory', SCHEMA, False, [], {'key': 'data.csv.gz'}))
+        self.assertEqual(pages, [None, ['a b/c', 'plain']])
+
+
+@unittest.skipIf(orc is None, "requires pyarrow")
+class ColumnarRowsTest(unittest.TestCase):
+
+    def orc_body(self):
+        names = ['bucket', 'key', 'version_id', 'is_latest',
+                 'is_delete_marker', 'encryption_status']
+        columns = list(zip(*ROWS))
+        arrays = [pyarrow.array(list(c)) for c in columns]
+        for idx in (3, 4):
+            arrays[idx] = pyarrow.array([v == 'true' for v in columns[idx]])
+        buf = io.BytesIO()
+        orc.write_table(pyarrow.Table.from_arrays(arrays, names=names), buf)
+        return io.BytesIO(buf.getvalue())
+
+    def test_orc_rows(self):
+        rows = list(inventory.load_columnar_rows(self.orc_body(), 'ORC', []))
+        # columnar keys are not url encoded
+        self.assertEqual(rows, [('a+b%2Fc', 'v1', True), ('plain', 'v2', False)])
+
+    def test_orc_skip_specs(self):
+        rows = list(inventory.load_columnar_rows(
+            self.orc_body(), 'ORC', [{'EncryptionStatus': ['NOT-SSE']}]))
+        self.assertEqual([r[0] for r in rows], ['a+b%2Fc'])
@@ -0,0 +1,138 @@
+# Copyright 2018 Capital One Services, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+import time
+import unittest
+
+import mock
+
+os.environ.setdefault('SALACTUS_REDIS', 'localhost')
+
+try:
+    from c7n_salactus import worker
+except ImportError:
+    worker = None
+
+
+class FakeS3(object):
+
+    def __init__(self):
+        self.calls = []
+        self.meta = 'meta'
+
+    def head_object(self, **params):
+        self.calls.append(('head_object', params['Key']))
+        return {'ServerSideEncryption': 'AES256', 'Metadata': {}}
+
+    def copy_object(self, **params):
+        self.calls.append(('copy_object', params['Key']))
+        return {}
+
+
+@unittest.skipIf(worker is None, "requires redis and rq")
+class BucketLimiterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.addCleanup(worker.BucketLimiter._limiters.clear)
+        patcher = mock.patch.object(worker.BucketLimiter, '_pruned', 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_rate_adjustment(self):
+        limiter = worker.BucketLimiter()
+        self.assertEqual(limiter.rate, limiter.initial_rate)
+        self.assertTrue(limiter.initial_rate < limiter.max_rate)
+        limiter.throttled()
+        self.assertEqual(limiter.rate, limiter.initial_rate / 2)
+        for i in range(10):
+            limiter.throttled()
+        self.assertEqual(limiter.rate, limiter.min_rate)
+        limiter.success()
+        self.assertEqual(limiter.rate, limiter.min_rate + limiter.increase)
+        limiter.rate = limiter.max_rate
+        limiter.success()
+        self.assertEqual(limiter.rate, limiter.max_rate)
+
+    def test_reserve_spaces_requests(self):
+        limiter = worker.BucketLimiter()
+        limiter.rate = 10.0
+        self.assertTrue(limiter.reserve() <= 0)
+        self.assertAlmostEqual(limiter.reserve(), 0.1, places=2)
+        self.assertAlmostEqual(limiter.reserve(), 0.2, places=2)
+
+    def test_idle_limiters_pruned(self):
+        limiter = worker.BucketLimiter.get('dev:a')
+        self.assertIs(worker.BucketLimiter.get('dev:a'), limiter)
+        idle = worker.BucketLimiter.get('dev:b')
+
+        # limiters are pruned at most once an idle period
+        worker.BucketLimiter.get('dev:c')
+        self.assertEqual(len(worker.BucketLimiter._limiters), 3)
+        now = time.time() + limiter.idle_period + 1
+        limiter.next_time = now - 10
+        with mock.patch.object(worker.time, 'time', return_value=now):
+            worker.BucketLimiter.get('dev:c')
+        self.assertEqual(
+            sorted(worker.BucketLimiter._limiters), ['dev:a', 'dev:c'])
+        self.assertIsNot(worker.BucketLimiter.get('dev:b'), idle)
+
+
+@unittest.skipIf(worker is None, "requires redis and rq")
+class KeyMetadataTest(unittest.TestCase):
+
+    def test_cached_reads(self):
+        s3 = FakeS3()
+        client = worker.KeyMetadata(s3)
+        response = client.head_object(Bucket='b', Key='a')
+        response['Metadata']['changed'] = True
+        # responses are copied, changes by a visitor aren't shared
+        self.assertEqual(
+            client.head_object(Bucket='b', Key='a'),
+            {'ServerSideEncryption': 'AES256', 'Metadata': {}})
+        client.head_object(Bucket='b', Key='a', VersionId='v1')
+        self.assertEqual(
+            s3.calls, [('head_object', 'a'), ('head_object', 'a')])
+        self.assertEqual(client.meta, 'meta')
+
+    def test_writes_invalidate_key(self):
+        s3 = FakeS3()
+        client = worker.KeyMetadata(s3)
+        client.head_object(Bucket='b', Key='a')
+        client.head_object(Bucket='b', Key='a', VersionId='v1')
+        client.head_object(Bucket='b', Key='c')
+        client.copy_object(Bucket='b', Key='a', CopySource={})
+        self.assertEqual(
+            sorted(client.responses), [('head_object', 'c', None)])
+        client.head_object(Bucket='b', Key='a')
+        client.head_object(Bucket='b', Key='c')
+        self.assertEqual(
+            [c for c in s3.calls if c == ('head_object', 'a')],
+            [('head_object', 'a')] * 3)
+
+    def test_visitors_share_reads(self):
+        s3 = FakeS3()
+        visitors = []
+        for name in ('encrypt-keys', 'object-acl'):
+            v = mock.MagicMock(visitor_name=name)
+            v.process_key.side_effect = (
+                lambda client, bucket_name, key: client.head_object(
+                    Bucket=bucket_name, Key=key['Key']) and False)
+            visitors.append(v)
+        stats = worker.process_key_chunk(
+            s3, 'b', ['a', 'c'], visitors, False, False)
+        self.assertEqual(
+            s3.calls, [('head_object', 'a'), ('head_object', 'c')])
+        self.assertEqual(dict(stats), {})
@@ -0,0 +1,90 @@
+# Copyright 2018 Capital One Services, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Indexing checkpoints for trail indexers.
+
+Progress is recorded per account and region, in its own json file
+under a checkpoint directory, so indexer processes working on
+different account regions never write the same file.
+"""
+import json
+import logging
+import os
+import tempfile
+
+from c7n.utils import date_epoch
+
+log = logging.getLogger('c7n_traildb.checkpoint')
+
+
+class Checkpoint(object):
+    """Indexing progress of an account region.
+
+    Without a directory nothing is persisted and indexing always
+    starts from the requested date.
+    """
+
+    def __init__(self, directory, account, region):
+        self.path = directory and os.path.join(
+            directory, account, '%s.json' % region) or None
+        self.state = self.load()
+
+    def load(self):
+        if self.path is None or not os.path.isfile(self.path):
+            return {}
+        try:
+            with open(self.path) as fh:
+                return json.load(fh)
+        except ValueError:
+            log.warning("invalid checkpoint %s, ignoring", self.path)
+            return {}
+
+    def get(self, name, default=None):
+        return self.state.get(name, default)
+
+    def update(self, **values):
+        self.state.update(values)
+        self.save()
+
+    def save(self):
+        if self.path is None:
+            return
+        directory = os.path.dirname(self.path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        fd, tmp = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, 'w') as fh:
+            json.dump(self.state, fh)
+        os.rename(tmp, self.path)
+
+
+def get_new_objects(s3, bucket, prefix, checkpoint, suffix='', start_after=None):
+    """Objects under a prefix modified since the checkpointed object.
+
+    Returns objects ordered by modification time then key, so the
+    checkpoint can advance object by object as they're processed.
+    """
+    last = (checkpoint.get('modified', 0), checkpoint.get('key', ''))
+    params = {'Bucket': bucket, 'Prefix': prefix}
+    if start_after:
+        params['StartAfter'] = start_after
+    objects = []
+    for page in s3.get_paginator('list_objects_v2').paginate(**params):
+        for o in page.get('Contents', ()):
+            if not o['Key'].endswith(suffix):
+                continue
+            o['Modified'] = date_epoch(o['LastModified'])
+            if (o['Modified'], o['Key']) > last:
+                objects.append(o)
+    objects.sort(key=lambda o: (o['Modified'], o['Key']))
+    return objects
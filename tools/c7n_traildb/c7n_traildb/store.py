@@ -0,0 +1,567 @@
+# Copyright 2018 Capital One Services, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Columnar cloud trail store.
+
+Records are stored in segments under partition directories of
+account/region/year/month/day. A segment holds a column file per
+field with rows sorted by event time:
+
+ - event_date.f8 - event times as epoch seconds (binary doubles)
+ - event_name, event_source, user_id, error_code - dictionary
+   encoded, a json list of distinct values and binary uint32 codes
+ - other fields - gzipped json list of values
+
+Queries prune partitions by path and segment time bounds, bisect the
+sorted times for the range, and evaluate predicates on dictionary
+columns against codes before any other column is read.
+
+Segments are written to a temporary directory and renamed into place,
+so any number of ingest processes can write to the same store.
+
+Ingested trail object keys are recorded in manifests under .ingested
+once their segments are written, and skipped by later ingests, so a
+prefix can be ingested again to pick up new objects. Objects of a batch
+that failed part way may have been partially written and are ingested
+again, duplicating their rows.
+"""
+from __future__ import print_function
+
+import argparse
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+import gzip
+import json
+import logging
+from multiprocessing import Pool
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+import zlib
+
+from botocore.client import Config
+from dateutil.parser import parse
+
+from c7n.credentials import SessionFactory
+from c7n.utils import date_epoch
+
+log = logging.getLogger('c7n_traildb.store')
+
+COLUMNS = (
+    'event_date', 'event_name', 'event_source', 'user_agent', 'request_id',
+    'client_ip', 'user_id', 'error_code', 'error')
+
+DICT_COLUMNS = ('event_name', 'event_source', 'user_id', 'error_code')
+
+INGESTED = '.ingested'
+
+TRAIL_KEY = re.compile(
+    r'AWSLogs/(?P<account>\d+)/CloudTrail/(?P<region>[\w-]+)/'
+    r'(?P<year>\d{4})/(?P<month>\d\d)/(?P<day>\d\d)/')
+
+
+def get_user_id(r):
+    utype = r['userIdentity'].get('type', None)
+    if utype == 'Root':
+        return 'root'
+    elif utype == 'SAMLUser':
+        return r['userIdentity']['userName']
+    elif utype is None and r['userIdentity'].get('invokedBy') == 'AWS Internal':
+        return r['userIdentity']['invokedBy']
+    return r['userIdentity'].get('arn', '')
+
+
+def get_record_row(r, fields=()):
+    row = [
+        date_epoch(r['eventTime']),
+        r['eventName'],
+        r['eventSource'],
+        r.get('userAgent', ''),
+        r.get('requestID', ''),
+        r.get('sourceIPAddress', ''),
+        get_user_id(r),
+        r.get('errorCode', None),
+        r.get('errorMessage', None)]
+    for f in fields:
+        row.append(json.dumps(r.get(f)))
+    return row
+
+
+class StoreWriter(object):
+    """Buffer rows by partition, writing a segment when a buffer fills.
+    """
+
+    def __init__(self, root, fields=(), segment_rows=200000):
+        self.root = root
+        self.columns = COLUMNS + tuple(fields)
+        self.fields = tuple(fields)
+        self.segment_rows = segment_rows
+        self.buffers = {}
+        self.row_count = 0
+
+    def add_records(self, records, account=None, region=None):
+        for r in records:
+            row = get_record_row(r, self.fields)
+            pkey = (
+                r.get('recipientAccountId', account),
+                r.get('awsRegion', region),
+                datetime.utcfromtimestamp(row[0]).strftime('%Y/%m/%d'))
+            rows = self.buffers.setdefault(pkey, [])
+            rows.append(row)
+            self.row_count += 1
+            if len(rows) >= self.segment_rows:
+                self.write_segment(pkey, self.buffers.pop(pkey))
+
+    def flush(self):
+        for pkey in list(self.buffers):
+            self.write_segment(pkey, self.buffers.pop(pkey))
+
+    def write_segment(self, pkey, rows):
+        account, region, day = pkey
+        path = os.path.join(self.root, account, region, day)
+        if not os.path.exists(path):
+            try:
+                os.makedirs(path)
+            except OSError:
+                # created by another process
+                if not os.path.isdir(path):
+                    raise
+        rows.sort(key=lambda r: r[0])
+        tmp = tempfile.mkdtemp(dir=path, prefix='.tmp-')
+        try:
+            times = array('d', [r[0] for r in rows])
+            with open(os.path.join(tmp, 'event_date.f8'), 'wb') as fh:
+                times.tofile(fh)
+            for idx, column in enumerate(self.columns[1:], 1):
+                values = [r[idx] for r in rows]
+                if column in DICT_COLUMNS:
+                    write_dict_column(tmp, column, values)
+                else:
+                    write_column(tmp, column, values)
+            with open(os.path.join(tmp, 'meta.json'), 'w') as fh:
+                json.dump({
+                    'rows': len(rows), 'columns': list(self.columns),
+                    'min_time': times[0], 'max_time': times[-1]}, fh)
+            os.rename(tmp, os.path.join(path, 'seg-%s' % uuid.uuid4().hex))
+        except Exception:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+
+
+def write_dict_column(path, column, values):
+    dictionary = {}
+    codes = array('I', [dictionary.setdefault(v, len(dictionary)) for v in values])
+    with open(os.path.join(path, '%s.dict.json' % column), 'w') as fh:
+        json.dump(sorted(dictionary, key=dictionary.get), fh)
+    with open(os.path.join(path, '%s.u4' % column), 'wb') as fh:
+        codes.tofile(fh)
+
+
+def write_column(path, column, values):
+    with gzip.open(os.path.join(path, '%s.json.gz' % column), 'wb') as fh:
+        fh.write(json.dumps(values).encode('utf8'))
+
+
+class Segment(object):
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as fh:
+            self.meta = json.load(fh)
+        self.cache = {}
+
+    @property
+    def rows(self):
+        return self.meta['rows']
+
+    def times(self):
+        return self.read_array('event_date.f8', 'd')
+
+    def read_array(self, name, typecode):
+        values = array(typecode)
+        with open(os.path.join(self.path, name), 'rb') as fh:
+            values.fromfile(fh, self.rows)
+        return values
+
+    def dictionary(self, column):
+        with open(os.path.join(self.path, '%s.dict.json' % column)) as fh:
+            return json.load(fh)
+
+    def codes(self, column):
+        return self.read_array('%s.u4' % column, 'I')
+
+    def column(self, column):
+        """All values of a column."""
+        if column in self.cache:
+            return self.cache[column]
+        if column == 'event_date':
+            values = self.times()
+        elif column in DICT_COLUMNS:
+            dictionary = self.dictionary(column)
+            values = [dictionary[c] for c in self.codes(column)]
+        else:
+            with gzip.open(
+                    os.path.join(self.path, '%s.json.gz' % column), 'rb') as fh:
+                values = json.loads(fh.read().decode('utf8'))
+        self.cache[column] = values
+        return values
+
+    def select(self, start=None, end=None, predicates=None):
+        """Return row indexes within the time range matching predicates.
+
+        Predicates map a column to a value, a set of values, or a
+        callable returning true for matching values.
+        """
+        times = self.times()
+        lo = 0 if start is None else bisect_left(times, start)
+        hi = self.rows if end is None else bisect_right(times, end)
+        rows = range(lo, hi)
+
+        predicates = dict(predicates or {})
+        # dictionary columns first, their predicates evaluate on codes.
+        for column in sorted(
+                predicates, key=lambda c: c not in DICT_COLUMNS):
+            match = get_matcher(predicates[column])
+            if not rows:
+                break
+            if column in DICT_COLUMNS:
+                wanted = set([code for code, v in enumerate(
+                    self.dictionary(column)) if match(v)])
+                if not wanted:
+                    return []
+                codes = self.codes(column)
+                rows = [i for i in rows if codes[i] in wanted]
+            else:
+                values = self.column(column)
+                rows = [i for i in rows if match(values[i])]
+        return rows
+
+
+def get_matcher(predicate):
+    if callable(predicate):
+        return predicate
+    if isinstance(predicate, (set, frozenset, list, tuple)):
+        values = set(predicate)
+        return values.__contains__
+    return lambda v: v == predicate
+
+
+class TrailStore(object):
+    """Query a columnar trail store.
+
+    :example:
+
+    Who called DeleteBucket over the last week.
+
+    .. code-block:: python
+
+       store = TrailStore('/data/trails')
+       for r in store.query(
+               start=datetime.utcnow() - timedelta(7),
+               columns=('event_date', 'user_id', 'client_ip'),
+               event_name='DeleteBucket'):
+           print(r)
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def segments(self, accounts=None, regions=None, start=None, end=None):
+        """Segments that may hold records in the time range."""
+        start_day = None if start is None else day_of(start)
+        end_day = None if end is None else day_of(end)
+        for account in sorted(listdirs(self.root)):
+            if accounts and account not in accounts:
+                continue
+            for region in sorted(listdirs(os.path.join(self.root, account))):
+                if regions and region not in regions:
+                    continue
+                rpath = os.path.join(self.root, account, region)
+                for day_path in iter_days(rpath, start_day, end_day):
+                    for seg in sorted(listdirs(day_path)):
+                        if not seg.startswith('seg-'):
+                            continue
+                        segment = Segment(os.path.join(day_path, seg))
+                        if start is not None and segment.meta['max_time'] < start:
+                            continue
+                        if end is not None and segment.meta['min_time'] > end:
+                            continue
+                        yield account, region, segment
+
+    def query(self, start=None, end=None, columns=None, accounts=None,
+              regions=None, **predicates):
+        """Yield records as dicts of the selected columns.
+
+        start and end are datetimes or epoch seconds, predicates are
+        keyword arguments of column name to value, set of values or
+        callable.
+        """
+        start, end = to_epoch(start), to_epoch(end)
+        columns = columns or COLUMNS
+        for account, region, segment in self.segments(
+                accounts, regions, start, end):
+            rows = segment.select(start, end, predicates)
+            if not rows:
+                continue
+            values = [segment.column(c) for c in columns]
+            for i in rows:
+                record = dict(zip(columns, [v[i] for v in values]))
+                record['account'] = account
+                record['region'] = region
+                yield record
+
+    def count(self, group_by, start=None, end=None, accounts=None,
+              regions=None, **predicates):
+        """Count matching records by the values of a column."""
+        start, end = to_epoch(start), to_epoch(end)
+        counts = {}
+        for account, region, segment in self.segments(
+                accounts, regions, start, end):
+            rows = segment.select(start, end, predicates)
+            if not rows:
+                continue
+            if group_by in DICT_COLUMNS:
+                dictionary = segment.dictionary(group_by)
+                codes = segment.codes(group_by)
+                for i in rows:
+                    v = dictionary[codes[i]]
+                    counts[v] = counts.get(v, 0) + 1
+            else:
+                values = segment.column(group_by)
+                for i in rows:
+                    counts[values[i]] = counts.get(values[i], 0) + 1
+        return counts
+
+
+def to_epoch(d):
+    if d is None or isinstance(d, (int, float)):
+        return d
+    return date_epoch(d)
+
+
+def day_of(epoch):
+    return datetime.utcfromtimestamp(epoch).strftime('%Y/%m/%d')
+
+
+def listdirs(path):
+    """Directories in a path, other than hidden (ie. temporary) ones."""
+    if not os.path.isdir(path):
+        return []
+    return [d for d in os.listdir(path)
+            if not d.startswith('.') and os.path.isdir(os.path.join(path, d))]
+
+
+def iter_days(rpath, start_day=None, end_day=None):
+    for year in sorted(listdirs(rpath)):
+        if start_day and year < start_day[:4] or end_day and year > end_day[:4]:
+            continue
+        for month in sorted(listdirs(os.path.join(rpath, year))):
+            ym = "%s/%s" % (year, month)
+            if start_day and ym < start_day[:7] or end_day and ym > end_day[:7]:
+                continue
+            for day in sorted(listdirs(os.path.join(rpath, year, month))):
+                ymd = "%s/%s" % (ym, day)
+                if start_day and ymd < start_day or end_day and ymd > end_day:
+                    continue
+                yield os.path.join(rpath, year, month, day)
+
+
+def read_trail_object(s3, bucket, key, chunk_size=1024 * 1024):
+    """Read a gzipped trail file, decompressing as its downloaded."""
+    body = s3.get_object(Bucket=bucket, Key=key)['Body']
+    decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+    parts = []
+    while True:
+        data = body.read(chunk_size)
+        if not data:
+            break
+        parts.append(decompressor.decompress(data))
+    parts.append(decompressor.flush())
+    return json.loads(b''.join(parts).decode('utf8'))
+
+
+def get_ingested(root, bucket):
+    """Keys of a bucket's trail objects already in the store."""
+    path = os.path.join(root, INGESTED)
+    keys = set()
+    if not os.path.isdir(path):
+        return keys
+    for name in os.listdir(path):
+        if not name.endswith('.json'):
+            continue
+        with open(os.path.join(path, name)) as fh:
+            manifest = json.load(fh)
+        if manifest['bucket'] == bucket:
+            keys.update(manifest['keys'])
+    return keys
+
+
+def record_ingested(root, bucket, keys):
+    """Record trail objects as ingested, after their segments are written."""
+    path = os.path.join(root, INGESTED)
+    if not os.path.isdir(path):
+        try:
+            os.makedirs(path)
+        except OSError:
+            if not os.path.isdir(path):
+                raise
+    fd, tmp = tempfile.mkstemp(dir=path, prefix='.tmp-')
+    with os.fdopen(fd, 'w') as fh:
+        json.dump({'bucket': bucket, 'keys': list(keys)}, fh)
+    os.rename(tmp, os.path.join(path, '%s.json' % uuid.uuid4().hex))
+
+
+def ingest_objects(keys, bucket, root, session_args, fields=(),
+                   segment_rows=200000):
+    """Ingest a set of trail objects, returning the record count."""
+    s3 = SessionFactory(*session_args)().client(
+        's3', config=Config(signature_version='s3v4'))
+    writer = StoreWriter(root, fields, segment_rows)
+    for k in keys:
+        m = TRAIL_KEY.search(k)
+        writer.add_records(
+            read_trail_object(s3, bucket, k)['Records'],
+            m and m.group('account'), m and m.group('region'))
+    writer.flush()
+    record_ingested(root, bucket, keys)
+    return writer.row_count
+
+
+def _ingest_objects(args):
+    return ingest_objects(*args)
+
+
+def ingest(bucket, prefix, root, session_args, fields=(), processes=None,
+           batch_size=50):
+    """Ingest all trail objects under a prefix with a pool of processes.
+
+    Listing is pipelined with ingest, batches of keys are handed to
+    workers as pages are listed. Objects already ingested are skipped.
+    """
+    s3 = SessionFactory(*session_args)().client(
+        's3', config=Config(signature_version='s3v4'))
+    paginator = s3.get_paginator('list_objects_v2')
+    ingested = get_ingested(root, bucket)
+
+    def batches():
+        batch = []
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            for o in page.get('Contents', ()):
+                if not o['Key'].endswith('.json.gz') or o['Key'] in ingested:
+                    continue
+                batch.append(o['Key'])
+                if len(batch) == batch_size:
+                    yield (batch, bucket, root, session_args, fields)
+                    batch = []
+        if batch:
+            yield (batch, bucket, root, session_args, fields)
+
+    t = time.time()
+    record_count = 0
+    pool = Pool(processes=processes, maxtasksperchild=10)
+    try:
+        for count in pool.imap_unordered(_ingest_objects, batches()):
+            record_count += count
+    finally:
+        pool.close()
+        pool.join()
+    log.info("Ingested prefix:%s records:%d time:%0.2f",
+             prefix, record_count, time.time() - t)
+    return record_count
+
+
+def setup_parser():
+    parser = argparse.ArgumentParser(description="columnar cloud trail store")
+    parser.add_argument("--root", required=True, help="store directory")
+    subs = parser.add_subparsers(dest='command')
+
+    ingest_parser = subs.add_parser('ingest', help="ingest trail files from s3")
+    ingest_parser.add_argument("--bucket", required=True)
+    ingest_parser.add_argument("--prefix", default="")
+    ingest_parser.add_argument("--account", required=True)
+    ingest_parser.add_argument("--region", default="us-east-1")
+    ingest_parser.add_argument("--day")
+    ingest_parser.add_argument("--month")
+    ingest_parser.add_argument("--processes", type=int)
+    ingest_parser.add_argument(
+        "--profile", default=os.environ.get('AWS_PROFILE'))
+    ingest_parser.add_argument("--assume", default=None, dest="assume_role")
+    ingest_parser.add_argument(
+        '--field', action='append', default=[],
+        choices=['userIdentity', 'requestParameters', 'responseElements'])
+
+    query_parser = subs.add_parser('query', help="query the store")
+    query_parser.add_argument("--start", help="start date (default 7 days ago)")
+    query_parser.add_argument("--end")
+    query_parser.add_argument("--account", action='append')
+    query_parser.add_argument("--region", action='append')
+    query_parser.add_argument("--event", action='append')
+    query_parser.add_argument("--source", action='append')
+    query_parser.add_argument("--user", help="user id substring")
+    query_parser.add_argument("--error", action='append')
+    query_parser.add_argument(
+        "--columns", default="event_date,event_name,user_id,client_ip")
+    query_parser.add_argument("--count-by", help="count records by a column")
+    return parser
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger('botocore').setLevel(logging.WARNING)
+    options = setup_parser().parse_args()
+
+    if options.command == 'ingest':
+        from c7n_traildb.traildb import get_bucket_path
+        ingest(options.bucket, get_bucket_path(options), options.root,
+               (options.region, options.profile, options.assume_role),
+               options.field, options.processes)
+        return
+
+    end = options.end and parse(options.end) or datetime.utcnow()
+    start = options.start and parse(options.start) or end - timedelta(7)
+    predicates = {}
+    if options.event:
+        predicates['event_name'] = options.event
+    if options.source:
+        predicates['event_source'] = options.source
+    if options.error:
+        predicates['error_code'] = options.error
+    if options.user:
+        user = options.user.lower()
+        predicates['user_id'] = lambda v: user in v.lower()
+
+    store = TrailStore(options.root)
+    params = dict(start=start, end=end, accounts=options.account, regions=options.region)
+    params.update(predicates)
+    if options.count_by:
+        counts = store.count(options.count_by, **params)
+        for k, v in sorted(counts.items(), key=lambda i: i[1], reverse=True):
+            print("%s %d" % (k, v))
+        return
+
+    columns = options.columns.split(',')
+    for r in store.query(columns=columns, **params):
+        if 'event_date' in r:
+            r['event_date'] = datetime.utcfromtimestamp(
+                r['event_date']).isoformat()
+        json.dump(r, sys.stdout)
+        sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -29,6 +29,8 @@ import sqlite3
 
 from botocore.client import Config
 
+from c7n_traildb.store import get_user_id, ingest
+
 
 log = logging.getLogger('c7n_traildb')
 
@@ -161,15 +163,7 @@ def process_records(records,
         if not_service_filter and r['eventSource'] == not_service_filter:
             continue
 
-        utype = r['userIdentity'].get('type', None)
-        if utype == 'Root':
-            uid = 'root'
-        elif utype == 'SAMLUser':
-            uid = r['userIdentity']['userName']
-        elif utype is None and r['userIdentity']['invokedBy'] == 'AWS Internal':
-            uid = r['userIdentity']['invokedBy']
-        else:
-            uid = r['userIdentity'].get('arn', '')
+        uid = get_user_id(r)
 
         if uid_filter and uid_filter not in uid.lower():
             continue
@@ -282,6 +276,7 @@ def process_bucket(
 def get_bucket_path(options):
     prefix = "AWSLogs/%(account)s/CloudTrail/%(region)s/" % {
         'account': options.account, 'region': options.region}
+    date_prefix = None
     if options.prefix:
         prefix = "%s/%s" % (options.prefix.strip('/'), prefix)
     if options.day:
@@ -309,6 +304,8 @@ def setup_parser():
     parser.add_argument("--tmpdir", default="/tmp/traildb")
     parser.add_argument("--region", default="us-east-1")
     parser.add_argument("--output", default="results.db")
+    parser.add_argument(
+        "--store", help="ingest into a columnar store directory instead")
     parser.add_argument(
         "--profile", default=os.environ.get('AWS_PROFILE'),
         help="AWS Account Config File Profile to utilize")
@@ -332,6 +329,12 @@ def main():
         os.makedirs(options.tmpdir)
     prefix = get_bucket_path(options)
 
+    if options.store:
+        ingest(options.bucket, prefix, options.store,
+               (options.region, options.profile, options.assume_role),
+               options.field or ())
+        return
+
     process_bucket(
         options.bucket,
         prefix,
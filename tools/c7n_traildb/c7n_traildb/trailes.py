@@ -12,11 +12,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from collections import deque
 import datetime
+import hashlib
 import logging
 import os
 import subprocess
-import thread
+import tempfile
 
 import click
 from c7n.credentials import SessionFactory
@@ -32,6 +34,8 @@ import yaml
 from c7n.executor import ThreadPoolExecutor
 from c7n.utils import local_session
 
+from c7n_traildb.checkpoint import Checkpoint, get_new_objects
+
 log = logging.getLogger('c7n.trailes')
 
 CONFIG_SCHEMA = {
@@ -47,7 +51,10 @@ CONFIG_SCHEMA = {
                 'user': {'type': 'string'},
                 'password': {'type': 'string'},
                 'idx_name': {'type': 'string'},
-                'query': {'type': 'string'}
+                'query': {'type': 'string'},
+                'bulk_size': {'type': 'integer'},
+                'bulk_bytes': {'type': 'integer'},
+                'downloads': {'type': 'integer'}
             },
             'additionalProperties': True
         },
@@ -87,8 +94,11 @@ def get_es_client(config):
     return Elasticsearch(host, **es_kwargs)
 
 
-def index_events(client, events):
-    results = helpers.streaming_bulk(client, events)
+def index_events(client, events, chunk_size=2000,
+                 max_chunk_bytes=10 * 1024 * 1024):
+    results = helpers.streaming_bulk(
+        client, events, chunk_size=chunk_size,
+        max_chunk_bytes=max_chunk_bytes)
     for status, r in results:
         if not status:
             log.debug("index err result %s", r)
@@ -109,15 +119,22 @@ def fetch_events(cursor, config, account_name):
 
     for event in cursor.execute(query):
         event['account'] = account_name
+        # stable ids so re-indexing a regenerated traildb doesn't
+        # duplicate its events.
+        if event.get('request_id'):
+            event['_id'] = hashlib.sha1(("%s:%s:%s" % (
+                event['request_id'], event['event_date'],
+                event['event_name'])).encode('utf8')).hexdigest()
         event['_index'] = config['indexer']['idx_name']
         event['_type'] = config['indexer'].get('idx_type', 'traildb')
         yield event
 
 
 def get_traildb(bucket, key, session_factory, directory):
-    local_db_file = directory + "/traildb" + \
-        str(thread.get_ident())
-    local_bz2_file = local_db_file + '.bz2'
+    fd, local_bz2_file = tempfile.mkstemp(
+        dir=directory, prefix='traildb', suffix='.bz2')
+    os.close(fd)
+    local_db_file = local_bz2_file[:-4]
 
     s3 = local_session(session_factory).resource('s3')
     s3.Bucket(bucket).download_file(key['Key'], local_bz2_file)
@@ -129,61 +146,85 @@ def get_traildb(bucket, key, session_factory, directory):
     return local_db_file
 
 
-def valid_date(key, config_date):
+def valid_date(key, config_date, inclusive=False):
     """ traildb bucket folders are not zero-padded so this validation
         checks that the keys returned by the paginator are
         *really after* the config date
     """
-    key_date = "/".join(key.split("/")[4:7])
-    return parse_date(key_date) > parse_date(config_date)
+    key_date = parse_date("/".join(key.split("/")[4:7]))
+    if inclusive:
+        return key_date >= parse_date(config_date)
+    return key_date > parse_date(config_date)
+
 
+def index_account_trails(config, account, region, date, directory,
+                         checkpoint_dir=None):
+    """Index traildbs of an account region modified since its checkpoint.
 
-def index_account_trails(config, account, region, date, directory):
+    Traildbs are downloaded ahead of indexing by a bounded number of
+    threads, and indexed in modification order with the checkpoint
+    advanced after each one, so an interrupted run resumes after the
+    last indexed traildb.
+    """
     es_client = get_es_client(config)
 
-    s3 = local_session(
-        lambda: SessionFactory(region, profile=account.get('profile'),
-        assume_role=account.get('role'))()).client('s3')
+    def session_factory():
+        return SessionFactory(
+            region, profile=account.get('profile'),
+            assume_role=account.get('role'))()
+
+    s3 = local_session(session_factory).client('s3')
 
     bucket = account['bucket']
     key_prefix = "accounts/{}/{}/traildb".format(account['name'], region)
-    marker = "{}/{}/trail.db.bz2".format(key_prefix, date)
-
-    p = s3.get_paginator('list_objects_v2').paginate(
-        Bucket=bucket,
-        Prefix=key_prefix,
-        StartAfter=marker,
-    )
-
-    with ThreadPoolExecutor(max_workers=20) as w:
-        for key_set in p:
-            if 'Contents' not in key_set:
-                continue
-            keys = []
-            for k in key_set['Contents']:
-                if (k['Key'].endswith('trail.db.bz2') and valid_date(k['Key'], date)):
-                    keys.append(k)
-
-            futures = map(lambda k: w.submit(
-                get_traildb, bucket, k,
-                lambda: SessionFactory(region, profile=account.get('profile'),
-                assume_role=account.get('role'))(), directory),
-                keys)
-
-            for f in as_completed(futures):
-                local_db_file = f.result()
-                connection = sqlite3.connect(local_db_file)
-                connection.row_factory = dict_factory
-                cursor = connection.cursor()
-                index_events(es_client, fetch_events(cursor, config, account['name']))
-                connection.close()
-
-                try:
-                    os.remove(local_db_file)
-                except Exception:
-                    log.warning("Failed to remove temporary file: {}".format(
-                        local_db_file))
-                    pass
+    checkpoint = Checkpoint(checkpoint_dir, account['name'], region)
+    if checkpoint.get('date'):
+        date = checkpoint.get('date')
+
+    # traildb dates aren't zero-padded, so keys sort by date only
+    # within a year, start listing at the year and filter by date.
+    keys = [k for k in get_new_objects(
+        s3, bucket, key_prefix, checkpoint, 'trail.db.bz2',
+        start_after="{}/{}/".format(key_prefix, date.split('/')[0]))
+        if valid_date(k['Key'], date, inclusive=bool(checkpoint.get('date')))]
+
+    log.debug("account:%s region:%s new traildbs:%d",
+              account['name'], region, len(keys))
+
+    downloads = config['indexer'].get('downloads', 4)
+    with ThreadPoolExecutor(max_workers=downloads) as w:
+        pending = deque()
+        for k in keys:
+            pending.append((k, w.submit(
+                get_traildb, bucket, k, session_factory, directory)))
+            if len(pending) >= downloads:
+                index_traildb(
+                    config, account, es_client, checkpoint, *pending.popleft())
+        while pending:
+            index_traildb(
+                config, account, es_client, checkpoint, *pending.popleft())
+
+
+def index_traildb(config, account, es_client, checkpoint, key, future):
+    local_db_file = future.result()
+    connection = sqlite3.connect(local_db_file)
+    connection.row_factory = dict_factory
+    cursor = connection.cursor()
+    index_events(
+        es_client, fetch_events(cursor, config, account['name']),
+        config['indexer'].get('bulk_size', 2000),
+        config['indexer'].get('bulk_bytes', 10 * 1024 * 1024))
+    connection.close()
+
+    try:
+        os.remove(local_db_file)
+    except Exception:
+        log.warning("Failed to remove temporary file: {}".format(
+            local_db_file))
+
+    checkpoint.update(
+        key=key['Key'], modified=key['Modified'],
+        date="/".join(key['Key'].split("/")[4:7]))
 
 
 def get_date_path(date, delta=0):
@@ -210,13 +251,18 @@ def trailes():
 @click.option('--concurrency', default=5)
 @click.option('-a', '--accounts', multiple=True)
 @click.option('-t', '--tag')
+@click.option('--checkpoint-dir', help="Directory of indexing checkpoints")
 @click.option('--verbose/--no-verbose', default=False)
 def index(
         config, date=None, directory=None, concurrency=5, accounts=None,
-        tag=None, verbose=False):
+        tag=None, checkpoint_dir=None, verbose=False):
     """index traildbs directly from s3 for multiple accounts.
 
     context: assumes a daily traildb file in s3 with dated key path
+
+    With a checkpoint directory, each account region resumes from the
+    last traildb it indexed, and only traildbs modified since are
+    indexed, the date applies to account regions without a checkpoint.
     """
 
     logging.basicConfig(level=(verbose and logging.DEBUG or logging.INFO))
@@ -249,7 +295,7 @@ def index(
                 if not found:
                     continue
             for region in account.get('regions'):
-                p = (config, account, region, date, directory)
+                p = (config, account, region, date, directory, checkpoint_dir)
                 jobs.append(p)
 
         for j in jobs:
@@ -259,7 +305,7 @@ def index(
 
         # Process completed
         for f in as_completed(futures):
-            config, account, region, date, directory = futures[f]
+            config, account, region = futures[f][:3]
             if f.exception():
                 log.warning("error account:{} region:{} error:{}".format(
                     account['name'], region, f.exception()))
@@ -15,6 +15,10 @@
 """TrailDB to TimeSeries
 
 Todo: Consider direct processing trails here and bypass the traildb/sqlite.
+
+With a checkpoint directory, indexing of each account region resumes
+from the last day and minute it wrote, and a day's traildb that hasn't
+been modified since it was indexed is skipped.
 """
 from __future__ import print_function
 
@@ -36,6 +40,9 @@ from influxdb import InfluxDBClient
 import sqlalchemy as rdb
 import yaml
 
+from c7n.utils import date_epoch
+from c7n_traildb.checkpoint import Checkpoint
+
 
 logging.basicConfig(
     level=logging.INFO,
@@ -61,6 +68,7 @@ CONFIG_SCHEMA = {
                 'host': {'type': 'string'},
                 'user': {'type': 'string'},
                 'password': {'type': 'string'},
+                'batch_size': {'type': 'integer'},
             }
         },
         'accounts': {
@@ -80,7 +88,10 @@ CONFIG_SCHEMA = {
 }
 
 
-def process_traildb(db, influx, account_name, region, since=None):
+def process_traildb(db, influx, account_name, region, since=None,
+                    batch_size=5000):
+    """Write per minute call counts, returning the point count and the
+    last minute written."""
     md = rdb.MetaData(bind=db, reflect=True)
     t = md.tables['events']
 
@@ -89,6 +100,7 @@ def process_traildb(db, influx, account_name, region, since=None):
               account_name, region, time.time() - qt, since)
 
     record_count = 0
+    last_time = None
     for b in ['console', 'program']:
         for f in ['user_id', 'event_name', 'user_agent', 'error_code']:
             if b == 'console' and f == 'user_agent':
@@ -111,6 +123,8 @@ def process_traildb(db, influx, account_name, region, since=None):
                             v = parts[1]
                 else:
                     v = p[2]
+                if last_time is None or p[0] > last_time:
+                    last_time = p[0]
                 measurements.append({
                     'measurement': '%s_%s' % (b, f),
                     'tags': {
@@ -123,12 +137,12 @@ def process_traildb(db, influx, account_name, region, since=None):
                     'fields': {
                         'call_count': p[1]}})
             pt = time.time()
-            influx.write_points(measurements)
+            influx.write_points(measurements, batch_size=batch_size)
             record_count += len(measurements)
             log.debug(
                 "post account:%s region:%s bucket:%s field:%s points:%d time:%0.2f",
                 account_name, region, b, f, len(measurements), time.time() - pt)
-    return record_count
+    return record_count, last_time
 
 
 def query_by(
@@ -181,7 +195,7 @@ def query_by(
     return query
 
 
-def index_account(config, region, account, day, incremental):
+def index_account(config, region, account, day, incremental, modified=None):
     log = logging.getLogger('trailidx.processor')
     influx = InfluxDBClient(
         username=config['influx']['user'],
@@ -218,6 +232,11 @@ def index_account(config, region, account, day, incremental):
                 log.warning(msg)
                 raise ValueError(msg)
             raise
+        if modified is not None and date_epoch(key_info['LastModified']) <= modified:
+            log.debug("account:%s region:%s unmodified key:%s",
+                      name, region, key)
+            os.remove(fh.name)
+            return
         s3.download_file(bucket, key, fh.name)
         log.debug("downloaded %s in %0.2f", key, time.time() - st)
 
@@ -228,9 +247,10 @@ def index_account(config, region, account, day, incremental):
         t = time.time()
         since = incremental and day or None
 
-        record_count = process_traildb(
+        record_count, last_time = process_traildb(
             rdb.create_engine("sqlite:////%s" % fh.name[:-4]),
-            influx, name, region, since)
+            influx, name, region, since,
+            config['influx'].get('batch_size', 5000))
         log.debug("indexed %s in %0.2f", fh.name, time.time() - t)
         os.remove(fh.name[:-4])
         log.debug("account:%s day:%s region:%s records:%d complete:%0.2f",
@@ -240,7 +260,7 @@ def index_account(config, region, account, day, incremental):
 
     return {'time': time.time() - st, 'records': record_count, 'region': region,
             'account': name, 'day': day.strftime("%Y-%m-%d"),
-            'db-date': key_info['LastModified']}
+            'db-date': key_info['LastModified'], 'last-time': last_time}
 
 
 def get_date_range(start, end):
@@ -295,6 +315,44 @@ def get_incremental_starts(config, default_start):
     return account_starts
 
 
+def get_checkpoint_starts(config, checkpoint_dir, default_start):
+    account_starts = {}
+    for account in config.get('accounts'):
+        for region in account.get('regions'):
+            checkpoint = Checkpoint(checkpoint_dir, account['name'], region)
+            account_starts[(account['name'], region)] = (
+                checkpoint.get('time') and parse_date(checkpoint.get('time')) or
+                default_start)
+    return account_starts
+
+
+class DayProgress(object):
+    """Advance an account region's checkpoint as its days are indexed.
+
+    Days are indexed concurrently and complete out of order, the
+    checkpoint only moves past a day once it and all days before it
+    are done.
+    """
+
+    def __init__(self, checkpoint, days):
+        self.checkpoint = checkpoint
+        self.days = list(days)
+        self.results = {}
+
+    def complete(self, day, result):
+        self.results[day] = result
+        while self.days and self.days[0] in self.results:
+            d = self.days.pop(0)
+            result = self.results.pop(d)
+            # missing or unmodified traildb
+            if result is None:
+                continue
+            self.checkpoint.update(
+                day=result['day'],
+                modified=date_epoch(result['db-date']),
+                time=result['last-time'] or d.strftime("%Y-%m-%dT%H:%M"))
+
+
 @click.group()
 def trailts():
     """TrailDB Time Series Index"""
@@ -359,13 +417,18 @@ def status(config):
               help="Sync from last indexed timestamp")
 @click.option('--concurrency', default=5)
 @click.option('-a', '--accounts', multiple=True)
+@click.option('--checkpoint-dir', help="Directory of indexing checkpoints")
 @click.option('--verbose/--no-verbose', default=False)
 def index(config, start, end, incremental=False, concurrency=5, accounts=None,
-          verbose=False):
+          checkpoint_dir=None, verbose=False):
     """index traildbs directly from s3 for multiple accounts.
 
     context: assumes a daily traildb file in s3 with key path
              specified by key_template in config file for each account
+
+    With a checkpoint directory, account regions resume from their
+    checkpoint and start is used for those without one. Days are
+    indexed with bounded concurrency across all account regions.
     """
     with open(config) as fh:
         config = yaml.safe_load(fh.read())
@@ -377,8 +440,11 @@ def index(config, start, end, incremental=False, concurrency=5, accounts=None,
 
     with ProcessPoolExecutor(max_workers=concurrency) as w:
         futures = {}
+        progress = {}
 
-        if incremental:
+        if checkpoint_dir:
+            account_starts = get_checkpoint_starts(config, checkpoint_dir, start)
+        elif incremental:
             account_starts = get_incremental_starts(config, start)
         else:
             account_starts = defaultdict(lambda : start) # NOQA E203
@@ -387,16 +453,24 @@ def index(config, start, end, incremental=False, concurrency=5, accounts=None,
             if accounts and account['name'] not in accounts:
                 continue
             for region in account.get('regions'):
-                for d in get_date_range(
-                        account_starts[(account['name'], region)], end):
+                checkpoint = Checkpoint(checkpoint_dir, account['name'], region)
+                days = get_date_range(
+                    account_starts[(account['name'], region)], end)
+                progress[(account['name'], region)] = DayProgress(
+                    checkpoint, days)
+                for idx, d in enumerate(days):
                     i = bool(d.hour or d.minute)
-                    p = (config, region, account, d, i)
+                    # the checkpointed day is skipped if its traildb
+                    # hasn't changed since.
+                    modified = idx == 0 and checkpoint.get('modified') or None
+                    p = (config, region, account, d, i, modified)
                     futures[w.submit(index_account, *p)] = p
 
         for f in as_completed(futures):
-            _, region, account, d, incremental = futures[f]
+            _, region, account, d, incremental, _ = futures[f]
 
             result = f.result()
+            progress[(account['name'], region)].complete(d, result)
             if result is None:
                 continue
             log.info(
@@ -30,6 +30,7 @@ setup(
             'c7n-traildb = c7n_traildb.traildb:main',
             'c7n-trailts = c7n_traildb.trailts:trailts',
             'c7n-trailes = c7n_traildb.trailes:trailes',
+            'c7n-trailstore = c7n_traildb.store:main',
         ]},
     install_requires=["c7n", "click", "jsonschema", "influxdb"],
 )
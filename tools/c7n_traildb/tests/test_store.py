@@ -0,0 +1,208 @@
+# Copyright 2018 Capital One Services, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from datetime import datetime
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from c7n_traildb import store
+
+
+def get_record(event_time, name='DescribeInstances', source='ec2.amazonaws.com',
+               user='arn:aws:iam::123456789012:user/dev', error=None,
+               account='123456789012', region='us-east-1'):
+    r = {
+        'eventTime': event_time, 'eventName': name, 'eventSource': source,
+        'userIdentity': {'type': 'IAMUser', 'arn': user},
+        'recipientAccountId': account, 'awsRegion': region,
+        'requestParameters': {'event': name}}
+    if error:
+        r['errorCode'] = error
+    return r
+
+
+RECORDS = [
+    get_record('2018-03-01T10:00:00Z', 'RunInstances'),
+    get_record('2018-03-01T09:00:00Z'),
+    get_record('2018-03-01T11:00:00Z', 'DeleteBucket', 's3.amazonaws.com',
+               error='AccessDenied'),
+    get_record('2018-03-02T08:00:00Z', user='arn:aws:iam::123456789012:user/ops'),
+    get_record('2018-03-02T09:00:00Z', region='us-west-2'),
+    get_record('2018-04-01T09:00:00Z', account='210987654321'),
+    {'eventTime': '2018-03-01T12:00:00Z', 'eventName': 'ConsoleLogin',
+     'eventSource': 'signin.amazonaws.com', 'userIdentity': {'type': 'Root'},
+     'recipientAccountId': '123456789012', 'awsRegion': 'us-east-1'},
+]
+
+
+def epoch(d):
+    return store.to_epoch(datetime.strptime(d, '%Y-%m-%d %H:%M'))
+
+
+class StoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+
+    def write(self, records=RECORDS, segment_rows=2):
+        writer = store.StoreWriter(
+            self.root, ('requestParameters',), segment_rows=segment_rows)
+        writer.add_records(records)
+        writer.flush()
+        return writer
+
+    def test_round_trip(self):
+        writer = self.write()
+        self.assertEqual(writer.row_count, len(RECORDS))
+        trails = store.TrailStore(self.root)
+        # rows are sorted by time within a segment, not across them
+        records = sorted(trails.query(
+            columns=('event_date', 'event_name', 'user_id', 'error_code',
+                     'requestParameters'),
+            accounts=['123456789012'], regions=['us-east-1']),
+            key=lambda r: r['event_date'])
+        self.assertEqual(
+            [r['event_name'] for r in records],
+            ['DescribeInstances', 'RunInstances', 'DeleteBucket',
+             'ConsoleLogin', 'DescribeInstances'])
+        self.assertEqual(records[0], {
+            'event_date': epoch('2018-03-01 09:00'),
+            'event_name': 'DescribeInstances',
+            'user_id': 'arn:aws:iam::123456789012:user/dev',
+            'error_code': None,
+            'requestParameters': json.dumps({'event': 'DescribeInstances'}),
+            'account': '123456789012', 'region': 'us-east-1'})
+        self.assertEqual(records[3]['user_id'], 'root')
+        self.assertEqual(records[3]['requestParameters'], 'null')
+
+        self.assertEqual(
+            trails.count('event_source'),
+            {'ec2.amazonaws.com': 5, 's3.amazonaws.com': 1,
+             'signin.amazonaws.com': 1})
+        self.assertEqual(
+            trails.count('client_ip', event_name='DescribeInstances'), {'': 4})
+
+    def test_predicates(self):
+        self.write()
+        trails = store.TrailStore(self.root)
+
+        def names(**predicates):
+            return sorted(r['event_name'] for r in trails.query(
+                columns=('event_name',), **predicates))
+
+        self.assertEqual(names(event_name='DeleteBucket'), ['DeleteBucket'])
+        self.assertEqual(
+            names(event_name=['DeleteBucket', 'ConsoleLogin']),
+            ['ConsoleLogin', 'DeleteBucket'])
+        self.assertEqual(names(event_name='StopInstances'), [])
+        self.assertEqual(names(error_code='AccessDenied'), ['DeleteBucket'])
+        self.assertEqual(
+            names(user_id=lambda v: v.endswith('/ops')), ['DescribeInstances'])
+        # non dictionary columns, and predicates combined
+        self.assertEqual(
+            names(event_source='ec2.amazonaws.com',
+                  requestParameters=json.dumps({'event': 'RunInstances'})),
+            ['RunInstances'])
+
+    def test_partition_pruning(self):
+        self.write()
+        trails = store.TrailStore(self.root)
+        segments = list(trails.segments(
+            start=epoch('2018-03-01 10:30'), end=epoch('2018-03-02 08:30')))
+        # only the two us-east-1 days are read, segments entirely
+        # outside the range are skipped on their time bounds.
+        self.assertEqual(
+            sorted(set(os.path.dirname(s.path)[len(self.root) + 1:]
+                       for a, r, s in segments)),
+            ['123456789012/us-east-1/2018/03/01',
+             '123456789012/us-east-1/2018/03/02'])
+        self.assertEqual(len(segments), 2)
+        self.assertEqual(
+            sorted(r['event_date'] for r in trails.query(
+                start=epoch('2018-03-01 10:30'), end=epoch('2018-03-02 08:30'),
+                columns=('event_date',))),
+            [epoch('2018-03-01 11:00'), epoch('2018-03-01 12:00'),
+             epoch('2018-03-02 08:00')])
+
+        with mock.patch.object(store, 'Segment') as segment:
+            list(trails.segments(accounts=['999999999999']))
+            list(trails.segments(regions=['eu-west-1']))
+            list(trails.segments(start=epoch('2019-01-01 00:00')))
+            self.assertFalse(segment.called)
+
+    def test_iter_days(self):
+        rpath = os.path.join(self.root, 'r')
+        for day in ('2017/12/31', '2018/01/01', '2018/01/15', '2018/02/01'):
+            os.makedirs(os.path.join(rpath, day))
+        os.makedirs(os.path.join(rpath, '2018/01/.tmp-x'))
+
+        def days(start=None, end=None):
+            return [p[len(rpath) + 1:]
+                    for p in store.iter_days(rpath, start, end)]
+
+        self.assertEqual(
+            days(), ['2017/12/31', '2018/01/01', '2018/01/15', '2018/02/01'])
+        self.assertEqual(days('2018/01/01', '2018/01/31'),
+                         ['2018/01/01', '2018/01/15'])
+        self.assertEqual(days('2018/01/02'), ['2018/01/15', '2018/02/01'])
+        self.assertEqual(days(end='2017/12/31'), ['2017/12/31'])
+
+    def test_ingest_skips_ingested_keys(self):
+        keys = ['AWSLogs/123456789012/CloudTrail/us-east-1/2018/03/0%d/'
+                'trail-%d.json.gz' % (i, i) for i in (1, 2)]
+        objects = {}
+        for k, r in zip(keys, (RECORDS[:3], RECORDS[3:4])):
+            buf = io.BytesIO()
+            with gzip.GzipFile(fileobj=buf, mode='wb') as fh:
+                fh.write(json.dumps({'Records': r}).encode('utf8'))
+            objects[k] = buf.getvalue()
+
+        client = mock.MagicMock()
+        client.get_object.side_effect = lambda Bucket, Key: {
+            'Body': io.BytesIO(objects[Key])}
+        client.get_paginator.return_value.paginate.side_effect = (
+            lambda Bucket, Prefix: [{'Contents': [
+                {'Key': k} for k in sorted(objects) if k.startswith(Prefix)]}])
+        pool = mock.MagicMock()
+        pool.return_value.imap_unordered.side_effect = map
+
+        self.patch_session(client)
+        with mock.patch.object(store, 'Pool', pool):
+            self.assertEqual(store.ingest(
+                'trails', keys[0], self.root, (), batch_size=1), 3)
+            self.assertEqual(store.get_ingested(self.root, 'trails'),
+                             set(keys[:1]))
+            self.assertEqual(store.ingest(
+                'trails', 'AWSLogs/', self.root, (), batch_size=1), 1)
+            self.assertEqual(store.ingest(
+                'trails', 'AWSLogs/', self.root, (), batch_size=1), 0)
+        self.assertEqual(store.get_ingested(self.root, 'other'), set())
+        self.assertEqual(
+            sum(store.TrailStore(self.root).count('event_name').values()), 4)
+
+    def patch_session(self, client):
+        factory = mock.MagicMock()
+        factory.return_value.return_value.client.return_value = client
+        patcher = mock.patch.object(store, 'SessionFactory', factory)
+        patcher.start()
+        self.addCleanup(patcher.stop)
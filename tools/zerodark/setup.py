@@ -49,6 +49,7 @@ setup(
         "click",
         "tabulate",
         "influxdb",
-        "ipaddress"
+        "ipaddress",
+        "numpy"
     ],
 )
@@ -0,0 +1,86 @@
+# Copyright 2018 Capital One Services, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    from zerodark import flowbatch
+except ImportError:
+    flowbatch = None
+
+RECORD = "2018-03-02T00:00:00Z 2 123456789012 eni-1 %s %s 443 3306 6 10 %d %d %d %s %s"
+
+
+@unittest.skipIf(flowbatch is None, "requires numpy")
+class FlowBatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+    def write_log(self, lines):
+        path = os.path.join(self.tmp_dir, 'flows.log.gz')
+        with gzip.open(path, 'wb') as fh:
+            fh.write(("\n".join(lines) + "\n").encode('utf8'))
+        return path
+
+    def test_parse_records(self):
+        path = self.write_log([
+            RECORD % ('10.0.0.1', '10.0.0.2', 100, 1520000000, 1520000060, 'ACCEPT', 'OK'),
+            RECORD % ('10.0.0.2', '10.0.0.1', 50, 1520000000000, 1520000060, 'REJECT', 'OK'),
+            RECORD % ('2001:db8::1', '10.0.0.1', 5, 1520000000, 1520000060, 'ACCEPT', 'OK'),
+            RECORD % ('-', '-', 0, 1520000000, 1520000060, '-', 'NODATA')])
+        batches = list(flowbatch.flow_batches([path]))
+        self.assertEqual(len(batches), 1)
+        batch = batches[0]
+        self.assertEqual(list(batch.srcaddr), [
+            flowbatch.ip_to_int('10.0.0.1'), flowbatch.ip_to_int('10.0.0.2')])
+        self.assertEqual(list(batch.bytes), [100, 50])
+        self.assertEqual(list(batch.start), [1520000000, 1520000000])
+        self.assertEqual(list(batch.action), [flowbatch.ACCEPT, flowbatch.REJECT])
+
+    def test_no_data_records(self):
+        path = self.write_log([
+            RECORD % ('-', '-', 0, 1520000000, 1520000060, '-', 'NODATA'),
+            RECORD % ('-', '-', 0, 1520000000, 1520000060, '-', 'SKIPDATA')])
+        self.assertEqual(list(flowbatch.flow_batches([path])), [])
+
+    def test_ipv6_records(self):
+        path = self.write_log([
+            RECORD % ('2001:db8::1', '2001:db8::2', 5, 1520000000, 1520000060,
+                      'ACCEPT', 'OK')])
+        self.assertEqual(list(flowbatch.flow_batches([path])), [])
+
+    def test_directional_bytes(self):
+        path = self.write_log([
+            RECORD % ('52.1.1.1', '10.0.0.1', 100, 1520000000, 1520000060, 'ACCEPT', 'OK'),
+            RECORD % ('52.1.1.1', '10.0.0.1', 20, 1520000010, 1520000060, 'ACCEPT', 'OK'),
+            RECORD % ('10.0.0.1', '52.1.1.2', 7, 1520000400, 1520000460, 'ACCEPT', 'OK')])
+        batch, = flowbatch.flow_batches([path])
+        local_ips = flowbatch.ips_to_array(['10.0.0.1'])
+        (in_keys, in_bytes), (out_keys, out_bytes) = flowbatch.directional_bytes(
+            batch, local_ips, 300)
+        self.assertEqual(
+            [flowbatch.period_ip_key(k) for k in in_keys],
+            [(1519999800, '52.1.1.1')])
+        self.assertEqual(list(in_bytes), [120])
+        self.assertEqual(
+            [flowbatch.period_ip_key(k) for k in out_keys],
+            [(1520000400, '52.1.1.2')])
+        self.assertEqual(list(out_bytes), [7])
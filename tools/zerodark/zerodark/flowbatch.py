@@ -0,0 +1,208 @@
+# Copyright 2018 Capital One Services, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Flow log records as typed arrays.
+
+Flow log files are parsed a decompressed block at a time into a
+FlowBatch, a numpy array per field with addresses as integers and
+actions as codes, so filtering and rollups are array operations
+rather than python per record.
+"""
+import gzip
+import logging
+import socket
+import struct
+import time
+
+import numpy as np
+
+log = logging.getLogger('traffic')
+
+EPOCH_32_MAX = 2147483647
+
+ACCEPT = 0
+REJECT = 1
+
+# Fields of a flow log record, exported records are prefixed with a date.
+RECORD_WIDTH = 14
+
+
+def ip_to_int(ip):
+    return struct.unpack('!I', socket.inet_aton(ip))[0]
+
+
+def int_to_ip(i):
+    return socket.inet_ntoa(struct.pack('!I', int(i)))
+
+
+def ips_to_array(ips):
+    return np.array([ip_to_int(ip) for ip in ips], dtype=np.uint32)
+
+
+def parse_ips(column):
+    """Convert an array of dotted quad addresses to integers."""
+    octets = b'.'.join(column).split(b'.')
+    octets = np.array(octets).astype(np.uint32).reshape(-1, 4)
+    return ((octets[:, 0] << 24) | (octets[:, 1] << 16) |
+            (octets[:, 2] << 8) | octets[:, 3])
+
+
+def parse_ints(column):
+    return np.where(column == b'-', b'0', column).astype(np.int64)
+
+
+def parse_epoch(column):
+    values = parse_ints(column)
+    # some records have millisecond timestamps
+    return np.where(values > EPOCH_32_MAX, values // 1000, values)
+
+
+class FlowBatch(object):
+    """A batch of flow records, a column array per field."""
+
+    fields = (
+        'srcaddr', 'dstaddr', 'srcport', 'dstport', 'protocol',
+        'packets', 'bytes', 'start', 'end', 'action')
+
+    def __init__(self, **columns):
+        for f in self.fields:
+            setattr(self, f, columns[f])
+
+    def __len__(self):
+        return len(self.bytes)
+
+    def select(self, mask):
+        return FlowBatch(**{f: getattr(self, f)[mask] for f in self.fields})
+
+    @classmethod
+    def from_block(cls, block):
+        """Parse a block of complete flow log lines.
+
+        Records without data (NODATA, SKIPDATA) and ipv6 flows are
+        dropped, returns None if no records remain.
+        """
+        tokens = block.split()
+        if not tokens:
+            return None
+        width = len(block.lstrip().split(b'\n', 1)[0].split())
+        if width not in (RECORD_WIDTH, RECORD_WIDTH + 1) or len(tokens) % width:
+            raise ValueError("invalid flow log record width")
+        rows = np.array(tokens).reshape(-1, width)[:, width - RECORD_WIDTH:]
+        rows = rows[rows[:, 13] == b'OK']
+        if not len(rows):
+            return None
+
+        src, dst = rows[:, 3], rows[:, 4]
+        if len(b'.'.join(src).split(b'.')) != 4 * len(src) or (
+                len(b'.'.join(dst).split(b'.')) != 4 * len(dst)):
+            ipv4 = (np.char.count(src, b'.') == 3) & (
+                np.char.count(dst, b'.') == 3)
+            log.debug("skipping %d ipv6 flows", len(rows) - ipv4.sum())
+            rows = rows[ipv4]
+            if not len(rows):
+                return None
+            src, dst = rows[:, 3], rows[:, 4]
+
+        return cls(
+            srcaddr=parse_ips(src),
+            dstaddr=parse_ips(dst),
+            srcport=parse_ints(rows[:, 5]),
+            dstport=parse_ints(rows[:, 6]),
+            protocol=parse_ints(rows[:, 7]),
+            packets=parse_ints(rows[:, 8]),
+            bytes=parse_ints(rows[:, 9]),
+            start=parse_epoch(rows[:, 10]),
+            end=parse_epoch(rows[:, 11]),
+            action=np.where(
+                rows[:, 12] == b'REJECT', REJECT, ACCEPT).astype(np.int8))
+
+
+def read_blocks(path, block_size=1024 * 1024 * 8):
+    """Read a gzipped log file in blocks of complete lines."""
+    remainder = b''
+    with gzip.open(path, 'rb') as fh:
+        while True:
+            data = fh.read(block_size)
+            if not data:
+                break
+            data = remainder + data
+            idx = data.rfind(b'\n')
+            if idx == -1:
+                remainder = data
+                continue
+            remainder = data[idx + 1:]
+            yield data[:idx + 1]
+    if remainder.strip():
+        yield remainder
+
+
+def flow_batches(files, start=None, end=None, block_size=1024 * 1024 * 8):
+    """Flow batches of records from log files within a time range."""
+    u_start = start and time.mktime(start.timetuple())
+    u_end = end and time.mktime(end.timetuple())
+    for f in files:
+        for block in read_blocks(f, block_size):
+            batch = FlowBatch.from_block(block)
+            if batch is None:
+                continue
+            # we might lose a few records if we just record.end < u_end
+            if start or end:
+                mask = np.ones(len(batch), dtype=bool)
+                if start:
+                    mask &= batch.start >= u_start
+                if end:
+                    mask &= batch.end <= u_end
+                batch = batch.select(mask)
+            if len(batch):
+                yield batch
+
+
+def sum_by(keys, values):
+    """Sum values grouped by key, returns the keys and their sums."""
+    if not len(keys):
+        return keys, values
+    order = np.argsort(keys, kind='mergesort')
+    keys, values = keys[order], values[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    return keys[starts], np.add.reduceat(values, starts)
+
+
+def directional_bytes(batch, local_ips, period=None):
+    """Bytes by foreign address for inbound and outbound flows.
+
+    local_ips is an array of the integer addresses on the local side
+    of flows. With a period (seconds), keys are the period start in
+    the high 32 bits and the foreign address in the low 32 bits.
+
+    Returns ((inbound keys, bytes), (outbound keys, bytes)).
+    """
+    inbound = np.isin(batch.dstaddr, local_ips)
+    outbound = ~inbound & np.isin(batch.srcaddr, local_ips)
+    if not (inbound | outbound).all():
+        raise ValueError("flow records without a local address")
+
+    results = []
+    for mask, foreign in ((inbound, batch.srcaddr), (outbound, batch.dstaddr)):
+        keys = foreign[mask].astype(np.uint64)
+        if period:
+            pstart = batch.start[mask]
+            pstart = (pstart - pstart % period).astype(np.uint64)
+            keys = (pstart << np.uint64(32)) | keys
+        results.append(sum_by(keys, batch.bytes[mask]))
+    return results
+
+
+def period_ip_key(key):
+    """Split a period keyed address into the period and address."""
+    key = int(key)
+    return key >> 32, int_to_ip(key & 0xffffffff)
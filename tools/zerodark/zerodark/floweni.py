@@ -16,15 +16,16 @@ import click
 from collections import Counter
 import boto3
 import logging
-import gzip
-import time
 import os
 import sqlite3
 
 from datetime import timedelta, datetime
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from flowrecord import FlowRecord, REJECT
+from flowbatch import (
+    REJECT, directional_bytes, flow_batches, int_to_ip, ips_to_array,
+    period_ip_key, sum_by)
 from influxdb import InfluxDBClient
+import numpy as np
 
 from metrics import Resource
 from resolver import IPResolver
@@ -32,8 +33,6 @@ from utils import human_size, row_factory, get_dates
 
 from c7n.executor import MainThreadExecutor
 
-EPOCH_32_MAX = 2147483647
-
 MainThreadExecutor.c7n_async = False
 
 log = logging.getLogger('traffic')
@@ -80,68 +79,49 @@ def eni_download_flows(client, bucket, prefix, start, end, eni, store_dir):
         eni, skip, count, truncated, human_size(log_size)))
 
 
-def eni_flow_stream(files, start, end, buffer_size=25000):
-    buf = []
+def eni_flow_stream(files, start, end, block_size=1024 * 1024 * 8):
+    """Stream of flow batches, parsed a decompressed block at a time."""
     record_count = 0
-    if start:
-        u_start = time.mktime(start.timetuple())
-    if end:
-        u_end = time.mktime(end.timetuple())
-    for f in files:
-        with gzip.open(f) as fh:
-            while True:
-                line = fh.readline()
-                if not line:
-                    break
-                fields = line.split()
-                fields.pop(0)
-                rstart = int(fields[10])
-                if rstart > EPOCH_32_MAX:
-                    rstart /= 1000
-                rend = int(fields[11])
-                if rend > EPOCH_32_MAX:
-                    rend /= 1000
-
-                # record windows typically either 60s or 5m
-                # print('record window %0.2f' % (record.end - record.start))
-                if start and rstart < u_start:
-                    continue
+    for batch in flow_batches(files, start, end, block_size):
+        record_count += len(batch)
+        yield batch
+    log.debug("flow records:%d", record_count)
 
-                # we might lose a few records if we just record.end < u_end
-                if end and rend > u_end:
-                    continue
 
-                buf.append(FlowRecord(fields=fields))
-                if len(buf) % buffer_size:
-                    record_count += len(buf)
-                    yield buf
-                    buf = []
+def flow_stream_totals(stats, batch):
+    stats['Flows'] += len(batch)
+    stats['Bytes'] += int(batch.bytes.sum())
+    stats['Rejects'] += int((batch.action == REJECT).sum())
 
-    if buf:
-        record_count += len(buf)
-        yield buf
+
+def reduce_parts(parts):
+    if not parts:
+        return np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.int64)
+    return sum_by(
+        np.concatenate([k for k, v in parts]),
+        np.concatenate([v for k, v in parts]))
 
 
 def flow_stream_stats(ips, flow_stream, period):
+    local_ips = ips_to_array(ips)
     period_counters = {}
     stats = Counter()
-    for flow_records in flow_stream:
-        for record in flow_records:
-            stats['Flows'] += 1
-            stats['Bytes'] += record.bytes
-            pk = record.start - record.start % period
+    in_parts, out_parts = [], []
+    for batch in flow_stream:
+        flow_stream_totals(stats, batch)
+        inbound, outbound = directional_bytes(batch, local_ips, period)
+        in_parts.append(inbound)
+        out_parts.append(outbound)
+
+    for direction, parts in (('inbytes', in_parts), ('outbytes', out_parts)):
+        for key, v in zip(*reduce_parts(parts)):
+            pk, ip = period_ip_key(key)
             pc = period_counters.get(pk)
             if pc is None:
                 period_counters[pk] = pc = {
                     'inbytes': Counter(), 'outbytes': Counter()}
-            if record.action == REJECT:
-                stats['Rejects'] += 1
-            if record.dstaddr in ips:
-                pc['inbytes'][record.srcaddr] += record.bytes
-            elif record.srcaddr in ips:
-                pc['outbytes'][record.dstaddr] += record.bytes
-            else:
-                raise ValueError("")
+            pc[direction][ip] = int(v)
+
     log.info(
         "flows:%d bytes:%s rejects:%s",
         stats['Flows'], human_size(stats['Bytes']), stats['Rejects'])
@@ -227,37 +207,17 @@ def eni_log_analyze(ips, flow_stream,
     stats = Counter()
     # reject = 'REJECT'
 
-    for flow_records in flow_stream:
-        for record in flow_records:
-            stats['Flows'] += 1
-            stats['Bytes'] += record.bytes
-
-            if record.action == reject:
-                stats['Rejects'] += 1
-            # if ports and (record.srcport not in ports and record.dstport not in ports):
-            #    continue
-            # if reject is not None:
-            #    if reject and record.action != 'REJECT':
-            #        continue
-            #    if reject is False and record.action != 'ACCEPT':
-            #        continue
-            # if target_ips:
-            #    if not (record.dstaddr in target_ips or
-            #                record.srcaddr in target_ips):
-            #        continue
-            # if record.dstaddr in ips and record.srcaddr in ips:
-            #    intra_bytes[record.srcaddr] += record.bytes
-            if record.dstaddr in ips:
-                # in_packets[record.srcaddr] += record.packets
-                in_bytes[record.srcaddr] += record.bytes
-                # if record.srcaddr not in ips:
-                #    in_ports[record.srcport] += record.bytes
-            elif record.srcaddr in ips:
-                # out_packets[record.dstaddr] += record.packets
-                out_bytes[record.dstaddr] += record.bytes
-                # out_ports[record.dstport] += record.bytes
-            else:
-                raise ValueError("")
+    local_ips = ips_to_array(ips)
+    in_parts, out_parts = [], []
+    for batch in flow_stream:
+        flow_stream_totals(stats, batch)
+        inbound, outbound = directional_bytes(batch, local_ips)
+        in_parts.append(inbound)
+        out_parts.append(outbound)
+
+    for counter, parts in ((in_bytes, in_parts), (out_bytes, out_parts)):
+        for ip, v in zip(*reduce_parts(parts)):
+            counter[int_to_ip(ip)] = int(v)
 
     log.info(
         "records:%d rejects:%d inbytes:%s outbytes:%s bytes:%s",
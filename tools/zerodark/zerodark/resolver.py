@@ -12,10 +12,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
 import json
 import ipaddress
 import six
 import sqlite3
+import threading
 
 from .utils import row_factory
 
@@ -30,6 +33,11 @@ class IPResolver(object):
     On failure to lookup eni info we consider some additional possibilities:
      - aws service ip
      - TODO: lookup in vpc/subnet tables.
+
+    The ipdb's enis are loaded once into memory, indexed by integer ip
+    address with each address's eni attachments sorted by start time,
+    and resolved ips are kept in an lru cache. AWS service cidrs are
+    merged into sorted ranges and matched by bisection.
     """
 
     # TODO: needs region and account id in queries
@@ -37,7 +45,8 @@ class IPResolver(object):
         'ec2': 'select * from ec2 where instance_id = ?',
         'elb': 'select * from elbs where name = ?'}
 
-    def __init__(self, ipdb_path, cmdb_path, aws_cidrs_path=None):
+    def __init__(self, ipdb_path, cmdb_path, aws_cidrs_path=None,
+                 cache_size=100000):
         self.ipdb = ipdb_path and sqlite3.connect(ipdb_path) or None
         if self.ipdb:
             self.ipdb.row_factory = row_factory
@@ -48,11 +57,19 @@ class IPResolver(object):
             self.cmdb.row_factory = row_factory
             self.cmdb_cursor = self.cmdb.cursor()
 
-        # TODO see if we can do some ip caching
         self.resource_cache = {}
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self.lock = threading.Lock()
+
+        # ip as int -> ([start], [eni info]) ordered by start
+        self.eni_index = None
 
         # Service -> list of service cidrs
         self.aws_cidrs = {}
+        # Sorted non-overlapping (start, end) int ranges of service cidrs
+        self.service_starts = []
+        self.service_ends = []
         if not aws_cidrs_path:
             return
 
@@ -64,53 +81,104 @@ class IPResolver(object):
                         r['service'].lower(), []).append(
                             ipaddress.IPv4Network(r['ip_prefix']))
 
+        ranges = sorted(
+            (int(cidr.network_address), int(cidr.broadcast_address))
+            for cidr_set in self.aws_cidrs.values() for cidr in cidr_set)
+        for start, end in ranges:
+            if self.service_ends and start <= self.service_ends[-1] + 1:
+                self.service_ends[-1] = max(self.service_ends[-1], end)
+                continue
+            self.service_starts.append(start)
+            self.service_ends.append(end)
+
+    def load_enis(self):
+        """Index the ipdb's enis by integer ip address."""
+        with self.lock:
+            if self.eni_index is not None:
+                return self.eni_index
+            index = {}
+            self.ipdb_cursor.execute('select * from enis order by start')
+            for eni_info in self.ipdb_cursor:
+                try:
+                    ip = ip_to_int(eni_info['ip_address'])
+                except ValueError:
+                    continue
+                starts, infos = index.setdefault(ip, ([], []))
+                starts.append(eni_info['start'] or '')
+                infos.append(eni_info)
+            self.eni_index = index
+            return index
+
+    def lookup_eni(self, ip, start, end):
+        """The latest eni attachment of an ip overlapping the time range.
+
+        start and end are formatted as the ipdb's dates.
+        """
+        entry = self.load_enis().get(ip)
+        if entry is None:
+            return None
+        starts, infos = entry
+        # attachments starting before the end of the range, latest first
+        for idx in range(bisect_left(starts, end) - 1, -1, -1):
+            if infos[idx]['end'] is None or infos[idx]['end'] > start:
+                return infos[idx]
+        return None
+
+    def is_service_ip(self, ip):
+        idx = bisect_right(self.service_starts, ip) - 1
+        return idx >= 0 and ip <= self.service_ends[idx]
+
     def resolve(self, ips, start, end):
         results = {}
         if not self.ipdb:
             return results
 
+        # TODO: see if we need to expand the time window
+        # the use of config for ip info creates some lag
+        # on capture, and also some potential gaps for
+        # short lived resources.
+        start = start.strftime('%Y-%m-%dT%H:%M')
+        end = end.strftime('%Y-%m-%dT%H:%M')
+
         for ip in ips:
-            # TODO: see if we need to expand the time window
-            # the use of config for ip info creates some lag
-            # on capture, and also some potential gaps for
-            # short lived resources.
-            self.ipdb_cursor.execute(
-                '''select * from enis
-                   where ip_address = ?
-                     and start < ?
-                     and (end > ? or end is null)''',
-                (ip, end.strftime('%Y-%m-%dT%H:%M'),
-                 start.strftime('%Y-%m-%dT%H:%M')))
-            info = list(self.ipdb_cursor)
-            # TODO: assert on number of records found
-            if info:
-                eni_info = info.pop()
-            # TODO: this a bit speculative wrt to ip usage
-            # specific to an enterprise network setup, where in
-            # non resolved ips are typically aws services via
-            # classic vpc endpoints using public ips. Might need
-            # to revisit. also potentially an option on ip string
-            # prefix match as a sanity base.
-            elif not info:
-                n = ipaddress.IPv4Address(six.text_type(ip))
-                found = False
-                for service, cidr_set in self.aws_cidrs.items():
-                    for cidr in cidr_set:
-                        if n in cidr:
-                            results[ip] = {'app': 'aws s3', 'env': 'aws s3'}
-                            found = True
-                            break
-                        if found:
-                            break
-                    if found:
-                        break
-                continue
-            results[ip] = self.resolve_resource(eni_info)
+            ckey = (ip, start, end)
+            with self.lock:
+                if ckey in self.cache:
+                    self.cache[ckey] = info = self.cache.pop(ckey)
+                    if info is not None:
+                        results[ip] = info
+                    continue
+            info = self.resolve_ip(ip, start, end)
+            with self.lock:
+                self.cache[ckey] = info
+                if len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+            if info is not None:
+                results[ip] = info
         return results
 
+    def resolve_ip(self, ip, start, end):
+        try:
+            n = ip_to_int(ip)
+        except ValueError:
+            return None
+        eni_info = self.lookup_eni(n, start, end)
+        if eni_info is not None:
+            return self.resolve_resource(eni_info)
+        # TODO: this a bit speculative wrt to ip usage
+        # specific to an enterprise network setup, where in
+        # non resolved ips are typically aws services via
+        # classic vpc endpoints using public ips. Might need
+        # to revisit. also potentially an option on ip string
+        # prefix match as a sanity base.
+        if self.is_service_ip(n):
+            return {'app': 'aws s3', 'env': 'aws s3'}
+        return None
+
     def resolve_resource(self, eni_info):
         # TODO region, account id in cache key
-        ri = self.resource_cache.get(eni_info['resource_type'])
+        rkey = (eni_info['resource_id'], eni_info['resource_type'])
+        ri = self.resource_cache.get(rkey)
         if ri is not None:
             return ri
         service_query = self.resource_query.get(eni_info['resource_id'])
@@ -120,6 +188,11 @@ class IPResolver(object):
         ri = self.cmdb_cursor.fetchone()
         if ri is not None:
             ri['type'] = eni_info['resource_id']
+            self.resource_cache[rkey] = ri
             return ri
         else:
             return eni_info
+
+
+def ip_to_int(ip):
+    return int(ipaddress.IPv4Address(six.text_type(ip)))